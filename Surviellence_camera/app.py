@@ -1,52 +1,92 @@
-from flask import Flask, render_template, request, redirect, url_for, session, jsonify
-import json
+from flask import Flask, Response, render_template, request, redirect, url_for, session, jsonify, send_from_directory
 import os
 import threading
-import paho.mqtt.client as mqtt
-import pygame
+import time
+from datetime import datetime
 from flask_socketio import SocketIO, emit
 # from detection.accident import run_accident_detection
-from detection.crowd_control import detect_crowd
+# Pipeline, streaming and detector modules (cv2, numpy, models) are imported on first use, not here
+from detection import metrics
+from detection.events import NODE_ID, SocketIOSink, decode_batch, get_event_bus
+from detection.alerts import ALERT_DEFAULTS, CLEARED, get_alert_engine
+from detection.mqtt_client import get_mqtt_client
+from detection.warmup import WARMUP, readiness
+from settings import ConfigError, config_service
 # from detection.security_monitoring import run_security_monitoring
 # from detection.weapon_detection import run_weapon_detection
-import cv2
 import glob
 
+STARTED_AT = time.time()
+
 app = Flask(__name__)
 app.secret_key = "your_secret_key"
 socketio = SocketIO(app)
 
-# Load settings
-CONFIG_PATH = "config/config.json"
-
-def load_config():
-    with open(CONFIG_PATH, "r") as config_file:
-        return json.load(config_file)
+# Settings: one validated in-memory copy of config/config.json (see settings.ConfigService).
+# Read-only use goes through config_service.get(), edits through update() (read-modify-write under its lock).
 
-def save_config(config):
-    with open(CONFIG_PATH, "w") as config_file:
-        json.dump(config, config_file, indent=4)
+# Detector events reach the dashboard through the shared event bus
+get_event_bus().add_sink(SocketIOSink(socketio))
 
-# MQTT Setup
-MQTT_BROKER = "test.mosquitto.org"
-MQTT_TOPIC = "crowd/alert"
+# Optional periodic metrics snapshot to disk
+metrics_config = config_service.get().get("metrics", {})
+metrics.REGISTRY.start_snapshots(metrics_config.get("snapshot_path"), metrics_config.get("snapshot_interval", 60))
 
-pygame.mixer.init()
-pygame.mixer.music.load("static/audio/alarm.mp3")
+# Alarm sound, pygame is initialised on the first alarm rather than at startup
+alarm_lock = threading.Lock()
+alarm_loaded = False
 
-def on_message(client, userdata, msg):
-    """Play sound and send alert via WebSocket when MQTT alert received"""
-    alert_message = msg.payload.decode()
-    print(f"📩 Received Alert: {alert_message}")
+def play_alarm():
+    global alarm_loaded
+    import pygame
+    with alarm_lock:
+        if not alarm_loaded:
+            pygame.mixer.init()
+            pygame.mixer.music.load(config_service.get().get("ALARM_SOUND", "static/audio/alarm.mp3"))
+            alarm_loaded = True
     pygame.mixer.music.play()
-    socketio.emit("mqtt_alert", {"message": alert_message})
 
-mqtt_client = mqtt.Client()
-mqtt_client.on_message = on_message
-mqtt_client.connect(MQTT_BROKER, 1883, 60)
-mqtt_client.subscribe(MQTT_TOPIC)
-mqtt_thread = threading.Thread(target=mqtt_client.loop_forever, daemon=True)
-mqtt_thread.start()
+def on_message(topic, alert_message):
+    """Play sound and send alerts via WebSocket when an MQTT batch with alerts from another node is received"""
+    # Our own alerts already reached the dashboard (SocketIOSink) and the speaker (AudioSink)
+    alerts = [message for message in decode_batch(alert_message)
+              if message.get("kind") == "alert" and message.get("origin") != NODE_ID]
+    for alert in alerts:
+        print(f"📩 Received Alert: {alert['message']}")
+        socketio.emit("mqtt_alert", alert)
+    if any(alert.get("state") != CLEARED for alert in alerts):
+        play_alarm()
+
+def configured_cameras(config):
+    """Camera list from config, or the single camera from the settings page"""
+    cameras = config.get("cameras") or []
+    if not cameras and config.get("CAMERA_IP"):
+        cameras = [{"id": "default", "source": config["CAMERA_IP"], "detectors": ["crowd"],
+                    "crowd": {"model_path": config.get("MODEL_PATH", "yolov8n.pt")}}]
+    return cameras
+
+def on_config_change(config, old_config):
+    """Push saved or hand-edited settings into the running pipelines and alert engine"""
+    if pipeline_manager is not None:
+        pipeline_manager.reconfigure(configured_cameras(config), config.get("detectors", {}), config.get("ingest", {}))
+    alerts = {**ALERT_DEFAULTS, **config.get("alerts", {})}
+    get_alert_engine().configure(alerts["cooldowns"], alerts["default_cooldown"], alerts["hysteresis"],
+                                 alerts["clear_after"])
+
+def start_background_services():
+    """MQTT subscription, config file watching and model warm-up, kept off the startup path"""
+    config = config_service.get()
+    config_service.subscribe(on_config_change)
+    config_service.watch()
+    # Shared MQTT client (MQTT_BROKER / MQTT_TOPIC); connects in the background
+    get_mqtt_client().subscribe(on_message)
+    startup = config.get("startup", {})
+    if startup.get("warmup", True):
+        names = startup.get("warmup_detectors") or sorted(
+            {name for camera in configured_cameras(config) for name in camera.get("detectors", ["crowd"])})
+        WARMUP.start(names, config.get("detectors", {}))
+
+threading.Thread(target=start_background_services, name="startup", daemon=True).start()
 
 def get_first_video():
     """Find the first available video in static/videos/"""
@@ -65,7 +105,7 @@ def dashboard():
     if "user" not in session:
         return redirect(url_for("login"))
 
-    config = load_config()
+    config = config_service.get()
 
     # OR condition: Live camera (IP) or Stored Video
     video_source = config["ip_address"] if config["detection_mode"] == "live" else get_first_video()
@@ -75,7 +115,9 @@ def dashboard():
         error_message = "⚠ No valid video source found. Please check your settings."
         video_source = ""  # Prevent errors in HTML
 
-    return render_template("dashboard.html", video_source=video_source, mode=config["detection_mode"], error_message=error_message)
+    cameras = [camera["id"] for camera in get_pipeline_manager().cameras.values()]
+    return render_template("dashboard.html", video_source=video_source, mode=config["detection_mode"],
+                           error_message=error_message, cameras=cameras)
 
 
 @app.route("/settings", methods=["GET", "POST"])
@@ -83,48 +125,50 @@ def settings():
     if "user" not in session:
         return redirect(url_for("login"))
 
-    config = load_config()
+    config = config_service.get()
     if request.method == "POST":
-        config["ip_address"] = request.form["ip_address"]
-        config["detection_mode"] = request.form["detection_mode"]
-        save_config(config)
+        def apply(config):
+            config["ip_address"] = request.form["ip_address"]
+            config["detection_mode"] = request.form["detection_mode"]
+
+        try:
+            config_service.update(apply)
+        except ConfigError as e:
+            return render_template("settings.html", config=config_service.get(), error_message=str(e)), 400
         return redirect(url_for("dashboard"))
 
     return render_template("settings.html", config=config)
 
 @app.route("/save_settings", methods=["POST"])
 def save_settings():
-    config = load_config()
-
     # Get values from the form
     detection_mode = request.form.get("detection_mode", "live")  # Default to live
-    camera_ip = request.form.get("camera_ip", config.get("CAMERA_IP", ""))
+    camera_ip = request.form.get("camera_ip")
     camera_quality = request.form.get("camera_quality")
     storage_limit = request.form.get("storage_limit")
     theme = request.form.get("theme")
 
-    # Update config with new settings
-    config["detection_mode"] = detection_mode
-    config["camera_quality"] = camera_quality
-    config["storage_limit"] = storage_limit
-    config["theme"] = theme
+    def apply(config):
+        # Update config with new settings (applied to the latest version, under the config lock)
+        config["detection_mode"] = detection_mode
+        config["camera_quality"] = camera_quality
+        config["storage_limit"] = storage_limit
+        config["theme"] = theme
 
-    if detection_mode == "live":
-        config["CAMERA_IP"] = camera_ip
-    else:
-        config["CAMERA_IP"] = ""  # Clear the IP if recorded mode is selected
+        if detection_mode == "live":
+            config["CAMERA_IP"] = config.get("CAMERA_IP", "") if camera_ip is None else camera_ip
+        else:
+            config["CAMERA_IP"] = ""  # Clear the IP if recorded mode is selected
 
-    save_config(config)
+    try:
+        config_service.update(apply)  # Running pipelines pick the change up via on_config_change
+    except ConfigError as e:
+        return jsonify({"error": str(e)}), 400
     return redirect(url_for("settings"))
 
 @app.route("/get_settings", methods=["GET"])
 def get_settings():
-    try:
-        with open(CONFIG_PATH, "r") as config_file:
-            config_data = json.load(config_file)
-            return jsonify(config_data)
-    except Exception as e:
-        return jsonify({"error": str(e)}), 500
+    return jsonify({**config_service.get(), "version": config_service.version})
 
 
 @app.route("/get_alert", methods=["GET"])
@@ -140,9 +184,105 @@ def get_alert():
 def logs():
     if "user" not in session:
         return redirect(url_for("login"))
-    with open("logs/detection_logs.txt", "r") as f:
-        logs = f.readlines()
-    return render_template("logs.html", logs=logs)
+    from detection.event_store import get_event_store
+    store = get_event_store()
+    try:
+        filters = event_filters(request.args)
+    except ValueError as e:
+        return jsonify({"error": f"Invalid filter: {e}"}), 400
+    events, next_cursor = store.query(**filters)
+    for event in events:
+        event["time"] = datetime.fromtimestamp(event["ts"]).strftime("%Y-%m-%d %H:%M:%S")
+    return render_template("logs.html", logs=events, next_cursor=next_cursor, filters=request.args,
+                           cameras=store.distinct("camera"), types=store.distinct("type"))
+
+def parse_time(value):
+    """Epoch seconds or an ISO date / datetime-local value, None when empty"""
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(value).timestamp()
+
+def event_filters(args):
+    """Event store query arguments from ?camera=&type=&state=&start=&end=&cursor=&limit="""
+    return {
+        "camera": args.get("camera") or None,
+        "type": args.get("type") or None,
+        "state": args.get("state") or None,
+        "start": parse_time(args.get("start")),
+        "end": parse_time(args.get("end")),
+        "cursor": int(args["cursor"]) if args.get("cursor") else None,
+        "limit": int(args.get("limit", 50)),
+    }
+
+@app.route("/api/events")
+def api_events():
+    """Filtered, cursor-paginated detection events as JSON"""
+    if "user" not in session:
+        return jsonify({"error": "Login required"}), 401
+    from detection.event_store import get_event_store
+    try:
+        filters = event_filters(request.args)
+    except ValueError as e:
+        return jsonify({"error": f"Invalid filter: {e}"}), 400
+    events, next_cursor = get_event_store().query(**filters)
+    return jsonify({"events": events, "next_cursor": next_cursor})
+
+@app.route("/clips/<path:name>")
+def clip(name):
+    """Alert clip linked from an event (see detection.recorder)"""
+    if "user" not in session:
+        return redirect(url_for("login"))
+    directory = config_service.get().get("recording", {}).get("directory", "data/clips")
+    return send_from_directory(os.path.abspath(directory), name)
+
+@app.route("/recording/status")
+def recording_status():
+    """Pre-roll buffers per camera and clip storage usage"""
+    from detection.recorder import recording_stats
+    return jsonify(recording_stats())
+
+@app.route("/batch/jobs", methods=["GET", "POST"])
+def batch_jobs():
+    """Offline analysis of recorded videos: list jobs, or start one (see detection.batch)"""
+    if "user" not in session:
+        return jsonify({"error": "Login required"}), 401
+    from detection.batch import list_jobs, submit_job
+    if request.method == "GET":
+        return jsonify({"jobs": list_jobs()})
+    data = request.get_json(silent=True) or {}
+    overrides = {key: data[key] for key in ("workers", "chunk_seconds", "sample_fps", "warmup", "merge_gap",
+                                            "start_time") if key in data}
+    try:
+        job = submit_job(data.get("path", ""), data.get("detectors", ["weapon", "security"]), data.get("options"),
+                         **overrides)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify(job.status()), 202
+
+@app.route("/batch/jobs/<job_id>")
+def batch_job(job_id):
+    """Progress of a batch job, with its event timeline"""
+    if "user" not in session:
+        return jsonify({"error": "Login required"}), 401
+    from detection.batch import get_job
+    job = get_job(job_id)
+    if job is None:
+        return jsonify({"error": f"Unknown job {job_id}"}), 404
+    return jsonify(job.status(timeline=True))
+
+@app.route("/batch/jobs/<job_id>/cancel", methods=["POST"])
+def batch_cancel(job_id):
+    if "user" not in session:
+        return jsonify({"error": "Login required"}), 401
+    from detection.batch import get_job
+    job = get_job(job_id)
+    if job is None:
+        return jsonify({"error": f"Unknown job {job_id}"}), 404
+    job.cancel()
+    return jsonify(job.status())
 
 @app.route("/login", methods=["GET", "POST"])
 def login():
@@ -160,27 +300,140 @@ def logout():
     session.pop("user", None)
     return redirect(url_for("login"))
 
+# Camera pipelines
+pipeline_manager = None
+pipeline_lock = threading.Lock()
+
+def get_pipeline_manager():
+    """Build the pipeline manager from the configured camera list on first use"""
+    global pipeline_manager
+    with pipeline_lock:
+        if pipeline_manager is None:
+            from detection.pipeline import PipelineManager
+            from detection.inference import configure_inference
+            from detection.streaming import configure_streaming
+            config = config_service.get()
+            cameras = configured_cameras(config)
+            configure_inference(**config.get("inference", {}))
+            configure_streaming(**config.get("streaming", {}))
+            options = config.get("pipeline", {})
+            pipeline_manager = PipelineManager(
+                cameras,
+                workers=options.get("workers", 0),
+                max_cameras=options.get("max_cameras", 48),
+                stall_timeout=options.get("stall_timeout", 10),
+                max_backoff=options.get("max_backoff", 60),
+                detector_options=config.get("detectors", {}),
+                mode=options.get("mode", "threads"),
+                processes=options.get("processes", 0),
+                ring_slots=options.get("ring_slots", 4),
+                ingest=config.get("ingest", {}),
+            )
+        return pipeline_manager
+
+@app.route("/stream/<camera_id>")
+def stream(camera_id):
+    """MJPEG stream of a camera's annotated frames"""
+    from detection.streaming import get_broadcaster, known_cameras
+    if "user" not in session:
+        return jsonify({"error": "Login required"}), 401
+    if camera_id not in get_pipeline_manager().cameras and camera_id not in known_cameras():
+        return jsonify({"error": f"Unknown camera {camera_id}"}), 404
+    return Response(get_broadcaster(camera_id).mjpeg(), mimetype="multipart/x-mixed-replace; boundary=frame")
+
+# Binary WebSocket streaming: sid -> stop event of that client's pusher
+ws_viewers = {}
+
+@socketio.on("watch")
+def on_watch(data):
+    """Start pushing a camera's annotated JPEG frames to this client"""
+    from detection.streaming import known_cameras, ws_stream
+    on_unwatch()
+    if "user" not in session:
+        emit("stream_error", {"error": "Login required"})
+        return
+    camera_id = (data or {}).get("camera")
+    if camera_id not in get_pipeline_manager().cameras and camera_id not in known_cameras():
+        emit("stream_error", {"error": f"Unknown camera {camera_id}"})
+        return
+    stop_event = threading.Event()
+    ws_viewers[request.sid] = stop_event
+    socketio.start_background_task(ws_stream, socketio, request.sid, camera_id, stop_event)
+
+@socketio.on("unwatch")
+def on_unwatch():
+    stop_event = ws_viewers.pop(request.sid, None)
+    if stop_event is not None:
+        stop_event.set()
+
+@socketio.on("disconnect")
+def on_disconnect():
+    on_unwatch()
+
+@app.route("/health")
+def health():
+    """Liveness: answers as soon as Flask is up, with warm-up progress and loaded models"""
+    return jsonify({"status": "ok", "uptime_s": round(time.time() - STARTED_AT, 3), **readiness()})
+
+@app.route("/ready")
+def ready():
+    """Readiness: 503 until every warmed-up detector has its model loaded"""
+    status = readiness()
+    return jsonify(status), 200 if status["ready"] else 503
+
+@app.route("/alerts/status")
+def alerts_status():
+    """Alerts fired / suppressed and which camera alerts are currently active"""
+    return jsonify(get_alert_engine().stats())
+
+@app.route("/events/status")
+def events_status():
+    """Event bus queues and sink connections"""
+    return jsonify({**get_event_bus().stats(), "mqtt": get_mqtt_client().stats()})
+
+@app.route("/metrics")
+def metrics_endpoint():
+    """Prometheus scrape endpoint"""
+    return Response(metrics.REGISTRY.render(), mimetype="text/plain; version=0.0.4")
+
 @app.route("/start-camera")
 def start_camera():
-    """ Start the Crowd Detection using live camera feed """
-    
-    # CAMERA_URL = "http://172.16.40.1:8080/video"
-    CAMERA_URL = "http://192.168.87.96:8080/video"
-    MODEL_PATH = "yolov8n.pt"
-    
-    # 🔥 Fix: Use absolute path for the alert sound
-    ALERT_SOUND = os.path.abspath("static/audio/alarm.mp3")  
-    CROWD_THRESHOLD = 3
+    """ Start every configured camera pipeline (safe to call repeatedly) """
+    manager = get_pipeline_manager()
+    if not manager.cameras:
+        return jsonify({"error": "No cameras configured. Please check your settings."}), 400
+    try:
+        manager.start_all()
+    except RuntimeError as e:
+        return jsonify({"error": str(e)}), 503
+    return jsonify({"message": "Live Camera Started", "status": manager.status()})
 
-    # Check if crowd_control.py exists
-    if not os.path.exists("detection/crowd_control.py"):
-        return jsonify({"error": "detection/crowd_control.py file not found"}), 500
+@app.route("/cameras", methods=["GET"])
+def cameras_status():
+    return jsonify(get_pipeline_manager().status())
 
-    # Start the detection in a new thread
-    thread = threading.Thread(target=detect_crowd, args=(CAMERA_URL, MODEL_PATH, ALERT_SOUND, CROWD_THRESHOLD))
-    thread.start()
+@app.route("/cameras/<camera_id>", methods=["GET"])
+def camera_status(camera_id):
+    try:
+        return jsonify(get_pipeline_manager().status(camera_id))
+    except KeyError:
+        return jsonify({"error": f"Unknown camera {camera_id}"}), 404
 
-    return jsonify({"message": "Live Camera Started"})
+@app.route("/cameras/<camera_id>/start", methods=["POST"])
+def camera_start(camera_id):
+    try:
+        return jsonify(get_pipeline_manager().start(camera_id))
+    except KeyError:
+        return jsonify({"error": f"Unknown camera {camera_id}"}), 404
+    except RuntimeError as e:
+        return jsonify({"error": str(e)}), 503
+
+@app.route("/cameras/<camera_id>/stop", methods=["POST"])
+def camera_stop(camera_id):
+    try:
+        return jsonify(get_pipeline_manager().stop(camera_id))
+    except KeyError:
+        return jsonify({"error": f"Unknown camera {camera_id}"}), 404
 
 
 if __name__ == "__main__":
@@ -0,0 +1,231 @@
+"""Offline, headless throughput benchmark for the detector cores.
+
+Runs each detector (or detector mix) against the bundled clips without
+audio, windows or WebSockets and writes the numbers to JSON so runs on
+different commits / hardware can be compared.
+
+    python benchmark.py
+    python benchmark.py --detectors weapon,security+accident --cameras 8 --max-frames 300
+    python benchmark.py --videos static/videos/crowd.mp4 --output results/bench.json
+    python benchmark.py --detectors weapon --cameras 8 --mode threads processes
+"""
+import argparse
+import glob
+import json
+import os
+import platform
+import subprocess
+import sys
+import threading
+import time
+import cv2
+import numpy as np
+import settings
+from detection.detectors import DETECTORS, create_detector
+from detection.frame_hub import FrameView
+from detection.process_pool import ProcessPool
+
+try:
+    import resource  # Not available on Windows
+except ImportError:
+    resource = None
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MB (None if unavailable)."""
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)  # Bytes on macOS, KB on Linux
+    try:
+        import psutil
+        info = psutil.Process().memory_info()
+        return round(getattr(info, "peak_wset", info.rss) / (1024 * 1024), 1)
+    except ImportError:
+        return None
+
+
+def latency_summary(values_ms):
+    if not values_ms:
+        return {}
+    values = np.asarray(values_ms)
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    return {
+        "mean": round(float(values.mean()), 3),
+        "p50": round(float(p50), 3),
+        "p95": round(float(p95), 3),
+        "p99": round(float(p99), 3),
+        "max": round(float(values.max()), 3),
+    }
+
+
+def run_camera(video, detector_names, options, max_frames, stats, pool=None, camera_id="bench"):
+    """One simulated camera: decode `video` and feed every frame to the detectors as fast as possible.
+
+    With a ProcessPool the detectors run in the camera's worker process instead of this thread.
+    """
+    if pool is None:
+        detectors = [create_detector(name, options.get(name)) for name in detector_names]
+    else:
+        detectors = []
+        camera_options = {name: {**options.get(name, {}), "camera": camera_id} for name in detector_names}
+    cap = cv2.VideoCapture(video)
+    decode_s = infer_s = 0.0
+    frames = processed = 0
+    latencies = []
+    alerts = {name: 0 for name in detector_names}
+
+    while frames < max_frames:
+        started = time.perf_counter()
+        ret, frame = cap.read()
+        decoded = time.perf_counter()
+        if not ret:
+            break
+        frames += 1
+        decode_s += decoded - started
+
+        if pool is None:
+            results = {name: detector.maybe_process(frame) for name, detector in zip(detector_names, detectors)}
+        else:
+            outputs = pool.run(camera_id, camera_options, FrameView(frames, time.time(), frame))
+            results = {name: output and output[0] for name, output in outputs.items()}
+        ran = False
+        for name, result in results.items():
+            if result is not None:
+                ran = True
+                alerts[name] += int(bool(result.get("alert")))
+        finished = time.perf_counter()
+        if ran:
+            processed += 1
+            infer_s += finished - decoded
+        latencies.append((finished - started) * 1000)
+
+    cap.release()
+    with stats["lock"]:
+        stats["frames"] += frames
+        stats["processed"] += processed
+        stats["decode_s"] += decode_s
+        stats["infer_s"] += infer_s
+        stats["latencies"].extend(latencies)
+        for name, count in alerts.items():
+            stats["alerts"][name] += count
+        for name, detector in zip(detector_names, detectors):
+            if detector.controller is not None:
+                stats["adaptive"].setdefault(name, []).append(detector.controller.stats())
+        if pool is not None:
+            for name, adaptive in pool.stats_by_camera.get(camera_id, {}).get("adaptive", {}).items():
+                stats["adaptive"].setdefault(name, []).append(adaptive)
+
+
+def run_case(video, detector_names, cameras, max_frames, options, mode="threads", processes=0):
+    stats = {"lock": threading.Lock(), "frames": 0, "processed": 0, "decode_s": 0.0, "infer_s": 0.0,
+             "latencies": [], "alerts": {name: 0 for name in detector_names}, "adaptive": {}, "errors": []}
+
+    pool = ProcessPool(processes) if mode == "processes" else None
+    if pool is not None:
+        pool.start()
+
+    def camera_thread(index):
+        try:
+            run_camera(video, detector_names, options, max_frames, stats, pool, f"bench-cam-{index}")
+        except Exception as e:
+            with stats["lock"]:
+                stats["errors"].append(f"{type(e).__name__}: {e}")
+
+    threads = [threading.Thread(target=camera_thread, args=(i,), name=f"bench-cam-{i}") for i in range(cameras)]
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    wall_s = time.perf_counter() - started
+    if pool is not None:
+        pool.stop()
+
+    return {
+        "video": os.path.basename(video),
+        "detectors": detector_names,
+        "cameras": cameras,
+        "mode": mode,
+        "frames": stats["frames"],
+        "frames_processed": stats["processed"],
+        "wall_s": round(wall_s, 3),
+        "decode_fps": round(stats["frames"] / stats["decode_s"], 2) if stats["decode_s"] else 0.0,
+        "inference_fps": round(stats["processed"] / stats["infer_s"], 2) if stats["infer_s"] else 0.0,
+        "end_to_end_fps": round(stats["frames"] / wall_s, 2) if wall_s else 0.0,
+        "latency_ms": latency_summary(stats["latencies"]),
+        "peak_rss_mb": peak_rss_mb(),
+        "alerts": stats["alerts"],
+        "adaptive": stats["adaptive"],
+        "errors": stats["errors"],
+    }
+
+
+def environment():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = ""
+    return {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "commit": commit,
+        "host": platform.node(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "python": platform.python_version(),
+        "opencv": cv2.__version__,
+        "numpy": np.__version__,
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Headless detector benchmark over recorded clips")
+    parser.add_argument("--detectors", default=",".join(sorted(DETECTORS)),
+                        help="Comma-separated detectors; join with '+' to run a mix on the same frames")
+    parser.add_argument("--videos", nargs="*", default=None, help="Clips to use (default: static/videos/*.mp4)")
+    parser.add_argument("--cameras", type=int, nargs="*", default=[1], help="Simulated parallel cameras, e.g. 1 4 8")
+    parser.add_argument("--max-frames", type=int, default=300, help="Frames per camera per run")
+    parser.add_argument("--no-adaptive", action="store_true", help="Disable latency-driven skipping/scaling")
+    parser.add_argument("--mode", nargs="*", default=["threads"], choices=["threads", "processes"],
+                        help="Run detectors in threads, in worker processes, or both for comparison")
+    parser.add_argument("--processes", type=int, default=0, help="Worker processes in processes mode (0 = cores - 1)")
+    parser.add_argument("--output", default="benchmark_results.json", help="JSON report path")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    videos = args.videos or sorted(glob.glob("static/videos/*.mp4"))
+    groups = [group.split("+") for group in args.detectors.split(",") if group]
+
+    options = settings.CONFIG.get("detectors", {})
+    if args.no_adaptive:
+        options = {name: {**options.get(name, {}), "target_latency_ms": 0} for name in DETECTORS}
+
+    results = []
+    for group in groups:
+        for video in videos:
+            for cameras, mode in ((c, m) for c in args.cameras for m in args.mode):
+                label = f"{'+'.join(group):<20} {os.path.basename(video):<18} x{cameras:<3} {mode:<9}"
+                try:
+                    result = run_case(video, group, cameras, args.max_frames, options, mode, args.processes)
+                except Exception as e:
+                    result = {"video": os.path.basename(video), "detectors": group, "cameras": cameras,
+                              "mode": mode, "errors": [f"{type(e).__name__}: {e}"]}
+                results.append(result)
+                if result.get("errors"):
+                    print(f"{label} ERROR {result['errors'][0]}")
+                else:
+                    print(f"{label} e2e {result['end_to_end_fps']:>8.1f} fps  "
+                          f"p95 {result['latency_ms'].get('p95', 0):>8.2f} ms  alerts {result['alerts']}")
+
+    report = {"environment": environment(), "max_frames": args.max_frames, "results": results}
+    output_dir = os.path.dirname(args.output)
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=4)
+    print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+import cv2
+import numpy as np
+
+
+class AdaptiveController:
+    """Keeps a detector inside its per-frame latency budget.
+
+    Feed it the measured processing time of every analysed frame. When the
+    smoothed latency goes over `target_latency_ms` it first lowers the analysis
+    resolution (down to `min_width`), then starts skipping frames. When there is
+    head-room it undoes those steps in reverse order. Detection boxes found on
+    the downscaled frame are mapped back with `to_full_res()`.
+    """
+
+    # Detector options read by from_config()
+    OPTION_KEYS = ("target_latency_ms", "analysis_width", "min_width", "max_skip")
+
+    def __init__(self, target_latency_ms=100, analysis_width=640, min_width=320, max_skip=8, smoothing=0.2):
+        self.target = float(target_latency_ms)
+        self.max_width = int(analysis_width)
+        self.min_width = min(int(min_width), self.max_width)
+        self.max_skip = int(max_skip)
+        self.smoothing = smoothing
+
+        self.width = self.max_width
+        self.skip = 0
+        self.latency = 0.0
+        self.frames_seen = 0
+        self.frames_skipped = 0
+        self._counter = 0
+
+    @classmethod
+    def from_config(cls, options):
+        """Build from a detector config block, or return None when no latency target is set."""
+        if not options or not options.get("target_latency_ms"):
+            return None
+        return cls(
+            options["target_latency_ms"],
+            analysis_width=options.get("analysis_width", 640),
+            min_width=options.get("min_width", 320),
+            max_skip=options.get("max_skip", 8),
+        )
+
+    def should_process(self):
+        """True for the frames that fit the current skip rate."""
+        self.frames_seen += 1
+        self._counter += 1
+        if self._counter > self.skip:
+            self._counter = 0
+            return True
+        self.frames_skipped += 1
+        return False
+
+    def prepare(self, frame):
+        """Downscale `frame` to the analysis width. Returns (small_frame, scale) with scale = small / full."""
+        h, w = frame.shape[:2]
+        if w <= self.width:
+            return frame, 1.0
+        scale = self.width / w
+        small = cv2.resize(frame, (self.width, int(round(h * scale))), interpolation=cv2.INTER_AREA)
+        return small, scale
+
+    def update(self, latency_ms):
+        """Record one frame's latency and adjust resolution / skip rate."""
+        if self.latency == 0.0:
+            self.latency = latency_ms
+        else:
+            self.latency += self.smoothing * (latency_ms - self.latency)
+
+        if self.latency > self.target * 1.1:
+            if self.width > self.min_width:
+                self.width = max(self.min_width, int(self.width * 0.8) // 16 * 16)
+            elif self.skip < self.max_skip:
+                self.skip += 1
+            self.latency = self.target  # Let the next measurements show the effect
+        elif self.latency < self.target * 0.6:
+            if self.skip > 0:
+                self.skip -= 1
+            elif self.width < self.max_width:
+                self.width = min(self.max_width, int(self.width * 1.25) // 16 * 16)
+
+    def stats(self):
+        return {
+            "target_latency_ms": self.target,
+            "latency_ms": round(self.latency, 2),
+            "analysis_width": self.width,
+            "skip": self.skip,
+            "frames_seen": self.frames_seen,
+            "frames_skipped": self.frames_skipped,
+        }
+
+
+def to_full_res(boxes, scale):
+    """Map (x, y, w, h) or (x1, y1, x2, y2) boxes found on a downscaled frame back to full resolution."""
+    boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+    if scale == 1.0:
+        return boxes.astype(int)
+    return np.rint(boxes / scale).astype(int)
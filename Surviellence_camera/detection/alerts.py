@@ -0,0 +1,335 @@
+import os
+import queue
+import threading
+import time
+import settings
+from detection import metrics, events
+
+# Defaults for the process-wide engine, overridable in the "alerts" block of config.json
+ALERT_DEFAULTS = {
+    "cooldowns": {"crowd": 30, "weapon": 2, "security": 5, "accident": 10},
+    "default_cooldown": 5,
+    "hysteresis": {"crowd": {"enter": 5, "exit": 3}},
+    "clear_after": 3.0,
+    "audio": True,
+    "sounds": {"default": "static/audio/alarm.mp3", "crowd": "static/audio/crowd_alert.mp3",
+               "weapon": "static/audio/weapon_alert.mp3"},
+    "store": True,
+    "log_path": "",
+}
+
+RAISED = "raised"
+ONGOING = "ongoing"
+CLEARED = "cleared"
+
+
+class DetectionEvent:
+    """One detection as reported by a detector core (full-resolution xyxy bbox)."""
+
+    __slots__ = ("camera", "type", "confidence", "bbox", "track_id", "timestamp")
+
+    def __init__(self, camera, type, confidence=1.0, bbox=None, track_id=None, timestamp=None):
+        self.camera = camera
+        self.type = type
+        self.confidence = confidence
+        self.bbox = bbox
+        self.track_id = track_id
+        self.timestamp = time.time() if timestamp is None else timestamp
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+class _AlertState:
+    """Cooldown / hysteresis state of one (camera, type) pair."""
+
+    __slots__ = ("active", "last_fired", "last_seen", "suppressed", "track_ids", "confidence")
+
+    def __init__(self):
+        self.active = False
+        self.last_fired = 0.0
+        self.last_seen = 0.0
+        self.suppressed = 0  # Frames with detections folded into the next alert
+        self.track_ids = set()
+        self.confidence = 0.0
+
+
+class AlertEngine:
+    """Turns per-frame detection events into a small number of alerts.
+
+    Detectors hand over every processed frame's events (possibly none).
+    Per (camera, type):
+
+    - types listed in `hysteresis` are levels (e.g. crowd size = number of
+      events): the alert is raised once the count reaches `enter`, repeated
+      as "ongoing" every cooldown while it stays above `exit`, and cleared
+      when it drops to `exit` or below;
+    - other types raise an alert when detected and the cooldown has passed,
+      and clear after `clear_after` seconds without detections.
+
+    Detections inside a cooldown are merged (track ids, best confidence,
+    count) into the next alert instead of producing their own. Alerts fan out
+    to the sinks, which must not block. Alerts for a camera `zone` have their
+    own state. Callers can bring their own hysteresis `levels` (a detector's
+    own threshold); `hysteresis` applies when they don't.
+    """
+
+    def __init__(self, cooldowns=None, default_cooldown=5, hysteresis=None, clear_after=3.0, sinks=None):
+        self.cooldowns = dict(cooldowns or {})
+        self.default_cooldown = default_cooldown
+        self.hysteresis = {name: dict(levels) for name, levels in (hysteresis or {}).items()}
+        self.clear_after = clear_after
+        self.sinks = list(sinks or [])
+        self.fired = 0
+        self.suppressed = 0
+        self._states = {}
+        self._lock = threading.Lock()
+
+    def add_sink(self, sink):
+        self.sinks.append(sink)
+        return sink
+
+    def configure(self, cooldowns=None, default_cooldown=5, hysteresis=None, clear_after=3.0):
+        """Swap in new cooldowns / thresholds; active alerts keep their state."""
+        with self._lock:
+            self.cooldowns = dict(cooldowns or {})
+            self.default_cooldown = default_cooldown
+            self.hysteresis = {name: dict(levels) for name, levels in (hysteresis or {}).items()}
+            self.clear_after = clear_after
+
+    def set_sound(self, alert_type, path):
+        for sink in self.sinks:
+            if isinstance(sink, AudioSink):
+                sink.sounds[alert_type] = path
+
+    def process(self, camera, alert_type, detections, timestamp=None, zone=None, levels=None):
+        """Feed one frame's events for `alert_type` on `camera` or one of its zones. Returns the alert, or None."""
+        now = time.time() if timestamp is None else timestamp
+        cooldown = self.cooldowns.get(alert_type, self.default_cooldown)
+        key = (camera, alert_type, zone)
+        with self._lock:
+            state = self._states.get(key)
+            if state is None:
+                state = self._states[key] = _AlertState()
+
+            for detection in detections:
+                if detection.track_id is not None:
+                    state.track_ids.add(detection.track_id)
+                if detection.confidence is not None:
+                    state.confidence = max(state.confidence, detection.confidence)
+
+            if levels is None:
+                levels = self.hysteresis.get(alert_type)
+            transition = None
+            if levels is not None:
+                count = len(detections)
+                if not state.active and count >= levels["enter"]:
+                    transition = RAISED
+                elif state.active and count <= levels["exit"]:
+                    transition = CLEARED
+                elif state.active and now - state.last_fired >= cooldown:
+                    transition = ONGOING
+            elif detections:
+                state.last_seen = now
+                if now - state.last_fired >= cooldown:
+                    transition = ONGOING if state.active else RAISED
+            elif state.active and now - state.last_seen > self.clear_after:
+                transition = CLEARED
+
+            if transition is None:
+                if not state.active:
+                    state.track_ids.clear()  # Below the enter level, nothing to merge into
+                    state.confidence = 0.0
+                elif detections:
+                    state.suppressed += 1
+                    self.suppressed += 1
+                    metrics.inc("vision_alerts_suppressed_total", camera=camera, detector=alert_type)
+                return None
+
+            alert = {
+                "camera": camera,
+                "type": alert_type,
+                "state": transition,
+                "count": len(detections),
+                "confidence": round(float(state.confidence), 3),
+                "bboxes": [d.bbox for d in detections if d.bbox is not None],
+                "track_ids": sorted(state.track_ids),
+                "suppressed": state.suppressed,
+                "timestamp": now,
+                "message": f"{alert_type.capitalize()} {'cleared' if transition == CLEARED else 'detected'} on {camera}"
+                           + (f" ({zone})" if zone else ""),
+            }
+            if zone is not None:
+                alert["zone"] = zone
+            state.active = transition != CLEARED
+            if transition != CLEARED:
+                state.last_fired = now
+            state.suppressed = 0
+            state.track_ids = set()
+            state.confidence = 0.0
+            self.fired += 1
+
+        if transition != CLEARED:
+            metrics.inc("vision_alerts_total", camera=camera, detector=alert_type)
+        for sink in self.sinks:
+            try:
+                sink.handle(alert)
+            except Exception as e:
+                print(f"⚠ Alert sink {type(sink).__name__} failed: {e}")
+        return alert
+
+    def stats(self):
+        with self._lock:
+            active = ["/".join(part for part in key if part) for key, state in self._states.items() if state.active]
+        return {"fired": self.fired, "suppressed": self.suppressed, "active": active}
+
+
+class AlertSink:
+    """Receives every alert the engine fires. `handle()` runs on the detector's thread, keep it short."""
+
+    def handle(self, alert):
+        raise NotImplementedError
+
+
+class EventBusSink(AlertSink):
+    """Publishes alerts as `<type>_alert` on the event bus (Socket.IO, WebSocket, MQTT sinks)."""
+
+    def handle(self, alert):
+        events.publish(f"{alert['type']}_alert", kind="alert", **alert)
+
+
+class ClipSink(AlertSink):
+    """Starts (or extends) the camera's clip recording for `types` and links the clip to the alert.
+
+    Must run before the other sinks so the stored and published alert carries `clip`.
+    """
+
+    def __init__(self, types=("weapon", "accident")):
+        self.types = set(types)
+
+    def handle(self, alert):
+        if alert["type"] not in self.types or alert["state"] == CLEARED:
+            return
+        from detection.recorder import get_recorder
+        recorder = get_recorder(alert["camera"])
+        if recorder is not None:
+            alert["clip"] = recorder.trigger(alert["type"], alert["timestamp"])
+
+
+class StoreSink(AlertSink):
+    """Records alerts in the event store queried by /logs (batched, never blocks on disk)."""
+
+    def handle(self, alert):
+        from detection.event_store import get_event_store
+        get_event_store().add(alert)
+
+
+class LogSink(AlertSink):
+    """Appends one line per alert to a plain-text log file."""
+
+    def __init__(self, path="logs/detection_logs.txt"):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def handle(self, alert):
+        stamp = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(alert["timestamp"]))
+        line = (f"{stamp} | {alert['camera']} | {alert['type']} | {alert['state']} | count={alert['count']} "
+                f"confidence={alert['confidence']} tracks={alert['track_ids']} suppressed={alert['suppressed']}\n")
+        with self._lock:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            with open(self.path, "a") as f:
+                f.write(line)
+
+
+class AudioSink(AlertSink):
+    """Plays alert sounds from a single worker thread (pygame, initialised on the first alert).
+
+    Level alerts (`loop` types) keep playing until cleared, other sounds play
+    once and are not restarted while already playing. Without pygame or an
+    audio device (headless servers) the sink disables itself after one warning.
+    """
+
+    def __init__(self, sounds=None, loop=("crowd",), queue_size=16):
+        self.sounds = dict(sounds or {})
+        self.loop = set(loop)
+        self.disabled = False
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def handle(self, alert):
+        if self.disabled:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="alert-audio", daemon=True)
+                self._thread.start()
+        try:
+            self._queue.put_nowait(alert)
+        except queue.Full:
+            pass  # Already a backlog of sounds, this one adds nothing
+
+    def _run(self):
+        try:
+            import pygame
+            pygame.mixer.init()
+        except Exception as e:
+            self.disabled = True
+            print(f"⚠ Alert sounds disabled, no audio output: {e}")
+            return
+        cache = {}
+        channels = {}  # (camera, type, zone) -> looping channel, keyed like the engine's alert state
+        while True:
+            alert = self._queue.get()
+            key = (alert["camera"], alert["type"], alert.get("zone"))
+            try:
+                if alert["state"] == CLEARED:
+                    channel = channels.pop(key, None)
+                    if channel is not None:
+                        channel.stop()
+                    continue
+                path = self.sounds.get(alert["type"], self.sounds.get("default"))
+                if not path:
+                    continue
+                sound = cache.get(path)
+                if sound is None:
+                    sound = cache[path] = pygame.mixer.Sound(path)
+                if alert["type"] in self.loop:
+                    if key not in channels:
+                        channels[key] = sound.play(-1)
+                elif sound.get_num_channels() == 0:
+                    sound.play()
+            except Exception as e:
+                print(f"⚠ Could not play alert sound: {e}")
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_alert_engine():
+    """The process-wide engine, built from the "alerts" block of config.json on first use."""
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            config = {**ALERT_DEFAULTS, **settings.CONFIG.get("alerts", {})}
+            recording = settings.CONFIG.get("recording", {})
+            sinks = [EventBusSink()]
+            if recording.get("enabled", True):
+                sinks.insert(0, ClipSink(recording.get("types", ("weapon", "accident"))))
+            _engine = AlertEngine(config["cooldowns"], config["default_cooldown"], config["hysteresis"],
+                                  config["clear_after"], sinks)
+            if config["store"]:
+                _engine.add_sink(StoreSink())
+            if config["log_path"]:
+                _engine.add_sink(LogSink(config["log_path"]))
+            if config["audio"]:
+                _engine.add_sink(AudioSink(config["sounds"]))
+        return _engine
+
+
+def set_alert_engine(engine):
+    """Make `engine` the process-wide engine (tools that need their own sinks, e.g. the load test)."""
+    global _engine
+    with _engine_lock:
+        _engine = engine
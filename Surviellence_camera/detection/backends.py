@@ -0,0 +1,252 @@
+import json
+import threading
+import time
+import cv2
+import numpy as np
+
+# Backend name -> class, filled by @register_backend
+BACKENDS = {}
+
+# Keys of a detector config block that belong to the backend (the rest are detector settings)
+BACKEND_OPTION_KEYS = {
+    "backend", "conf", "model_path", "prototxt", "weights", "onnx_path", "input_size", "nms_threshold",
+    "cascade_path", "scale_factor", "min_neighbors", "min_size",
+}
+
+
+def register_backend(name):
+    """Class decorator adding a DetectorBackend implementation to the registry."""
+    def decorator(cls):
+        cls.name = name
+        BACKENDS[name] = cls
+        return cls
+    return decorator
+
+
+class Detections:
+    """Detections for one frame as NumPy arrays (full-resolution xyxy boxes).
+
+    Exposes `xyxy`, `xywh`, `conf` and `cls` so it can be fed straight to the
+    ultralytics ByteTrack tracker, and supports boolean-mask indexing.
+    """
+
+    def __init__(self, xyxy=None, conf=None, cls=None):
+        self.xyxy = np.zeros((0, 4), np.float32) if xyxy is None else np.asarray(xyxy, np.float32).reshape(-1, 4)
+        self.conf = np.zeros(len(self.xyxy), np.float32) if conf is None else np.asarray(conf, np.float32)
+        self.cls = np.zeros(len(self.xyxy), np.int32) if cls is None else np.asarray(cls, np.int32)
+
+    @property
+    def xywh(self):
+        """Center x, center y, width, height."""
+        xywh = np.empty_like(self.xyxy)
+        xywh[:, :2] = (self.xyxy[:, :2] + self.xyxy[:, 2:]) / 2
+        xywh[:, 2:] = self.xyxy[:, 2:] - self.xyxy[:, :2]
+        return xywh
+
+    def __len__(self):
+        return len(self.xyxy)
+
+    def shift(self, offset):
+        """Move boxes found on a crop back into the full frame (in place)."""
+        if offset != (0, 0):
+            self.xyxy += np.asarray(offset * 2, np.float32)
+        return self
+
+    def __getitem__(self, index):
+        return Detections(self.xyxy[index], self.conf[index], self.cls[index])
+
+
+class DetectorBackend:
+    """Base class: load once, `infer_batch(frames)` -> list of Detections, timed per call."""
+
+    name = None
+    person_class = 0  # Class id of 'person' in this model's label set
+
+    def __init__(self, conf=0.5, **options):
+        self.conf = conf
+        self.options = options
+        self.loaded = False
+        self.timings = {"calls": 0, "frames": 0, "total_ms": 0.0, "last_ms": 0.0, "warmup_ms": 0.0}
+        self._lock = threading.Lock()  # OpenCV nets and cascades are not safe for concurrent use
+
+    def load(self):
+        """Load weights. Called lazily by the first inference."""
+        self.loaded = True
+
+    def _infer_batch(self, frames, scale=1.0):
+        raise NotImplementedError
+
+    def infer_batch(self, frames, scale=1.0):
+        """Detect on `frames`. Pass scale < 1 for downscaled frames; boxes come back at full resolution."""
+        if not self.loaded:
+            self.load()
+        started = time.perf_counter()
+        results = self._infer_batch(frames, scale)
+        if scale != 1.0:
+            for detections in results:
+                detections.xyxy /= scale
+        elapsed = (time.perf_counter() - started) * 1000
+        self.timings["calls"] += 1
+        self.timings["frames"] += len(frames)
+        self.timings["total_ms"] += elapsed
+        self.timings["last_ms"] = elapsed
+        return results
+
+    def infer(self, frame, scale=1.0):
+        return self.infer_batch([frame], scale)[0]
+
+    def warmup(self, shape=(640, 640, 3), runs=2):
+        """Run dummy frames through the model so the first real frame is not slow."""
+        if not self.loaded:
+            self.load()
+        started = time.perf_counter()
+        dummy = np.zeros(shape, np.uint8)
+        for _ in range(runs):
+            self._infer_batch([dummy])
+        self.timings["warmup_ms"] = (time.perf_counter() - started) * 1000
+
+    def stats(self):
+        calls = self.timings["calls"]
+        return {
+            "backend": self.name,
+            "loaded": self.loaded,
+            **self.timings,
+            "avg_ms_per_frame": self.timings["total_ms"] / self.timings["frames"] if self.timings["frames"] else 0.0,
+            "avg_batch": self.timings["frames"] / calls if calls else 0.0,
+        }
+
+
+@register_backend("yolo")
+class UltralyticsYOLOBackend(DetectorBackend):
+    """YOLOv8 through ultralytics, using the shared batching InferenceService (weights loaded once)."""
+
+    def load(self):
+        from detection.inference import get_inference_service
+        self.service = get_inference_service(self.options.get("model_path", "yolov8n.pt"))
+        self.service.load()
+        self.loaded = True
+
+    def _infer_batch(self, frames, scale=1.0):
+        futures = [self.service.submit(frame, self.conf) for frame in frames]
+        detections = []
+        for future in futures:
+            boxes = future.result().boxes.cpu().numpy()
+            detections.append(Detections(boxes.xyxy, boxes.conf, boxes.cls))
+        return detections
+
+
+@register_backend("opencv_ssd")
+class MobileNetSSDBackend(DetectorBackend):
+    """MobileNet-SSD (Caffe, VOC classes) on OpenCV DNN. Needs the matching .caffemodel weights."""
+
+    person_class = 15  # VOC label set
+
+    def load(self):
+        prototxt = self.options.get("prototxt", "detection/mobilenet_ssd/MobileNetSSD_deploy.prototxt")
+        weights = self.options.get("weights", "detection/mobilenet_ssd/MobileNetSSD_deploy.caffemodel")
+        self.net = cv2.dnn.readNetFromCaffe(prototxt, weights)
+        self.loaded = True
+
+    def _infer_batch(self, frames, scale=1.0):
+        blob = cv2.dnn.blobFromImages(frames, 0.007843, (300, 300), 127.5)
+        with self._lock:
+            self.net.setInput(blob)
+            out = self.net.forward()[0, 0]  # Rows: image_id, label, conf, x1, y1, x2, y2 (relative)
+
+        out = out[out[:, 2] >= self.conf]
+        detections = []
+        for i, frame in enumerate(frames):
+            rows = out[out[:, 0] == i]
+            h, w = frame.shape[:2]
+            xyxy = np.clip(rows[:, 3:7], 0, 1) * np.array([w, h, w, h], np.float32)
+            detections.append(Detections(xyxy, rows[:, 2], rows[:, 1]))
+        return detections
+
+
+@register_backend("yolo_onnx")
+class OnnxYOLOBackend(DetectorBackend):
+    """YOLOv8 exported to ONNX, run on OpenCV DNN (no torch needed)."""
+
+    def load(self):
+        self.net = cv2.dnn.readNetFromONNX(self.options.get("onnx_path", "yolov8n.onnx"))
+        self.input_size = int(self.options.get("input_size", 640))
+        self.nms_threshold = self.options.get("nms_threshold", 0.45)
+        self.loaded = True
+
+    def _infer_batch(self, frames, scale=1.0):
+        size = self.input_size
+        blob = cv2.dnn.blobFromImages(frames, 1 / 255.0, (size, size), swapRB=True, crop=False)
+        with self._lock:
+            self.net.setInput(blob)
+            out = self.net.forward()  # (batch, 4 + classes, anchors)
+
+        detections = []
+        for i, frame in enumerate(frames):
+            preds = out[i].T  # (anchors, 4 + classes)
+            scores = preds[:, 4:]
+            cls = scores.argmax(axis=1)
+            conf = scores[np.arange(len(scores)), cls]
+            keep = conf >= self.conf
+            preds, cls, conf = preds[keep], cls[keep], conf[keep]
+
+            h, w = frame.shape[:2]
+            xywh = preds[:, :4] * np.array([w / size, h / size, w / size, h / size], np.float32)
+            xyxy = np.concatenate([xywh[:, :2] - xywh[:, 2:] / 2, xywh[:, :2] + xywh[:, 2:] / 2], axis=1)
+            tlwh = np.concatenate([xyxy[:, :2], xywh[:, 2:]], axis=1)
+            idx = cv2.dnn.NMSBoxes(tlwh.tolist(), conf.tolist(), self.conf, self.nms_threshold)
+            idx = np.asarray(idx, dtype=int).reshape(-1)
+            detections.append(Detections(xyxy[idx], conf[idx], cls[idx]))
+        return detections
+
+
+@register_backend("haar")
+class HaarCascadeBackend(DetectorBackend):
+    """OpenCV Haar cascade (the weapon cascade by default). One class, no batching in OpenCV."""
+
+    def load(self):
+        self.cascade = cv2.CascadeClassifier(self.options.get("cascade_path", "detection/cascade.xml"))
+        self.scale_factor = self.options.get("scale_factor", 1.1)
+        self.min_neighbors = self.options.get("min_neighbors", 5)
+        self.min_size = int(self.options.get("min_size", 60))
+        self.loaded = True
+
+    def _infer_batch(self, frames, scale=1.0):
+        size = max(12, int(self.min_size * scale))  # min_size is in full-resolution pixels
+        detections = []
+        for frame in frames:
+            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if frame.ndim == 3 else frame
+            with self._lock:
+                boxes = self.cascade.detectMultiScale(gray, scaleFactor=self.scale_factor,
+                                                      minNeighbors=self.min_neighbors, minSize=(size, size))
+            boxes = np.asarray(boxes, np.float32).reshape(-1, 4)
+            boxes[:, 2:] += boxes[:, :2]  # xywh -> xyxy
+            detections.append(Detections(boxes, np.ones(len(boxes)), np.zeros(len(boxes))))
+        return detections
+
+
+_instances = {}
+_instances_lock = threading.Lock()
+
+
+def create_backend(backend="yolo", **options):
+    """Build a backend from a detector config block (the `backend` key picks the class)."""
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown detector backend: {backend} (available: {', '.join(sorted(BACKENDS))})")
+    return BACKENDS[backend](**options)
+
+
+def loaded_backends():
+    """stats() of every shared backend instance created so far."""
+    with _instances_lock:
+        return [instance.stats() for instance in _instances.values()]
+
+
+def get_backend(options):
+    """Shared backend instance for identical config blocks, so cameras reuse the same weights."""
+    options = {k: v for k, v in (options or {}).items() if k in BACKEND_OPTION_KEYS}
+    key = json.dumps(options, sort_keys=True)
+    with _instances_lock:
+        instance = _instances.get(key)
+        if instance is None:
+            instance = _instances[key] = create_backend(**options)
+        return instance
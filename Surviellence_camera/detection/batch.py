@@ -0,0 +1,434 @@
+"""Offline analysis of recorded footage, split into chunks analysed in parallel.
+
+    python -m detection.batch static/videos/weapon.mp4 --detectors weapon,security
+    python -m detection.batch archive/cam1.mp4 --workers 4 --chunk-seconds 120 --output cam1.json
+"""
+import argparse
+import json
+import os
+import queue
+import shutil
+import signal
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from collections import OrderedDict
+import settings
+from detection.runtime import CancelToken, install_signal_handlers
+
+# Defaults for batch jobs, overridable in the "batch" block of config.json and per job
+BATCH_DEFAULTS = {
+    "workers": 0,  # Worker processes (0 = one per core)
+    "chunk_seconds": 60,  # Length of the pieces the video is split into
+    "sample_fps": 5,  # Frames analysed per second of video (0 = every frame)
+    "warmup": 2,  # Seconds decoded before a chunk so background models and trackers settle
+    "merge_gap": 2,  # Detections of a type closer than this (seconds) form one timeline event
+    "directories": ["static/videos", "data/clips"],  # Where API jobs may read videos from
+    "keep_jobs": 50,  # Finished jobs kept for the API
+}
+
+
+def video_info(path):
+    """(fps, frame_count) of a video file; frame_count is 0 when the container does not say."""
+    import cv2
+    cap = cv2.VideoCapture(path, cv2.CAP_FFMPEG)
+    if not cap.isOpened():
+        raise ValueError(f"Cannot open video {path}")
+    try:
+        return cap.get(cv2.CAP_PROP_FPS) or 25.0, max(0, int(cap.get(cv2.CAP_PROP_FRAME_COUNT)))
+    finally:
+        cap.release()
+
+
+def keyframe_times(path):
+    """Keyframe timestamps in seconds from ffprobe, or None when ffprobe is not installed."""
+    ffprobe = shutil.which("ffprobe")
+    if ffprobe is None:
+        return None
+    try:
+        output = subprocess.run([ffprobe, "-v", "error", "-select_streams", "v:0", "-skip_frame", "nokey",
+                                 "-show_entries", "frame=pts_time", "-of", "csv=p=0", path],
+                                capture_output=True, text=True, timeout=120, check=True).stdout
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return sorted(float(line.strip(",")) for line in output.split() if line.strip(","))
+
+
+def plan_chunks(fps, frame_count, chunk_seconds, keyframes=None):
+    """[(start_frame, end_frame), ...] covering the video, boundaries moved to the next keyframe if known.
+
+    Chunks starting on a keyframe decode no frames twice after the seek.
+    An unknown frame count gives a single chunk with no end (None).
+    """
+    if frame_count <= 0:
+        return [(0, None)]
+    step = max(1, int(round(chunk_seconds * fps)))
+    boundaries = list(range(step, frame_count, step))
+    if keyframes:
+        key_frames = [int(round(t * fps)) for t in keyframes]
+        snapped = []
+        for boundary in boundaries:
+            later = [k for k in key_frames if boundary <= k < boundary + step // 2]
+            snapped.append(later[0] if later else boundary)
+        boundaries = sorted(set(snapped))
+    edges = [0] + boundaries + [frame_count]
+    return [(start, end) for start, end in zip(edges, edges[1:]) if end > start]
+
+
+def frame_detection(name, result, t):
+    """Compact record of one alerting frame: video time, detector, count, best confidence, boxes."""
+    confidences = result.get("confidences") or [1.0] * len(result["boxes"])
+    return {"t": round(t, 3), "type": name, "count": result.get("person_count", len(result["boxes"])),
+            "confidence": round(float(max(confidences, default=1.0)), 3), "boxes": result["boxes"]}
+
+
+def merge_timeline(detections, gap=2.0, start_time=None):
+    """Merge per-frame detections into events: one per type and run of detections less than `gap` s apart."""
+    timeline = []
+    for detection in sorted(detections, key=lambda d: (d["type"], d["t"])):
+        event = timeline[-1] if timeline else None
+        if event is not None and event["type"] == detection["type"] and detection["t"] - event["end"] <= gap:
+            event["end"] = detection["t"]
+            event["frames"] += 1
+            event["confidence"] = max(event["confidence"], detection["confidence"])
+            if detection["count"] > event["peak_count"]:
+                event["peak_count"] = detection["count"]
+                event["peak_t"] = detection["t"]
+                event["boxes"] = detection["boxes"]
+            continue
+        timeline.append({"type": detection["type"], "start": detection["t"], "end": detection["t"], "frames": 1,
+                         "peak_count": detection["count"], "peak_t": detection["t"],
+                         "confidence": detection["confidence"], "boxes": detection["boxes"]})
+    timeline.sort(key=lambda e: (e["start"], e["type"]))
+    for event in timeline:
+        event["time"] = time.strftime("%H:%M:%S", time.gmtime(event["start"]))
+        if start_time is not None:
+            event["timestamp"] = start_time + event["start"]  # Wall-clock time of the recording
+    return timeline
+
+
+def analyze_chunk(task, emit):
+    """Worker side: run the detectors over one chunk as fast as it decodes, reporting through `emit`."""
+    import cv2
+    from detection.detectors import create_detector
+    cap = cv2.VideoCapture(task["path"], cv2.CAP_FFMPEG)
+    if not cap.isOpened():
+        raise RuntimeError(f"cannot open {task['path']}")
+    fps = cap.get(cv2.CAP_PROP_FPS) or 25.0
+    start, end = task["start"], task["end"]
+    position = max(0, start - int(task["warmup"] * fps))
+    if position:
+        cap.set(cv2.CAP_PROP_POS_FRAMES, position)  # FFMPEG seeks to the keyframe before and decodes forward
+        # Frame seeks are often inexact: count from where the decoder really is, so chunk
+        # ownership (position >= start) and event times line up with the neighbouring chunks
+        position = max(0, int(round(cap.get(cv2.CAP_PROP_POS_FRAMES))))
+    step = max(1, int(round(fps / task["sample_fps"]))) if task["sample_fps"] else 1
+    detectors = {name: create_detector(name, options) for name, options in task["options"].items()}
+    detections, reported = 0, 0
+    while end is None or position < end:
+        if position % step:
+            ok = cap.grab()  # Frames between samples are read but never decoded
+        else:
+            ok, frame = cap.read()
+            if ok:
+                msec = cap.get(cv2.CAP_PROP_POS_MSEC)  # The decoded frame's own timestamp, when the backend has it
+                t = msec / 1000 if msec > 0 else position / fps
+                for name, detector in detectors.items():
+                    result = detector.maybe_process(frame)
+                    if result is not None and result["alert"] and position >= start:
+                        emit({"chunk": task["chunk"], "detection": frame_detection(name, result, t)})
+                        detections += 1
+        if not ok:
+            break
+        position += 1
+        if position - reported >= 100:
+            reported = position
+            emit({"chunk": task["chunk"], "frames": max(0, position - start)})
+    cap.release()
+    emit({"chunk": task["chunk"], "frames": max(0, position - start), "done": True, "detections": detections})
+
+
+def worker_main():
+    """Analyse the chunks sent as JSON lines on stdin, answering with JSON lines on stdout."""
+    out = os.fdopen(os.dup(sys.stdout.fileno()), "w")
+    os.dup2(sys.stderr.fileno(), sys.stdout.fileno())  # Stray prints must not corrupt the protocol
+    sys.stdout = sys.stderr
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # Ctrl+C reaches the whole process group, the job cancels us
+
+    def emit(message):
+        out.write(json.dumps(message) + "\n")
+        out.flush()
+
+    for line in sys.stdin:
+        task = json.loads(line)
+        try:
+            analyze_chunk(task, emit)
+        except Exception as e:
+            emit({"chunk": task["chunk"], "error": f"{type(e).__name__}: {e}", "done": True})
+
+
+class BatchJob:
+    """Offline analysis of one video file.
+
+    The video is split into chunks of `chunk_seconds` (on keyframes when
+    ffprobe is available) and `workers` processes analyse them without any
+    real-time pacing, each chunk starting `warmup` seconds early so
+    background models and trackers have settled by its first frame. Alerting
+    frames from all chunks are merged into one timeline of events with video
+    timestamps. Progress is reported while it runs; `cancel()` stops the
+    workers.
+    """
+
+    def __init__(self, path, detectors, options=None, workers=0, chunk_seconds=60, sample_fps=5, warmup=2,
+                 merge_gap=2, start_time=None):
+        self.id = uuid.uuid4().hex[:12]
+        self.path = path
+        self.detectors = list(detectors)
+        self.options = options or {}
+        self.workers = workers or os.cpu_count() or 1
+        self.chunk_seconds = chunk_seconds
+        self.sample_fps = sample_fps
+        self.warmup = warmup
+        self.merge_gap = merge_gap
+        self.start_time = start_time
+        self.token = CancelToken()
+        self.state = "queued"
+        self.error = None
+        self.chunks = []
+        self.total_frames = 0
+        self.fps = 0.0
+        self.timeline = []
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self._frames = {}  # Chunk -> frames analysed so far
+        self._done = set()
+        self._detections = []
+        self._procs = []
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name=f"batch-{self.id}", daemon=True)
+        self._thread.start()
+        return self
+
+    def wait(self, timeout=None):
+        if self._thread is not None:
+            self._thread.join(timeout)
+        return self.state
+
+    def cancel(self):
+        self.token.cancel()
+        with self._lock:
+            procs = list(self._procs)
+        for proc in procs:
+            proc.kill()
+
+    def _tasks(self):
+        configured = settings.CONFIG.get("detectors", {})
+        camera = f"batch:{os.path.basename(self.path)}"
+        # Never skip frames for latency offline: the adaptive controller may only lower the resolution
+        options = {name: {**configured.get(name, {}), **self.options.get(name, {}), "camera": camera, "max_skip": 0}
+                   for name in self.detectors}
+        return [{"chunk": i, "path": self.path, "start": start, "end": end, "warmup": self.warmup,
+                 "sample_fps": self.sample_fps, "options": options} for i, (start, end) in enumerate(self.chunks)]
+
+    def _run(self):
+        self.state = "running"
+        self.started = time.time()
+        try:
+            self.fps, self.total_frames = video_info(self.path)
+            self.chunks = plan_chunks(self.fps, self.total_frames, self.chunk_seconds, keyframe_times(self.path))
+            pending = queue.Queue()
+            for task in self._tasks():
+                pending.put(task)
+            threads = [threading.Thread(target=self._worker, args=(pending,), name=f"batch-{self.id}-{i}",
+                                        daemon=True) for i in range(min(self.workers, len(self.chunks)))]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            with self._lock:
+                self.timeline = merge_timeline(self._detections, self.merge_gap, self.start_time)
+            if self.token.cancelled:
+                self.state = "cancelled"
+            elif len(self._done) < len(self.chunks):
+                self.state = "failed"
+            else:
+                self.state = "done"
+        except Exception as e:
+            self.error = str(e)
+            self.state = "failed"
+        self.finished = time.time()
+
+    def _worker(self, pending):
+        # A plain `python -m` subprocess rather than multiprocessing's spawn, which would re-import the web app
+        proc = None
+        try:
+            while not self.token.cancelled:
+                try:
+                    task = pending.get_nowait()
+                except queue.Empty:
+                    return
+                if proc is None or proc.poll() is not None:
+                    proc = subprocess.Popen([sys.executable, "-m", "detection.batch", "--worker"],
+                                            stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True, bufsize=1)
+                    with self._lock:
+                        self._procs.append(proc)
+                try:
+                    proc.stdin.write(json.dumps(task) + "\n")
+                    proc.stdin.flush()
+                except OSError:
+                    pass  # Killed by cancel(), or died; readline() below sees EOF
+                self._read_chunk(proc, task["chunk"])
+        finally:
+            if proc is not None:
+                try:
+                    proc.stdin.close()
+                    proc.wait(timeout=5)
+                except (OSError, subprocess.TimeoutExpired):
+                    proc.kill()
+
+    def _read_chunk(self, proc, chunk):
+        for line in proc.stdout:
+            message = json.loads(line)
+            with self._lock:
+                if "detection" in message:
+                    self._detections.append(message["detection"])
+                if "frames" in message:
+                    self._frames[chunk] = message["frames"]
+                if "error" in message:
+                    self.error = f"chunk {chunk}: {message['error']}"
+                elif message.get("done"):
+                    self._done.add(chunk)
+            if message.get("done"):
+                return
+        if not self.token.cancelled:
+            self.error = f"chunk {chunk}: worker process exited ({proc.poll()})"
+
+    def status(self, timeline=False):
+        with self._lock:
+            frames = sum(self._frames.values())
+            done = len(self._done)
+            detections = len(self._detections)
+        elapsed = (self.finished or time.time()) - self.started if self.started else 0.0
+        progress = 1.0 if self.state == "done" else (frames / self.total_frames if self.total_frames else 0.0)
+        status = {
+            "id": self.id,
+            "path": self.path,
+            "detectors": self.detectors,
+            "state": self.state,
+            "error": self.error,
+            "progress": round(min(progress, 1.0), 3),
+            "chunks": len(self.chunks),
+            "chunks_done": done,
+            "frames": frames,
+            "total_frames": self.total_frames,
+            "workers": min(self.workers, len(self.chunks)) if self.chunks else self.workers,
+            "speed": round(frames / self.fps / elapsed, 2) if elapsed and self.fps else 0.0,  # x real time
+            "elapsed_s": round(elapsed, 1),
+            "detections": detections,
+            "events": len(self.timeline),
+        }
+        if timeline:
+            status["timeline"] = self.timeline
+        return status
+
+
+_jobs = OrderedDict()
+_jobs_lock = threading.Lock()
+
+
+def batch_options():
+    return {**BATCH_DEFAULTS, **settings.CONFIG.get("batch", {})}
+
+
+def resolve_video(path, directories):
+    """Absolute path of `path` if it is a file inside one of `directories`, else ValueError."""
+    real = os.path.realpath(path)
+    roots = [os.path.realpath(directory) for directory in directories]
+    if not any(os.path.commonpath([real, root]) == root for root in roots):
+        raise ValueError(f"{path} is not inside {', '.join(directories)}")
+    if not os.path.isfile(real):
+        raise ValueError(f"No such video: {path}")
+    return real
+
+
+def submit_job(path, detectors, options=None, **overrides):
+    """Validate and start a batch job for the API. `overrides` replace batch config values for this job."""
+    from detection.detectors import DETECTORS
+    config = batch_options()
+    unknown = [name for name in detectors if name not in DETECTORS]
+    if not detectors or unknown:
+        raise ValueError(f"Unknown detectors: {', '.join(unknown) or '(none)'} (available: {', '.join(sorted(DETECTORS))})")
+    keys = ("workers", "chunk_seconds", "sample_fps", "warmup", "merge_gap")
+    params = {key: overrides.get(key, config[key]) for key in keys}
+    job = BatchJob(resolve_video(path, config["directories"]), detectors, options,
+                   start_time=overrides.get("start_time"), **params)
+    with _jobs_lock:
+        _jobs[job.id] = job
+        finished = [job_id for job_id, j in _jobs.items() if j.state in ("done", "failed", "cancelled")]
+        for job_id in finished[:max(0, len(finished) - config["keep_jobs"])]:
+            del _jobs[job_id]
+    return job.start()
+
+
+def get_job(job_id):
+    with _jobs_lock:
+        return _jobs.get(job_id)
+
+
+def list_jobs():
+    with _jobs_lock:
+        return [job.status() for job in _jobs.values()]
+
+
+def parse_args(argv=None):
+    config = batch_options()
+    parser = argparse.ArgumentParser(description="Analyse a recorded video offline, in parallel chunks")
+    parser.add_argument("video", nargs="?", help="Video file to analyse")
+    parser.add_argument("--detectors", default="weapon,security", help="Comma-separated detectors")
+    parser.add_argument("--workers", type=int, default=config["workers"], help="Worker processes (0 = one per core)")
+    parser.add_argument("--chunk-seconds", type=float, default=config["chunk_seconds"])
+    parser.add_argument("--sample-fps", type=float, default=config["sample_fps"], help="0 analyses every frame")
+    parser.add_argument("--warmup", type=float, default=config["warmup"])
+    parser.add_argument("--merge-gap", type=float, default=config["merge_gap"])
+    parser.add_argument("--start-time", type=float, default=None, help="Epoch time the recording started")
+    parser.add_argument("--output", default=None, help="Write status and timeline as JSON here")
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.worker:
+        return worker_main()
+    if not args.video:
+        raise SystemExit("a video file is required")
+    job = BatchJob(args.video, [name for name in args.detectors.split(",") if name], workers=args.workers,
+                   chunk_seconds=args.chunk_seconds, sample_fps=args.sample_fps, warmup=args.warmup,
+                   merge_gap=args.merge_gap, start_time=args.start_time)
+    install_signal_handlers(job.token)
+    job.start()
+    while job.wait(1.0) in ("queued", "running"):
+        if job.token.cancelled:
+            job.cancel()  # Ctrl+C: kill the workers, keep what they found
+        status = job.status()
+        print(f"\r{status['progress']:6.1%}  chunks {status['chunks_done']}/{status['chunks']}  "
+              f"{status['speed']:.1f}x real time  {status['detections']} detections", end="", file=sys.stderr)
+    print(file=sys.stderr)
+    report = job.status(timeline=True)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    for event in report["timeline"]:
+        print(f"{event['time']}  {event['type']:<9} {event['end'] - event['start']:6.1f}s  "
+              f"peak {event['peak_count']}  confidence {event['confidence']}")
+    print(f"{report['state']}: {report['events']} events in {report['elapsed_s']}s ({report['speed']}x real time)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,279 @@
+import time
+import numpy as np
+from detection.adaptive import AdaptiveController
+from detection.alerts import DetectionEvent
+from detection.backends import get_backend
+from detection.motion import MotionEngine, MotionGate, CentroidTracker, RUNNING_AVERAGE
+from detection.tracks import TrackTable
+from detection.zones import ZoneMap, ZONE_OPTION_KEYS
+from detection import metrics
+from detection.metrics import stage_timer
+
+
+class Detector:
+    """Per-camera detector core: frame in, result dict out (no capture, audio or display).
+
+    `options` is the detector block from config.json merged over `defaults`.
+    Results always carry `alert` (bool) and `boxes` (full-resolution
+    [x1, y1, x2, y2] lists), optionally with per-box `confidences` and
+    `track_ids`. `events(result)` turns a result into the structured events
+    the alert engine consumes, with the hysteresis `levels()` of the
+    camera-wide alert. With a camera `roi` the detector only looks at
+    the ROI crop (see ZoneMap), and with a `motion_gate` block it only runs
+    on frames with motion in the ROI plus periodic keyframes (see MotionGate).
+    """
+
+    name = None
+    defaults = {}
+
+    def __init__(self, options=None):
+        self.options = {**self.defaults, **(options or {})}
+        self.camera = self.options.get("camera", "default")  # Metrics label
+        self.controller = AdaptiveController.from_config(self.options)
+        self.zones = ZoneMap.from_options(self.options)
+        self.gate = MotionGate.from_config(self.options)
+
+    def configure(self, options):
+        """Apply a changed config block to the running detector, keeping tracker / background state.
+
+        The latency controller is only rebuilt when its own options changed.
+        """
+        old = self.options
+        self.options = {**self.defaults, **options}
+        self.camera = self.options.get("camera", "default")
+        if any(old.get(key) != self.options.get(key) for key in AdaptiveController.OPTION_KEYS):
+            self.controller = AdaptiveController.from_config(self.options)
+        if any(old.get(key) != self.options.get(key) for key in ZONE_OPTION_KEYS):
+            self.zones = ZoneMap.from_options(self.options)
+        if any(old.get(key) != self.options.get(key) for key in ("motion_gate", "roi")):
+            self.gate = MotionGate.from_config(self.options)
+        self.apply_options()
+
+    def apply_options(self):
+        """Read thresholds / backend from self.options (called on init and on every configure())."""
+
+    def prepare(self, frame):
+        """Crop to the ROI and downscale to the current analysis resolution.
+
+        Returns (small_frame, scale, offset): boxes found on small_frame map
+        back to `frame` by dividing by scale, then adding the (x, y) offset.
+        """
+        if self.zones is None and self.controller is None:
+            return frame, 1.0, (0, 0)
+        with stage_timer("preprocess", self.camera):
+            offset = (0, 0)
+            if self.zones is not None:
+                frame, offset = self.zones.crop(frame)
+            if self.controller is None:
+                return frame, 1.0, offset
+            return (*self.controller.prepare(frame), offset)
+
+    def process(self, frame):
+        raise NotImplementedError
+
+    def events(self, result):
+        """DetectionEvents for the boxes in `result`."""
+        boxes = result["boxes"]
+        confidences = result.get("confidences") or [1.0] * len(boxes)
+        track_ids = result.get("track_ids") or [None] * len(boxes)
+        return [DetectionEvent(self.camera, self.name, conf, box, track_id)
+                for box, conf, track_id in zip(boxes, confidences, track_ids)]
+
+    def levels(self):
+        """Hysteresis levels for the camera-wide alert, or None for the alert engine's configured ones."""
+        return None
+
+    def zone_events(self, result):
+        """(zone, hysteresis levels, events) for every zone with its own alert threshold."""
+        return []
+
+    def maybe_process(self, frame):
+        """Process `frame` unless the motion gate or the latency budget says to skip it (then returns None)."""
+        if self.gate is not None:
+            with stage_timer("gate", self.camera):
+                moving = self.gate.check(frame)
+            if not moving:
+                metrics.inc("vision_gate_skipped_total", camera=self.camera, detector=self.name)
+                return None
+        if self.controller is not None and not self.controller.should_process():
+            return None
+        started = time.perf_counter()
+        result = self.process(frame)
+        if self.controller is not None:
+            self.controller.update((time.perf_counter() - started) * 1000)
+        return result
+
+
+class CrowdDetector(Detector):
+    """Counts and tracks people (YOLOv8 by default); alerts at `crowd_threshold` people.
+
+    The camera-wide alert clears at `crowd_exit` people (default threshold - 2).
+
+    Track ids feed a TrackTable, which adds unique-person counts over the
+    `count_windows` (seconds), dwell times and, with a `count_line` (frame
+    fractions), entry / exit counts to every result. With camera `zones` results also carry
+    per-zone counts, the zones of every box and a `density` grid, and zones
+    with their own `crowd_threshold` (optionally `crowd_exit`) raise their
+    own alerts.
+    """
+
+    name = "crowd"
+    defaults = {"backend": "yolo", "model_path": "yolov8n.pt", "conf": 0.5, "crowd_threshold": 5, "frame_rate": 30,
+                "count_windows": [60, 300], "count_line": None}
+
+    def __init__(self, options=None):
+        super().__init__(options)
+        from detection.inference import create_tracker  # Needs ultralytics
+        self.tracker = create_tracker(self.options["frame_rate"])
+        self.tracks = TrackTable(self.options["count_windows"], self.options["count_line"])
+        self.apply_options()
+
+    def apply_options(self):
+        self.backend = get_backend(self.options)  # Shared instance, only a new one if the model changed
+        self.crowd_threshold = self.options["crowd_threshold"]
+        self.tracks.configure(self.options["count_windows"], self.options["count_line"])
+
+    def process(self, frame):
+        small, scale, offset = self.prepare(frame)
+        with stage_timer("inference", self.camera):
+            detections = self.backend.infer(small, scale).shift(offset)
+        with stage_timer("postprocess", self.camera):
+            persons = detections[detections.cls == self.backend.person_class]
+            tracks = self.tracker.update(persons, frame)  # Rows: x1, y1, x2, y2, track_id, score, cls, idx
+            ids = np.full(len(persons), -1, np.int64)  # Per box; -1 until the tracker confirms it
+            if len(tracks):
+                ids[tracks[:, 7].astype(int)] = tracks[:, 4]
+            now = time.monotonic()
+            dwell = self.tracks.update(ids, persons.xyxy, now, frame.shape[1::-1])
+            counts = self.tracks.summary(now)
+
+        person_boxes = persons.xyxy.astype(int).tolist()
+        result = {
+            "person_count": len(person_boxes),
+            "boxes": person_boxes,
+            "confidences": persons.conf.round(3).tolist(),
+            "track_ids": [None if i < 0 else i for i in ids.tolist()],
+            "dwell": dwell,
+            "counts": counts,
+            "alert": len(person_boxes) >= self.crowd_threshold,
+        }
+        if self.zones is not None:
+            with stage_timer("postprocess", self.camera):
+                members = self.zones.members(persons.xyxy, frame.shape)
+                zone_counts = members.sum(axis=0).tolist()
+                result["zones"] = dict(zip(self.zones.names, zone_counts))
+                result["box_zones"] = [np.flatnonzero(row).tolist() for row in members]  # Zone indexes per box
+                result["density"] = self.zones.density(persons.xyxy, frame.shape)
+                over = [i for i, threshold in self.zones.thresholds("crowd_threshold").items()
+                        if zone_counts[i] >= threshold]
+                result["zone_alerts"] = [self.zones.names[i] for i in over]
+                result["alert"] = result["alert"] or bool(over)
+        return result
+
+    def levels(self):
+        """This camera's own threshold, so the alarm agrees with result["alert"]."""
+        return {"enter": self.crowd_threshold,
+                "exit": self.options.get("crowd_exit", max(0, self.crowd_threshold - 2))}
+
+    def zone_events(self, result):
+        """Per-zone crowd levels for zones with a crowd_threshold (exit level defaults to threshold - 2)."""
+        if self.zones is None:
+            return []
+        events = self.events(result)
+        zone_events = []
+        for i, enter in self.zones.thresholds("crowd_threshold").items():
+            exit = self.zones.zones[i].get("crowd_exit", max(0, enter - 2))
+            inside = [event for event, zones in zip(events, result["box_zones"]) if i in zones]
+            zone_events.append((self.zones.names[i], {"enter": enter, "exit": exit}, inside))
+        return zone_events
+
+
+class WeaponDetector(Detector):
+    """Weapon detection (Haar cascade by default) on the downscaled frame."""
+
+    name = "weapon"
+    defaults = {"backend": "haar", "cascade_path": "detection/cascade.xml", "min_size": 60,
+                "target_latency_ms": 50, "max_skip": 2}
+
+    def __init__(self, options=None):
+        super().__init__(options)
+        self.apply_options()
+
+    def apply_options(self):
+        self.backend = get_backend(self.options)
+
+    def process(self, frame):
+        small, scale, offset = self.prepare(frame)
+        with stage_timer("inference", self.camera):
+            guns = self.backend.infer(small, scale).shift(offset)
+        return {
+            "weapon_count": len(guns),
+            "boxes": guns.xyxy.astype(int).tolist(),
+            "confidences": guns.conf.round(3).tolist(),
+            "alert": len(guns) > 0,
+        }
+
+
+class MotionDetector(Detector):
+    """Alerts when a tracked moving object covers more than `speed_threshold` px over its history."""
+
+    defaults = {"motion_method": RUNNING_AVERAGE, "min_area": 5000, "speed_threshold": 50,
+                "target_latency_ms": 30, "analysis_width": 640}
+
+    def __init__(self, options=None):
+        super().__init__(options)
+        self.motion = MotionEngine(self.options["motion_method"], min_area=self.options["min_area"])
+        self.tracker = CentroidTracker(history=10)  # Per-object movement over the last 10 frames
+        self.apply_options()
+
+    def apply_options(self):
+        if self.options["motion_method"] != self.motion.method:
+            self.motion = MotionEngine(self.options["motion_method"], min_area=self.options["min_area"])
+        self.motion.min_area = self.options["min_area"]
+        self.speed_threshold = self.options["speed_threshold"]
+
+    def process(self, frame):
+        small, scale, offset = self.prepare(frame)
+        with stage_timer("inference", self.camera):
+            blobs = self.motion.apply(small, scale)
+            blobs[:, :2] += offset
+        with stage_timer("postprocess", self.camera):
+            tracks = self.tracker.update(blobs)
+        fast = [track for track in tracks if track["speed"] > self.speed_threshold]
+        return {
+            "boxes": [[x, y, x + w, y + h] for x, y, w, h in (track["box"] for track in tracks)],
+            "tracks": tracks,
+            "fast_tracks": [track["id"] for track in fast],
+            "motion_energy": self.motion.energy,
+            "alert": bool(fast),
+        }
+
+    def events(self, result):
+        """Only the fast-moving tracks are events."""
+        return [DetectionEvent(self.camera, self.name, 1.0, [x, y, x + w, y + h], track["id"])
+                for track in result["tracks"] if track["speed"] > self.speed_threshold
+                for x, y, w, h in [track["box"]]]
+
+
+class SecurityDetector(MotionDetector):
+    """Sudden, attack-like movement."""
+
+    name = "security"
+
+
+class AccidentDetector(MotionDetector):
+    """Large objects moving fast (vehicle collisions)."""
+
+    name = "accident"
+    defaults = {**MotionDetector.defaults, "min_area": 8000, "speed_threshold": 30}
+
+
+# Detector name -> core class
+DETECTORS = {cls.name: cls for cls in (CrowdDetector, WeaponDetector, SecurityDetector, AccidentDetector)}
+
+
+def create_detector(name, options=None):
+    """Build the detector core `name` from its config block."""
+    if name not in DETECTORS:
+        raise ValueError(f"Unknown detector: {name} (available: {', '.join(sorted(DETECTORS))})")
+    return DETECTORS[name](options)
@@ -0,0 +1,227 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import settings
+from detection import metrics
+
+# Defaults for the process-wide store, overridable in the "event_store" block of config.json
+STORE_DEFAULTS = {"path": "data/events.db", "max_size_mb": None, "retention_days": 30, "batch_size": 200,
+                  "flush_interval": 1.0}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    ts REAL NOT NULL,
+    camera TEXT NOT NULL,
+    type TEXT NOT NULL,
+    state TEXT,
+    confidence REAL,
+    count INTEGER,
+    message TEXT,
+    data TEXT
+);
+CREATE INDEX IF NOT EXISTS events_ts ON events (ts);
+CREATE INDEX IF NOT EXISTS events_camera ON events (camera, id);
+CREATE INDEX IF NOT EXISTS events_type ON events (type, id);
+"""
+
+# Columns stored as-is; everything else in an event goes into the JSON `data` column
+COLUMNS = ("ts", "camera", "type", "state", "confidence", "count", "message")
+
+
+class EventStore:
+    """Append-only detection event log in SQLite (WAL mode).
+
+    `add()` only appends to an in-memory batch; a writer thread inserts
+    batches in one transaction every `flush_interval` seconds (or once
+    `batch_size` events are pending). Queries use the (ts), (camera, id) and
+    (type, id) indexes and page newest-first with an id cursor, so a page
+    costs the same no matter how large the log grows. The known cameras and
+    types are cached and kept up to date by `flush()`. The database is kept
+    under `max_size_mb` and `retention_days` by deleting the oldest events.
+    """
+
+    def __init__(self, path="data/events.db", max_size_mb=None, retention_days=30, batch_size=200,
+                 flush_interval=1.0):
+        self.path = path
+        self.max_size_mb = max_size_mb
+        self.retention_days = retention_days
+        self.batch_size = max(1, int(batch_size))
+        self.flush_interval = flush_interval
+        self.inserted = 0
+        self.rotated = 0
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._write_conn = self._connect(new_file=not os.path.exists(path))
+        self._write_conn.executescript(SCHEMA)
+        self._read_conn = self._connect()
+        self._read_lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._pending = []
+        self._known = None  # {"camera": set, "type": set}, loaded on the first distinct()
+        self._cond = threading.Condition()
+        self._thread = threading.Thread(target=self._run, name="event-store", daemon=True)
+        self._thread.start()
+
+    def _connect(self, new_file=False):
+        conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        if new_file:
+            conn.execute("PRAGMA auto_vacuum = INCREMENTAL")  # Must precede WAL mode and the first table
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute("PRAGMA synchronous = NORMAL")  # Safe with WAL, no fsync per transaction
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def add(self, event):
+        """Queue one event dict (needs camera and type; ts defaults to now). Never blocks on disk."""
+        row = [event.get("timestamp", event.get("ts")) or time.time()]
+        row += [event.get(column) for column in COLUMNS[1:]]
+        extra = {k: v for k, v in event.items() if k not in COLUMNS and k != "timestamp"}
+        row.append(json.dumps(extra, default=str) if extra else None)
+        with self._cond:
+            self._pending.append(row)
+            if len(self._pending) >= self.batch_size:
+                self._cond.notify()
+
+    def flush(self):
+        """Write pending events now (from the calling thread)."""
+        with self._cond:
+            batch, self._pending = self._pending, []
+        if not batch:
+            return
+        with metrics.stage_timer("event_store", "all"):
+            with self._write_lock:  # The write connection is also used by enforce_limits()
+                conn = self._write_conn
+                conn.execute("BEGIN")
+                conn.executemany(f"INSERT INTO events ({', '.join(COLUMNS)}, data) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                                 batch)
+                conn.execute("COMMIT")
+        with self._read_lock:
+            if self._known is not None:
+                self._known["camera"].update(row[1] for row in batch)
+                self._known["type"].update(row[2] for row in batch)
+        self.inserted += len(batch)
+        metrics.inc("vision_events_stored_total", len(batch))
+
+    def _run(self):
+        last_rotation = 0.0
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: len(self._pending) >= self.batch_size, self.flush_interval)
+            try:
+                self.flush()
+                if time.monotonic() - last_rotation > 60:
+                    last_rotation = time.monotonic()
+                    self.enforce_limits()
+            except sqlite3.Error as e:
+                print(f"⚠ Event store write failed: {e}")
+
+    def size_mb(self):
+        """Database file plus write-ahead log on disk."""
+        size = 0
+        for suffix in ("", "-wal"):
+            try:
+                size += os.path.getsize(self.path + suffix)
+            except OSError:
+                pass
+        return size / (1024 * 1024)
+
+    def _used_mb(self, conn):
+        """Pages holding data (excludes free pages not yet returned by incremental_vacuum)."""
+        page_size, page_count, free = (conn.execute(f"PRAGMA {name}").fetchone()[0]
+                                       for name in ("page_size", "page_count", "freelist_count"))
+        return (page_count - free) * page_size / (1024 * 1024)
+
+    def enforce_limits(self):
+        """Delete events older than retention_days, then the oldest ones until under max_size_mb."""
+        with self._write_lock:
+            conn = self._write_conn
+            rotated = self.rotated
+            if self.retention_days:
+                cur = conn.execute("DELETE FROM events WHERE ts < ?", (time.time() - self.retention_days * 86400,))
+                self.rotated += cur.rowcount
+            if self.max_size_mb:
+                while self._used_mb(conn) > self.max_size_mb:
+                    # Drop the oldest 10% per round
+                    count = conn.execute("SELECT COUNT(*) FROM events").fetchone()[0]
+                    if not count:
+                        break
+                    cur = conn.execute("DELETE FROM events WHERE id IN (SELECT id FROM events ORDER BY id LIMIT ?)",
+                                       (max(1, count // 10),))
+                    self.rotated += cur.rowcount
+            conn.executescript("PRAGMA incremental_vacuum;")  # Give freed pages back (executescript steps until done)
+            conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        if self.rotated != rotated:
+            with self._read_lock:
+                self._known = None  # A camera or type may be gone, reload on the next distinct()
+
+    def query(self, start=None, end=None, camera=None, type=None, state=None, cursor=None, limit=50):
+        """Newest-first page of events matching the filters.
+
+        Returns (events, next_cursor); pass next_cursor back to get the
+        following (older) page, it is None on the last page.
+        """
+        clauses, params = [], []
+        for column, value in (("camera", camera), ("type", type), ("state", state)):
+            if value:
+                clauses.append(f"{column} = ?")
+                params.append(value)
+        if start is not None:
+            clauses.append("ts >= ?")
+            params.append(start)
+        if end is not None:
+            clauses.append("ts < ?")
+            params.append(end)
+        if cursor is not None:
+            clauses.append("id < ?")
+            params.append(int(cursor))
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        limit = max(1, min(int(limit), 500))
+
+        with self._read_lock:
+            rows = self._read_conn.execute(f"SELECT * FROM events {where} ORDER BY id DESC LIMIT ?",
+                                           params + [limit + 1]).fetchall()
+        events = [self._to_event(row) for row in rows[:limit]]
+        next_cursor = events[-1]["id"] if len(rows) > limit else None
+        return events, next_cursor
+
+    def distinct(self, column):
+        """Known cameras or types, for filter drop-downs (cached, no query per call)."""
+        if column not in ("camera", "type"):
+            raise ValueError(column)
+        with self._read_lock:
+            if self._known is None:
+                self._known = {name: {row[0] for row in self._read_conn.execute(f"SELECT DISTINCT {name} FROM events")}
+                               for name in ("camera", "type")}
+            return sorted(self._known[column])
+
+    @staticmethod
+    def _to_event(row):
+        event = {key: row[key] for key in ("id",) + COLUMNS}
+        if row["data"]:
+            event.update(json.loads(row["data"]))
+        return event
+
+    def stats(self):
+        with self._cond:
+            pending = len(self._pending)
+        return {"path": self.path, "size_mb": round(self.size_mb(), 3), "max_size_mb": self.max_size_mb,
+                "inserted": self.inserted, "rotated": self.rotated, "pending": pending}
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_event_store():
+    """The process-wide store, configured from "event_store"; its cap is its share of storage_limit by default."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            config = settings.CONFIG
+            options = {k: config.get("event_store", {}).get(k, v) for k, v in STORE_DEFAULTS.items()}
+            options["max_size_mb"] = settings.storage_budget(config)[1]
+            _store = EventStore(**options)
+        return _store
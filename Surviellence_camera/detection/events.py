@@ -0,0 +1,305 @@
+import asyncio
+import json
+import threading
+import time
+import uuid
+from collections import deque
+import settings
+from detection import metrics
+
+# Defaults for the process-wide bus, overridable in the "events" block of config.json
+EVENT_DEFAULTS = {"queue_size": 1000, "max_batch": 50, "heartbeat": 5.0, "max_backoff": 30.0}
+
+# Tags the MQTT batches this process publishes, so its own subscriber can tell them apart
+NODE_ID = uuid.uuid4().hex[:12]
+
+
+class Sink:
+    """One long-lived outbound connection owned by the EventBus loop.
+
+    Subclasses implement `connect()` and `send(messages)` as coroutines and
+    raise on failure; the bus then reconnects with exponential backoff.
+    Messages wait in a bounded per-sink queue, oldest dropped first. With
+    `alerts_only` the sink only receives alert-engine alerts, not status updates.
+    """
+
+    name = None
+
+    def __init__(self, queue_size=1000, alerts_only=False):
+        self.queue = deque(maxlen=queue_size)
+        self.alerts_only = alerts_only
+        self.connected = False
+        self.sent = 0
+        self.dropped = 0
+        self.reconnects = 0
+        self.last_error = None
+
+    async def connect(self):
+        self.connected = True
+
+    async def close(self):
+        self.connected = False
+
+    async def send(self, messages):
+        raise NotImplementedError
+
+    def stats(self):
+        return {"sink": self.name, "connected": self.connected, "queued": len(self.queue), "sent": self.sent,
+                "dropped": self.dropped, "reconnects": self.reconnects, "last_error": self.last_error}
+
+
+class WebSocketSink(Sink):
+    """Persistent `websockets` client. A batch of several events goes out as one {"events": [...]} frame."""
+
+    name = "websocket"
+
+    def __init__(self, url="ws://localhost:8765", **options):
+        super().__init__(**options)
+        self.url = url
+        self.ws = None
+
+    async def connect(self):
+        import websockets  # Only needed when this sink is configured
+        self.ws = await websockets.connect(self.url)
+        self.connected = True
+
+    async def close(self):
+        if self.ws is not None:
+            await self.ws.close()
+        self.ws = None
+        self.connected = False
+
+    async def send(self, messages):
+        payload = messages[0] if len(messages) == 1 else {"events": messages}
+        await self.ws.send(json.dumps(payload))
+
+
+class SocketIOSink(Sink):
+    """Emits on the Flask-SocketIO server under the names the dashboard listens to.
+
+    Alerts go out as "mqtt_alert", everything else as "detection_result"; both
+    carry a readable `message` (the alert text, or the event itself for status lines).
+    """
+
+    name = "socketio"
+
+    def __init__(self, socketio, **options):
+        super().__init__(**options)
+        self.socketio = socketio
+
+    async def send(self, messages):
+        for message in messages:
+            name = "mqtt_alert" if message.get("kind") == "alert" else "detection_result"
+            self.socketio.emit(name, {**message, "message": message.get("message") or message["event"]})
+
+
+class MQTTSink(Sink):
+    """Publishes through the shared MQTT client (which buffers to disk while offline).
+
+    A batch is one {"origin": NODE_ID, "events": [...]} object on `topic`
+    (default MQTT_TOPIC).
+    """
+
+    name = "mqtt"
+
+    def __init__(self, topic=None, qos=None, **options):
+        super().__init__(**options)
+        self.topic = topic
+        self.qos = qos
+
+    async def send(self, messages):
+        from detection.mqtt_client import get_mqtt_client
+        get_mqtt_client().publish(json.dumps({"origin": NODE_ID, "events": messages}), topic=self.topic,
+                                  qos=self.qos)
+
+
+class EventBus:
+    """Non-blocking fan-out of detector events to persistent sinks.
+
+    `publish()` only appends to each sink's bounded queue, so detector loops
+    never wait on the network. A dedicated thread runs one asyncio loop with a
+    task per sink that drains up to `max_batch` events at a time over a single
+    connection and reconnects with exponential backoff when it drops.
+
+    Status updates published with a `key` are coalesced: an update identical to
+    the last one for that key is skipped unless `heartbeat` seconds passed.
+    """
+
+    def __init__(self, queue_size=1000, max_batch=50, heartbeat=5.0, max_backoff=30.0):
+        self.queue_size = int(queue_size)
+        self.max_batch = max(1, int(max_batch))
+        self.heartbeat = heartbeat
+        self.max_backoff = max_backoff
+        self.sinks = []
+        self.published = 0
+        self.coalesced = 0
+        self.loop = None
+        self._last = {}  # Coalescing key -> (message, sent_at)
+        self._lock = threading.Lock()
+        self._wakeups = {}  # Sink -> asyncio.Event
+        self._thread = None
+        self._ready = threading.Event()
+
+    def add_sink(self, sink):
+        """Attach a sink (before or after start)."""
+        if sink.queue.maxlen != self.queue_size:
+            sink.queue = deque(sink.queue, maxlen=self.queue_size)
+        with self._lock:
+            self.sinks.append(sink)
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self._start_sink, sink)
+        return sink
+
+    def start(self):
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name="event-bus", daemon=True)
+            self._thread.start()
+        self._ready.wait(5)
+
+    def stop(self, timeout=5):
+        if self.loop is None:
+            return
+        for sink in list(self.sinks):
+            asyncio.run_coroutine_threadsafe(sink.close(), self.loop)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join(timeout)
+        self._thread = None
+        self.loop = None
+
+    def publish(self, event, key=None, **data):
+        """Queue `{"event": event, **data}` for every sink. Never blocks; returns False if coalesced."""
+        message = {"event": event, **data}
+        now = time.time()
+        if key is not None:
+            with self._lock:
+                last = self._last.get(key)
+                if last is not None and last[0] == message and now - last[1] < self.heartbeat:
+                    self.coalesced += 1
+                    metrics.inc("vision_events_coalesced_total")
+                    return False
+                self._last[key] = (dict(message), now)
+        message.setdefault("timestamp", now)  # Alerts keep their frame time
+
+        if self._thread is None:
+            self.start()
+        self.published += 1
+        metrics.inc("vision_events_published_total")
+        for sink in list(self.sinks):
+            if sink.alerts_only and message.get("kind") != "alert":
+                continue
+            if len(sink.queue) == sink.queue.maxlen:
+                sink.dropped += 1  # Oldest event falls off
+                metrics.inc("vision_events_dropped_total", sink=sink.name)
+            sink.queue.append(message)
+            wakeup = self._wakeups.get(sink)
+            if wakeup is not None and not wakeup.is_set():
+                self.loop.call_soon_threadsafe(wakeup.set)
+        return True
+
+    def _run(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        for sink in list(self.sinks):
+            self._start_sink(sink)
+        self._ready.set()
+        self.loop.run_forever()
+        self.loop.close()
+
+    def _start_sink(self, sink):
+        self._wakeups[sink] = asyncio.Event()
+        self.loop.create_task(self._drain(sink))
+
+    async def _drain(self, sink):
+        wakeup = self._wakeups[sink]
+        backoff = min(1.0, self.max_backoff)
+        while True:
+            while not sink.queue:
+                wakeup.clear()
+                # Re-check after clear(): a publish in between saw the event still set and did not wake us
+                if sink.queue:
+                    break
+                await wakeup.wait()
+            try:
+                if not sink.connected:
+                    await sink.connect()
+                batch = [sink.queue.popleft() for _ in range(min(self.max_batch, len(sink.queue)))]
+                try:
+                    await sink.send(batch)
+                    sink.sent += len(batch)
+                    backoff = min(1.0, self.max_backoff)  # Only a delivered batch proves the sink works
+                except Exception:
+                    sink.queue.extendleft(reversed(batch))  # Retry after reconnecting
+                    raise
+            except Exception as e:
+                sink.last_error = f"{type(e).__name__}: {e}"
+                print(f"⚠ Event sink {sink.name} failed ({sink.last_error}), retrying in {backoff:.0f}s")
+                try:
+                    await sink.close()
+                except Exception:
+                    sink.connected = False
+                sink.reconnects += 1
+                metrics.inc("vision_sink_reconnects_total", sink=sink.name)
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, self.max_backoff)
+
+    def stats(self):
+        return {"published": self.published, "coalesced": self.coalesced,
+                "sinks": [sink.stats() for sink in list(self.sinks)]}
+
+
+# Sink name -> class, for the "events" block in config.json
+SINKS = {cls.name: cls for cls in (WebSocketSink, SocketIOSink, MQTTSink)}
+
+_bus = None
+_bus_lock = threading.Lock()
+
+
+def create_sink(name, **options):
+    if name not in SINKS:
+        raise ValueError(f"Unknown event sink: {name} (available: {', '.join(sorted(SINKS))})")
+    return SINKS[name](**options)
+
+
+def get_event_bus():
+    """The process-wide bus, built from the "events" block of config.json on first use.
+
+    Its thread starts on the first publish. The Socket.IO sink needs the
+    app's SocketIO object, so app.py attaches it itself.
+    """
+    global _bus
+    with _bus_lock:
+        if _bus is None:
+            config = settings.CONFIG.get("events", {})
+            _bus = EventBus(**{k: config.get(k, v) for k, v in EVENT_DEFAULTS.items()})
+            for name, sink_options in config.get("sinks", {}).items():
+                if name != "socketio":
+                    _bus.add_sink(create_sink(name, **sink_options))
+        return _bus
+
+
+def publish(event, key=None, **data):
+    """Shortcut for get_event_bus().publish()."""
+    return get_event_bus().publish(event, key=key, **data)
+
+
+def decode_batch(payload):
+    """Event dicts from an MQTTSink payload; anything else becomes a single alert with the raw text.
+
+    Each event carries the batch's `origin` (None for foreign publishers);
+    compare it with NODE_ID to skip what this process published itself.
+    """
+    try:
+        messages = json.loads(payload)
+    except ValueError:
+        messages = None
+    if isinstance(messages, dict) and isinstance(messages.get("events"), list):
+        origin = messages.get("origin")
+        messages = [{**message, "origin": origin} if isinstance(message, dict) else message
+                    for message in messages["events"]]
+    elif isinstance(messages, dict):
+        messages = [messages]
+    if not isinstance(messages, list) or not all(isinstance(message, dict) for message in messages):
+        return [{"event": payload, "kind": "alert", "message": payload}]
+    return [{**message, "message": message.get("message") or message.get("event")} for message in messages]
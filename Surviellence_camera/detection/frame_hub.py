@@ -0,0 +1,372 @@
+import os
+import threading
+import time
+import cv2
+from detection.frame_source import FrameSource, DROP_OLDEST
+from detection import metrics
+
+# Stream ingestion defaults, overridable in the "ingest" block of config.json and per camera
+INGEST_DEFAULTS = {
+    "open_timeout": 10,  # Seconds to connect before giving up on an attempt
+    "read_timeout": 10,  # Seconds without a packet before the stream counts as lost
+    "rtsp_transport": "tcp",  # "tcp" survives packet loss, "udp" has lower latency
+    "buffer_size": 1024 * 1024,  # FFMPEG receive buffer in bytes
+    "threads": 1,  # Decoder threads per stream (0 = FFMPEG decides)
+    "hw_acceleration": "none",  # "any" uses a hardware decoder when one is available
+    "max_backoff": 60,  # Longest wait between reconnect attempts in seconds
+}
+
+CAPTURE_OPTIONS_ENV = "OPENCV_FFMPEG_CAPTURE_OPTIONS"
+
+
+def source_kind(source):
+    """'device', 'rtsp', 'http' or 'file'."""
+    if isinstance(source, int) or str(source).isdigit():
+        return "device"
+    lowered = str(source).lower()
+    if lowered.startswith(("rtsp:", "rtsps:")):
+        return "rtsp"
+    if lowered.startswith(("http:", "https:")):
+        return "http"
+    return "file"
+
+
+def ffmpeg_capture_options(kind, options):
+    """Value of OPENCV_FFMPEG_CAPTURE_OPTIONS ('key;value|...') for a source of `kind`."""
+    pairs = []
+    if kind == "rtsp":
+        pairs.append(("rtsp_transport", options["rtsp_transport"]))
+    if kind in ("rtsp", "http") and options["buffer_size"]:
+        pairs.append(("buffer_size", int(options["buffer_size"])))
+    return "|".join(f"{key};{value}" for key, value in pairs)
+
+
+def capture_params(options):
+    """cv2.VideoCapture open parameters: timeouts, decoder threads and hardware acceleration."""
+    params = [cv2.CAP_PROP_OPEN_TIMEOUT_MSEC, int(options["open_timeout"] * 1000),
+              cv2.CAP_PROP_READ_TIMEOUT_MSEC, int(options["read_timeout"] * 1000),
+              cv2.CAP_PROP_N_THREADS, int(options["threads"])]
+    if options.get("hw_acceleration") == "any":
+        params += [cv2.CAP_PROP_HW_ACCELERATION, cv2.VIDEO_ACCELERATION_ANY]
+    return params
+
+
+# FFMPEG reads its capture options from a process-wide environment variable when a
+# stream opens. Streams with the same options open concurrently; a stream with
+# different ones waits until those opens have passed that point.
+_env_cond = threading.Condition()
+_env_opening = 0
+
+
+def open_capture(source, options):
+    """cv2.VideoCapture for `source` with the ingest `options`, or None if it did not open."""
+    global _env_opening
+    kind = source_kind(source)
+    if kind == "device":
+        cap = cv2.VideoCapture(int(source))
+        return cap if cap.isOpened() else None
+    value = ffmpeg_capture_options(kind, options)
+    with _env_cond:
+        _env_cond.wait_for(lambda: _env_opening == 0 or os.environ.get(CAPTURE_OPTIONS_ENV, "") == value)
+        if value:
+            os.environ[CAPTURE_OPTIONS_ENV] = value
+        else:
+            os.environ.pop(CAPTURE_OPTIONS_ENV, None)
+        _env_opening += 1
+    try:
+        cap = cv2.VideoCapture(source, cv2.CAP_FFMPEG, capture_params(options))
+    finally:
+        with _env_cond:
+            _env_opening -= 1
+            _env_cond.notify_all()
+    if not cap.isOpened():
+        cap.release()
+        return None
+    return cap
+
+
+class FrameView:
+    """A decoded frame shared by every subscriber of a hub (read-only, never copied)."""
+
+    __slots__ = ("seq", "timestamp", "frame")
+
+    def __init__(self, seq, timestamp, frame):
+        self.seq = seq
+        self.timestamp = timestamp
+        self.frame = frame
+
+
+class Subscription(FrameSource):
+    """Per-detector handle on a CaptureHub.
+
+    By default only the newest frame is kept, so a slow consumer skips frames
+    instead of holding back the decoder or the other detectors. A KEEP_ALL
+    subscription applies backpressure to the hub instead (offline analysis).
+    `read()` mirrors `cv2.VideoCapture.read()` so detection loops need few changes.
+    """
+
+    def __init__(self, hub, name, policy=DROP_OLDEST, maxlen=1):
+        super().__init__(policy, maxlen)
+        self.hub = hub
+        self.name = name
+
+    def get_fps(self):
+        return self.hub.fps
+
+    def release(self):
+        self.hub.unsubscribe(self)
+
+
+class CaptureHub:
+    """Decodes one camera stream once and fans every frame out to all subscribers.
+
+    The hub owns reconnecting: a stream that fails to open, times out or
+    stops delivering is reopened with exponential backoff (1 s doubling up
+    to `max_backoff`), while subscribers stay open and simply wait. Only a
+    file that ends without `loop` closes them. `health()` reports the state
+    ("connecting", "streaming", "reconnecting", "ended" or "stopped"), frame
+    rate and reconnect history, and `stalled()` tells the pipeline watchdog
+    when the decoder thread itself is stuck.
+    """
+
+    def __init__(self, source, name=None, loop=False, options=None):
+        self.source = source
+        self.name = name or str(source)
+        self.loop = loop  # Rewind file sources instead of ending
+        self.options = {**INGEST_DEFAULTS, **(options or {})}
+        self.kind = source_kind(source)
+        self.fps = 0.0
+        self.measured_fps = 0.0
+        self.resolution = None
+        self.seq = 0
+        self.last_frame_time = 0.0  # time.monotonic() of the newest frame
+        self.running = False
+        self.state = "stopped"
+        self.state_since = time.monotonic()
+        self.reconnects = 0
+        self.failures = 0  # Consecutive attempts that did not deliver a frame
+        self.last_error = None
+        self._subscribers = []
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self._cap = None
+
+    def subscribe(self, name="detector", policy=DROP_OLDEST, maxlen=1):
+        sub = Subscription(self, name, policy, maxlen)
+        with self._lock:
+            self._subscribers.append(sub)
+        self.start()
+        return sub
+
+    def unsubscribe(self, sub):
+        with self._lock:
+            if sub in self._subscribers:
+                self._subscribers.remove(sub)
+        sub.close()
+
+    def subscriber_count(self):
+        with self._lock:
+            return len(self._subscribers)
+
+    def start(self):
+        with self._lock:
+            if self.running:
+                return
+            self.running = True
+            self.last_frame_time = time.monotonic()
+            self._wake.clear()
+            self._thread = threading.Thread(target=self._run, name=f"hub-{self.name}", daemon=True)
+            self._thread.start()
+
+    def stop(self, wait=True):
+        self.running = False
+        self._wake.set()  # Interrupts a reconnect backoff
+        self._close_all()  # Also releases a decoder blocked on a KEEP_ALL subscriber
+        if wait and self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout=5)
+
+    def _set_state(self, state, error=None):
+        if state != self.state:
+            self.state = state
+            self.state_since = time.monotonic()
+        if error is not None:
+            self.last_error = error
+
+    def _run(self):
+        backoff = 0.0
+        while self.running:
+            self._set_state("connecting")
+            self._cap = open_capture(self.source, self.options)
+            if self._cap is None:
+                reason = "could not open stream"
+            else:
+                started = time.monotonic()
+                reason = self._read_loop()
+                self._cap.release()
+                self._cap = None
+                if reason is None:
+                    break  # Stopped, or a file ended without loop
+                if time.monotonic() - started >= self.options["max_backoff"]:
+                    backoff = 0.0  # Was healthy for a while, start over at 1 s
+
+            self.failures += 1
+            backoff = min(max(backoff * 2, 1.0), self.options["max_backoff"])
+            self._set_state("reconnecting", reason)
+            print(f"⚠ Camera stream {self.name}: {reason}, reconnecting in {backoff:.0f}s")
+            if self._wake.wait(backoff):
+                break  # stop() during the backoff
+            self.reconnects += 1
+            metrics.inc("vision_reconnects_total", camera=self.name)
+
+        self._set_state("stopped" if self.state != "ended" else "ended")
+        self.running = False
+        self._close_all()
+
+    def _read_loop(self):
+        """Deliver frames until the stream fails; returns the reason, or None when it ended or was stopped."""
+        self.fps = self._cap.get(cv2.CAP_PROP_FPS) or 0.0
+        # Files decode faster than real time; pace them so subscribers see the source rate
+        is_file = self.kind == "file"
+        frame_interval = 1.0 / self.fps if is_file and self.fps > 0 else 0.0
+        next_due = time.monotonic()
+        rate_start, rate_frames = time.monotonic(), 0
+        frames = 0  # Since opening or the last rewind
+
+        while self.running:
+            # grab() pulls the next packet, retrieve() decodes it: timed as separate stages
+            with metrics.stage_timer("capture", self.name):
+                ret = self._cap.grab()
+            if ret:
+                with metrics.stage_timer("decode", self.name):
+                    ret, frame = self._cap.retrieve()
+            if not ret or frame is None:
+                if is_file:
+                    if self.loop and frames:
+                        self._cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+                        frames = 0
+                        continue
+                    self._set_state("ended")
+                    return None
+                return "no frame within the read timeout" if frames else "stream opened but sent no frames"
+
+            if not frames:
+                self._set_state("streaming")
+                self.failures = 0
+                self.resolution = (frame.shape[1], frame.shape[0])
+            frames += 1
+            frame.flags.writeable = False  # Shared by all subscribers, nobody may mutate it
+            self.seq += 1
+            now = time.monotonic()
+            self.last_frame_time = now
+            rate_frames += 1
+            if now - rate_start >= 2.0:
+                self.measured_fps = round(rate_frames / (now - rate_start), 1)
+                rate_start, rate_frames = now, 0
+            metrics.inc("vision_frames_in_total", camera=self.name)
+            view = FrameView(self.seq, time.time(), frame)
+            with self._lock:
+                subs = list(self._subscribers)
+            for sub in subs:
+                sub.put(view)
+
+            if frame_interval:
+                next_due += frame_interval
+                delay = next_due - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                else:
+                    next_due = time.monotonic()
+        return None
+
+    def stalled(self, timeout):
+        """True if the decoder thread made no progress for `timeout` seconds (stuck despite the FFMPEG timeouts)."""
+        now = time.monotonic()
+        if self.state == "streaming":
+            return now - self.last_frame_time > timeout
+        if self.state == "connecting":
+            return now - self.state_since > timeout + self.options["open_timeout"]
+        return False
+
+    def health(self):
+        now = time.monotonic()
+        return {
+            "state": self.state,
+            "kind": self.kind,
+            "since_s": round(now - self.state_since, 1),
+            "frame_age_s": round(now - self.last_frame_time, 1) if self.seq else None,
+            "fps": self.measured_fps,
+            "source_fps": self.fps,
+            "resolution": self.resolution,
+            "frames": self.seq,
+            "reconnects": self.reconnects,
+            "failures": self.failures,
+            "last_error": self.last_error,
+        }
+
+    def _close_all(self):
+        with self._lock:
+            subs = list(self._subscribers)
+        for sub in subs:
+            sub.close()
+
+
+# One hub per source for the whole process
+_hubs = {}
+_hubs_lock = threading.Lock()
+
+
+def get_hub(source, loop=False, name=None, options=None):
+    """Return the shared hub for `source`, creating it on first use (`name` labels its metrics, `options` are ingest options).
+
+    Hubs are keyed by source only, so a later caller asking for a different
+    loop / name / options gets the existing hub unchanged, with a warning.
+    """
+    key = str(source)
+    with _hubs_lock:
+        hub = _hubs.get(key)
+        if hub is None:
+            hub = CaptureHub(source, name=name, loop=loop, options=options)
+            _hubs[key] = hub
+            return hub
+    conflicts = []
+    if loop != hub.loop:
+        conflicts.append(f"loop={loop}")
+    if name is not None and name != hub.name:
+        conflicts.append(f"name={name}")
+    if options is not None and {**INGEST_DEFAULTS, **options} != hub.options:
+        conflicts.append("different ingest options")
+    if conflicts:
+        print(f"⚠ Stream {hub.name} is already open, ignoring {', '.join(conflicts)} for {key}")
+    return hub
+
+
+def open_stream(source, name="detector", loop=False, policy=DROP_OLDEST, maxlen=1):
+    """Subscribe to `source`, which may be a CaptureHub or anything cv2.VideoCapture accepts."""
+    hub = source if isinstance(source, CaptureHub) else get_hub(source, loop=loop)
+    return hub.subscribe(name, policy, maxlen)
+
+
+def release_hub(source, wait=True):
+    """Stop and forget the hub for `source` (wait=False leaves a stuck decoder thread to die on its own)."""
+    with _hubs_lock:
+        hub = _hubs.pop(str(source), None)
+    if hub is not None:
+        hub.stop(wait)
+
+
+def _collect_subscriber_metrics():
+    """Per-subscriber drop counters and queue depth, and whether each stream is up, read at scrape time."""
+    with _hubs_lock:
+        hubs = list(_hubs.values())
+    for hub in hubs:
+        with hub._lock:
+            subs = list(hub._subscribers)
+        for sub in subs:
+            labels = {"camera": hub.name, "consumer": sub.name}
+            yield "vision_frames_dropped_total", "counter", labels, sub.dropped
+            yield "vision_queue_depth", "gauge", labels, sub.pending()
+        yield "vision_stream_up", "gauge", {"camera": hub.name}, int(hub.state == "streaming")
+
+
+metrics.REGISTRY.register_collector(_collect_subscriber_metrics)
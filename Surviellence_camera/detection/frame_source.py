@@ -0,0 +1,101 @@
+import collections
+import threading
+
+# Queueing policies for a FrameSource
+DROP_OLDEST = "drop_oldest"  # Bounded queue, the oldest frame is evicted when full (maxlen=1 = latest frame only)
+KEEP_ALL = "keep_all"  # Bounded queue, the producer waits for room (backpressure, nothing is lost)
+
+
+class FrameSource:
+    """Sequenced frame queue between one producer (decoder) and one consumer (detector).
+
+    `next_frame()` blocks until a frame newer than the last one returned arrives,
+    so a consumer never busy-waits and never processes the same frame twice.
+    Frames are FrameView-like objects with `seq`, `timestamp` and `frame`.
+    """
+
+    def __init__(self, policy=DROP_OLDEST, maxlen=1):
+        if policy not in (DROP_OLDEST, KEEP_ALL):
+            raise ValueError(f"Unknown frame policy: {policy}")
+        self.policy = policy
+        self.maxlen = max(1, int(maxlen))
+        self.received = 0
+        self.delivered = 0
+        self.dropped = 0
+        self.duplicates = 0
+
+        self._queue = collections.deque()
+        self._last_in = 0
+        self._last_out = 0
+        self._closed = False
+        self._cond = threading.Condition()
+
+    def put(self, view, timeout=None):
+        """Producer side. Returns False if the frame was discarded (duplicate, closed or timed out)."""
+        with self._cond:
+            if self._closed:
+                return False
+            if view.seq <= self._last_in:
+                self.duplicates += 1  # Already queued or delivered
+                return False
+            if len(self._queue) >= self.maxlen:
+                if self.policy == KEEP_ALL:
+                    if not self._cond.wait_for(lambda: self._closed or len(self._queue) < self.maxlen, timeout):
+                        self.dropped += 1
+                        return False
+                    if self._closed:
+                        return False
+                else:
+                    self._queue.popleft()
+                    self.dropped += 1
+            self._queue.append(view)
+            self._last_in = view.seq
+            self.received += 1
+            self._cond.notify_all()
+            return True
+
+    def next_frame(self, timeout=None):
+        """Wait up to `timeout` seconds for the next unseen frame. Returns None on timeout or close."""
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._queue or self._closed, timeout):
+                return None
+            if not self._queue:
+                return None
+            view = self._queue.popleft()
+            self._last_out = view.seq
+            self.delivered += 1
+            self._cond.notify_all()  # Room for a waiting KEEP_ALL producer
+            return view
+
+    def read(self, timeout=5.0):
+        """VideoCapture-style read: (ret, frame)."""
+        view = self.next_frame(timeout)
+        if view is None:
+            return False, None
+        return True, view.frame
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def isOpened(self):
+        """True while the producer may still deliver frames (queued frames count too)."""
+        with self._cond:
+            return not self._closed or bool(self._queue)
+
+    def pending(self):
+        with self._cond:
+            return len(self._queue)
+
+    def stats(self):
+        with self._cond:
+            return {
+                "policy": self.policy,
+                "received": self.received,
+                "delivered": self.delivered,
+                "dropped": self.dropped,
+                "duplicates": self.duplicates,
+                "queued": len(self._queue),
+                "last_seq": self._last_out,
+            }
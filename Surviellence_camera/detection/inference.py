@@ -0,0 +1,145 @@
+import threading
+import time
+from concurrent.futures import Future
+
+# Defaults for services created by get_inference_service(), see configure_inference()
+BATCH_DEFAULTS = {"max_batch": 8, "max_wait_ms": 10, "device": "cpu"}
+
+
+class InferenceService:
+    """One YOLO model per process, shared by every camera.
+
+    Callers submit single frames from any thread; a batching thread groups
+    them into micro-batches of up to `max_batch` frames, waiting at most
+    `max_wait_ms` after the first frame arrives, and runs one forward pass per
+    batch. Each caller gets its own `ultralytics` Results object back.
+    """
+
+    def __init__(self, model_path="yolov8n.pt", max_batch=8, max_wait_ms=10, device="cpu"):
+        self.model_path = model_path
+        self.max_batch = max(1, int(max_batch))
+        self.max_wait = max_wait_ms / 1000.0
+        self.device = device
+        self.model = None
+        self.batches = 0
+        self.frames = 0
+
+        self._pending = []
+        self._cond = threading.Condition()
+        self._running = False
+        self._thread = None
+
+    def load(self):
+        """Load the model (once) and start the batching thread."""
+        with self._cond:
+            if self._running:
+                return
+            from ultralytics import YOLO  # Heavy import, only when a detector needs it
+            self.model = YOLO(self.model_path).to(self.device)
+            self._running = True
+            self._thread = threading.Thread(target=self._run, name=f"inference-{self.model_path}", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+
+    def submit(self, frame, conf=0.5):
+        """Queue one frame, returns a Future resolving to its Results."""
+        self.load()
+        future = Future()
+        with self._cond:
+            self._pending.append((frame, conf, future))
+            self._cond.notify()
+        return future
+
+    def infer(self, frame, conf=0.5, timeout=30):
+        """Blocking single-frame inference through the shared batcher."""
+        return self.submit(frame, conf).result(timeout)
+
+    def _next_batch(self):
+        with self._cond:
+            self._cond.wait_for(lambda: self._pending or not self._running)
+            if not self._running:
+                return []
+            # Give other cameras a moment to join this batch
+            deadline = time.monotonic() + self.max_wait
+            while len(self._pending) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not self._running:
+                    break
+                self._cond.wait(remaining)
+            batch = self._pending[:self.max_batch]
+            del self._pending[:self.max_batch]
+            return batch
+
+    def _run(self):
+        import torch
+
+        while self._running:
+            batch = self._next_batch()
+            if not batch:
+                continue
+            frames = [frame for frame, _, _ in batch]
+            conf = min(c for _, c, _ in batch)  # One pass per batch, callers filter higher thresholds
+            try:
+                with torch.no_grad():
+                    results = self.model.predict(frames, conf=conf, verbose=False)
+            except Exception as e:
+                for _, _, future in batch:
+                    future.set_exception(e)
+                continue
+
+            self.batches += 1
+            self.frames += len(batch)
+            for (_, c, future), result in zip(batch, results):
+                if c > conf:
+                    result = result[result.boxes.conf >= c]
+                future.set_result(result)
+
+        # Wake anyone still waiting on a stopped service
+        with self._cond:
+            pending, self._pending = self._pending, []
+        for _, _, future in pending:
+            future.set_exception(RuntimeError("Inference service stopped"))
+
+    def stats(self):
+        return {
+            "model": self.model_path,
+            "loaded": self.model is not None,
+            "batches": self.batches,
+            "frames": self.frames,
+            "avg_batch": self.frames / self.batches if self.batches else 0.0,
+        }
+
+
+_services = {}
+_services_lock = threading.Lock()
+
+
+def configure_inference(**options):
+    """Override batching defaults (max_batch, max_wait_ms, device) for services created later."""
+    BATCH_DEFAULTS.update({k: v for k, v in options.items() if k in BATCH_DEFAULTS})
+
+
+def get_inference_service(model_path="yolov8n.pt"):
+    """Return the process-wide service for `model_path` (the weights are loaded once)."""
+    with _services_lock:
+        service = _services.get(model_path)
+        if service is None:
+            service = InferenceService(model_path, **BATCH_DEFAULTS)
+            _services[model_path] = service
+        return service
+
+
+def create_tracker(frame_rate=30, tracker_cfg="bytetrack.yaml"):
+    """Per-camera ByteTrack instance, fed with detections from the shared service."""
+    from ultralytics.trackers.byte_tracker import BYTETracker
+    from ultralytics.utils import IterableSimpleNamespace, yaml_load
+    from ultralytics.utils.checks import check_yaml
+
+    args = IterableSimpleNamespace(**yaml_load(check_yaml(tracker_cfg)))
+    return BYTETracker(args=args, frame_rate=frame_rate)
@@ -0,0 +1,195 @@
+import bisect
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# Stage latency buckets in seconds (1 ms .. 5 s)
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+HELP = {
+    "vision_stage_duration_seconds": "Time spent per pipeline stage",
+    "vision_frames_in_total": "Frames decoded from the camera",
+    "vision_frames_dropped_total": "Frames dropped before a detector saw them",
+    "vision_queue_depth": "Frames waiting for a detector",
+    "vision_alerts_total": "Alerts fired",
+    "vision_alert_latency_seconds": "Time from decoding a frame to firing the alert it raised",
+    "vision_alerts_suppressed_total": "Detections merged into a pending alert by cooldown or hysteresis",
+    "vision_reconnects_total": "Camera stream reconnects",
+    "vision_stream_up": "1 while the camera stream delivers frames, 0 while connecting or reconnecting",
+    "vision_gate_skipped_total": "Frames a detector skipped because the motion gate saw no motion",
+    "vision_events_published_total": "Events queued on the event bus",
+    "vision_events_coalesced_total": "Unchanged status updates skipped by the event bus",
+    "vision_events_dropped_total": "Events dropped from a full sink queue",
+    "vision_sink_reconnects_total": "Event sink reconnect attempts",
+    "vision_events_stored_total": "Events written to the event store",
+    "vision_clips_written_total": "Alert clips written to disk",
+    "vision_clips_evicted_total": "Oldest clips deleted to stay under the storage limit",
+    "vision_mqtt_messages_total": "MQTT messages by delivery path (published, buffered, flushed)",
+    "vision_mqtt_disconnects_total": "Unexpected MQTT broker disconnects",
+}
+
+
+class Histogram:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # Last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class MetricsRegistry:
+    """In-process counters, gauges and histograms rendered in Prometheus text format.
+
+    Cheap enough to leave on: an observation is one dict lookup, a bisect and
+    a few additions under a lock.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._gauges = {}
+        self._histograms = {}
+        self._collectors = []
+        self._snapshot_thread = None
+
+    @staticmethod
+    def _key(name, labels):
+        return name, tuple(sorted(labels.items()))
+
+    def inc(self, name, value=1, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def set_gauge(self, name, value, **labels):
+        with self._lock:
+            self._gauges[self._key(name, labels)] = value
+
+    def observe(self, name, value, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+            histogram.observe(value)
+
+    @contextmanager
+    def timer(self, stage, camera="default"):
+        """Time a block into vision_stage_duration_seconds{camera, stage}."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe("vision_stage_duration_seconds", time.perf_counter() - started, camera=camera, stage=stage)
+
+    def register_collector(self, collector):
+        """`collector()` returns (name, kind, labels, value) samples computed at scrape time."""
+        self._collectors.append(collector)
+
+    def _samples(self):
+        with self._lock:
+            counters = dict(self._counters)
+            gauges = dict(self._gauges)
+            histograms = {key: (list(h.counts), h.sum, h.count, h.buckets) for key, h in self._histograms.items()}
+        for collector in list(self._collectors):
+            try:
+                for name, kind, labels, value in collector():
+                    target = counters if kind == "counter" else gauges
+                    key = self._key(name, labels)
+                    target[key] = target.get(key, 0) + value
+            except Exception as e:
+                print(f"⚠ Metrics collector failed: {e}")
+        return counters, gauges, histograms
+
+    def render(self):
+        """Prometheus text exposition format (version 0.0.4)."""
+        counters, gauges, histograms = self._samples()
+        lines = []
+
+        def header(name, kind, seen):
+            if name not in seen:
+                seen.add(name)
+                lines.append(f"# HELP {name} {HELP.get(name, name)}")
+                lines.append(f"# TYPE {name} {kind}")
+
+        def fmt(labels, extra=()):
+            pairs = list(labels) + list(extra)
+            if not pairs:
+                return ""
+            return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+        seen = set()
+        for (name, labels), value in sorted(counters.items()):
+            header(name, "counter", seen)
+            lines.append(f"{name}{fmt(labels)} {value}")
+        for (name, labels), value in sorted(gauges.items()):
+            header(name, "gauge", seen)
+            lines.append(f"{name}{fmt(labels)} {value}")
+        for (name, labels), (counts, total, count, buckets) in sorted(histograms.items()):
+            header(name, "histogram", seen)
+            cumulative = 0
+            for bound, bucket_count in zip(list(buckets) + ["+Inf"], counts):
+                cumulative += bucket_count
+                lines.append(f"{name}_bucket{fmt(labels, [('le', bound)])} {cumulative}")
+            lines.append(f"{name}_sum{fmt(labels)} {total}")
+            lines.append(f"{name}_count{fmt(labels)} {count}")
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self):
+        """JSON-friendly copy of every metric."""
+        counters, gauges, histograms = self._samples()
+
+        def label_str(labels):
+            return ",".join(f"{k}={v}" for k, v in labels)
+
+        return {
+            "timestamp": time.time(),
+            "counters": [{"name": n, "labels": label_str(l), "value": v} for (n, l), v in sorted(counters.items())],
+            "gauges": [{"name": n, "labels": label_str(l), "value": v} for (n, l), v in sorted(gauges.items())],
+            "histograms": [
+                {"name": n, "labels": label_str(l), "count": c, "sum": s,
+                 "buckets": dict(zip([str(b) for b in buckets] + ["+Inf"], counts))}
+                for (n, l), (counts, s, c, buckets) in sorted(histograms.items())
+            ],
+        }
+
+    def start_snapshots(self, path, interval=60):
+        """Periodically write snapshot() to `path` (atomically replaced) from a daemon thread."""
+        if self._snapshot_thread is not None or not path or interval <= 0:
+            return
+
+        def run():
+            while True:
+                time.sleep(interval)
+                try:
+                    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+                    tmp_path = path + ".tmp"
+                    with open(tmp_path, "w") as f:
+                        json.dump(self.snapshot(), f)
+                    os.replace(tmp_path, path)
+                except OSError as e:
+                    print(f"⚠ Could not write metrics snapshot: {e}")
+
+        self._snapshot_thread = threading.Thread(target=run, name="metrics-snapshot", daemon=True)
+        self._snapshot_thread.start()
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+# Process-wide registry used by all detection modules
+REGISTRY = MetricsRegistry()
+inc = REGISTRY.inc
+set_gauge = REGISTRY.set_gauge
+observe = REGISTRY.observe
+stage_timer = REGISTRY.timer
@@ -0,0 +1,262 @@
+import time
+import cv2
+import numpy as np
+from detection.zones import to_pixels
+
+RUNNING_AVERAGE = "running_average"
+MOG2 = "mog2"
+
+
+class MotionEngine:
+    """Incremental background model shared by the security and accident detectors.
+
+    Works on an already downscaled frame (see AdaptiveController.prepare) and
+    reuses preallocated buffers, so the steady state allocates nothing but the
+    contour list. `apply()` returns moving blobs in full-resolution coordinates.
+    """
+
+    def __init__(self, method=RUNNING_AVERAGE, alpha=0.05, threshold=25, min_area=5000,
+                 blur=5, dilate_iterations=2):
+        if method not in (RUNNING_AVERAGE, MOG2):
+            raise ValueError(f"Unknown motion method: {method}")
+        self.method = method
+        self.alpha = alpha  # Background learning rate
+        self.threshold = threshold
+        self.min_area = min_area  # In full-resolution pixels
+        self.blur = (blur, blur)
+        self.dilate_iterations = dilate_iterations
+        self.kernel = np.ones((5, 5), np.uint8)
+        self.energy = 0.0  # Fraction of moving pixels in the last frame
+        self.mask = None
+        self._shape = None
+        self._subtractor = None
+
+    def _allocate(self, shape):
+        h, w = shape[:2]
+        self._shape = shape
+        self._gray = np.empty((h, w), np.uint8)
+        self._blurred = np.empty((h, w), np.uint8)
+        self._diff = np.empty((h, w), np.uint8)
+        self._thresh = np.empty((h, w), np.uint8)
+        self.mask = np.empty((h, w), np.uint8)
+        self._background = None
+        self._background8 = np.empty((h, w), np.uint8)
+        if self.method == MOG2:
+            self._subtractor = cv2.createBackgroundSubtractorMOG2(history=500, varThreshold=16, detectShadows=False)
+
+    def reset(self):
+        self._shape = None
+
+    def apply(self, small, scale=1.0):
+        """Update the background with `small` and return (N, 5) int array of x, y, w, h, area at full resolution."""
+        if small.shape != self._shape:
+            self._allocate(small.shape)  # First frame, or the analysis resolution changed
+
+        if small.ndim == 3:
+            cv2.cvtColor(small, cv2.COLOR_BGR2GRAY, dst=self._gray)
+        else:
+            self._gray[...] = small
+        cv2.GaussianBlur(self._gray, self.blur, 0, dst=self._blurred)
+
+        if self.method == MOG2:
+            self._subtractor.apply(self._blurred, fgmask=self._thresh, learningRate=-1)
+        else:
+            if self._background is None:
+                self._background = self._blurred.astype(np.float32)
+            cv2.convertScaleAbs(self._background, dst=self._background8)
+            cv2.absdiff(self._blurred, self._background8, dst=self._diff)
+            cv2.threshold(self._diff, self.threshold, 255, cv2.THRESH_BINARY, dst=self._thresh)
+            cv2.accumulateWeighted(self._blurred, self._background, self.alpha)
+
+        cv2.dilate(self._thresh, self.kernel, dst=self.mask, iterations=self.dilate_iterations)
+        self.energy = cv2.countNonZero(self.mask) / self.mask.size
+
+        contours, _ = cv2.findContours(self.mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        min_area = self.min_area * scale * scale
+        blobs = []
+        for contour in contours:
+            area = cv2.contourArea(contour)
+            if area > min_area:
+                blobs.append((*cv2.boundingRect(contour), area))
+        if not blobs:
+            return np.empty((0, 5), int)
+        blobs = np.asarray(blobs, dtype=np.float32)
+        blobs[:, :4] /= scale
+        blobs[:, 4] /= scale * scale
+        return np.rint(blobs).astype(int)
+
+
+class CentroidTracker:
+    """Greedy nearest-centroid tracker with a fixed-size NumPy ring buffer of positions per track.
+
+    `speed` of a track is the distance between the oldest and newest positions
+    in its history window, i.e. how far that one object moved in the last
+    `history` frames.
+    """
+
+    def __init__(self, max_distance=100, max_missed=5, history=10, min_history=5, capacity=64):
+        self.max_distance = max_distance
+        self.max_missed = max_missed
+        self.history = history
+        self.min_history = min_history
+        self.ids = np.full(capacity, -1, dtype=np.int64)
+        self.positions = np.zeros((capacity, history, 2), dtype=np.float32)
+        self.lengths = np.zeros(capacity, dtype=np.int32)
+        self.heads = np.zeros(capacity, dtype=np.int32)
+        self.missed = np.zeros(capacity, dtype=np.int32)
+        self.boxes = np.zeros((capacity, 4), dtype=np.int32)
+        self._next_id = 1
+
+    def _push(self, slot, center, box):
+        self.positions[slot, self.heads[slot]] = center
+        self.heads[slot] = (self.heads[slot] + 1) % self.history
+        self.lengths[slot] = min(self.lengths[slot] + 1, self.history)
+        self.missed[slot] = 0
+        self.boxes[slot] = box
+
+    def _speed(self, slot):
+        n = self.lengths[slot]
+        if n < self.min_history:
+            return 0.0
+        newest = self.positions[slot, (self.heads[slot] - 1) % self.history]
+        oldest = self.positions[slot, (self.heads[slot] - n) % self.history]
+        return float(np.linalg.norm(newest - oldest))
+
+    def update(self, blobs):
+        """Match blobs (x, y, w, h, ...) to tracks. Returns a list of {"id", "box", "center", "speed"}."""
+        blobs = np.asarray(blobs, dtype=np.float32).reshape(len(blobs), -1) if len(blobs) else np.empty((0, 4), np.float32)
+        centers = blobs[:, :2] + blobs[:, 2:4] / 2.0
+        active = np.flatnonzero(self.ids >= 0)
+        matched_tracks = set()
+        matched_blobs = set()
+
+        if len(active) and len(centers):
+            last = self.positions[active, (self.heads[active] - 1) % self.history]
+            dist = np.linalg.norm(last[:, None, :] - centers[None, :, :], axis=2)
+            for flat in np.argsort(dist, axis=None):
+                t, b = divmod(int(flat), len(centers))
+                if dist[t, b] > self.max_distance:
+                    break
+                if t in matched_tracks or b in matched_blobs:
+                    continue
+                matched_tracks.add(t)
+                matched_blobs.add(b)
+                self._push(active[t], centers[b], blobs[b, :4])
+
+        # Unmatched tracks age out
+        for t, slot in enumerate(active):
+            if t not in matched_tracks:
+                self.missed[slot] += 1
+                if self.missed[slot] > self.max_missed:
+                    self.ids[slot] = -1
+
+        # Unmatched blobs start new tracks while there is room
+        free = list(np.flatnonzero(self.ids < 0))
+        for b in range(len(centers)):
+            if b in matched_blobs or not free:
+                continue
+            slot = free.pop(0)
+            self.ids[slot] = self._next_id
+            self._next_id += 1
+            self.lengths[slot] = 0
+            self.heads[slot] = 0
+            self._push(slot, centers[b], blobs[b, :4])
+
+        tracks = []
+        for slot in np.flatnonzero((self.ids >= 0) & (self.missed == 0)):
+            tracks.append({
+                "id": int(self.ids[slot]),
+                "box": tuple(int(v) for v in self.boxes[slot]),
+                "center": tuple(int(v) for v in self.positions[slot, (self.heads[slot] - 1) % self.history]),
+                "speed": self._speed(slot),
+            })
+        return tracks
+
+
+class MotionGate:
+    """Decides per frame whether a heavy detector needs to run at all.
+
+    Runs a MotionEngine (running-average frame difference) on a `width` px
+    wide copy of the frame and measures the moving fraction of the ROI. The
+    gate opens when that energy reaches `threshold`, stays open for `hold`
+    seconds after the last motion, and lets one keyframe through every
+    `heartbeat` seconds so a scene that stopped moving is still re-checked.
+    """
+
+    def __init__(self, threshold=0.002, width=160, heartbeat=5.0, hold=2.0, roi=None):
+        self.threshold = threshold
+        self.width = int(width)
+        self.heartbeat = heartbeat
+        self.hold = hold
+        self.roi = roi or []
+        self.engine = MotionEngine(RUNNING_AVERAGE, threshold=25, min_area=float("inf"), blur=3,
+                                   dilate_iterations=1)
+        self.energy = 0.0
+        self.frames = 0
+        self.passed = 0
+        self.keyframes = 0
+        self._open_until = 0.0
+        self._last_pass = 0.0
+        self._shape = None
+        self._roi_mask = None
+
+    @classmethod
+    def from_config(cls, options):
+        """Build from a detector config block ("motion_gate" sub-block), or None when gating is off."""
+        gate = options.get("motion_gate") if options else None
+        if not gate:
+            return None
+        gate = {} if gate is True else gate
+        keys = ("threshold", "width", "heartbeat", "hold")
+        return cls(roi=options.get("roi"), **{k: v for k, v in gate.items() if k in keys})
+
+    def _allocate(self, small):
+        h, w = small.shape[:2]
+        self._shape = small.shape
+        self._roi_mask = None
+        if self.roi:
+            self._roi_mask = np.zeros((h, w), np.uint8)
+            cv2.fillPoly(self._roi_mask, [to_pixels(p, w, h) for p in self.roi], 255)
+            self._roi_area = max(1, cv2.countNonZero(self._roi_mask))
+            self._moving = np.empty((h, w), np.uint8)
+
+    def check(self, frame, now=None):
+        """True if the detector should process `frame`."""
+        now = time.monotonic() if now is None else now
+        self.frames += 1
+        h, w = frame.shape[:2]
+        small = frame if w <= self.width else cv2.resize(frame, (self.width, max(1, h * self.width // w)),
+                                                          interpolation=cv2.INTER_NEAREST)
+        if small.shape != self._shape:
+            self._allocate(small)
+        self.engine.apply(small)
+        if self._roi_mask is None:
+            self.energy = self.engine.energy
+        else:
+            cv2.bitwise_and(self.engine.mask, self._roi_mask, dst=self._moving)
+            self.energy = cv2.countNonZero(self._moving) / self._roi_area
+
+        if self.energy >= self.threshold:
+            self._open_until = now + self.hold
+        if now < self._open_until:
+            decision = True
+        elif now - self._last_pass >= self.heartbeat:
+            decision = True
+            self.keyframes += 1
+        else:
+            decision = False
+        if decision:
+            self.passed += 1
+            self._last_pass = now
+        return decision
+
+    def stats(self):
+        skipped = self.frames - self.passed
+        return {
+            "frames": self.frames,
+            "passed": self.passed,
+            "keyframes": self.keyframes,
+            "skipped": skipped,
+            "skip_ratio": round(skipped / self.frames, 3) if self.frames else 0.0,
+            "energy": round(self.energy, 4),
+        }
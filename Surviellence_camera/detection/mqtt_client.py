@@ -0,0 +1,420 @@
+import json
+import os
+import threading
+from collections import deque
+import settings
+from detection import metrics
+
+# Defaults for the shared client, overridable in the "mqtt" block of config.json
+MQTT_DEFAULTS = {"qos": 1, "keepalive": 60, "queue_path": "data/mqtt_queue.jsonl", "queue_size": 10000,
+                 "batch_size": 50, "flush_interval": 1.0}
+
+# MQTT_BROKER value that selects the embedded in-process broker instead of the network
+LOCAL_BROKER = "local"
+
+
+class DiskQueue:
+    """Bounded FIFO of pending messages in an append-only JSON-lines log, so they survive restarts.
+
+    New messages are appended to the log; delivered messages only advance a
+    read offset (a line count in `<path>.offset`). When full the oldest
+    message is dropped, which needs no write at all: on reload the log is
+    trimmed to `maxlen` from the head. The log is rewritten (atomically) with
+    just the pending messages once the consumed lines outnumber both them and
+    `compact_min`, or when the queue runs empty.
+    """
+
+    def __init__(self, path, maxlen=10000, compact_min=1000):
+        self.path = path
+        self.maxlen = maxlen
+        self.compact_min = compact_min
+        self.dropped = 0
+        self._items = deque()
+        self._offset = 0  # Consumed lines at the head of the log
+        self._lock = threading.Lock()
+        if path and os.path.exists(path):
+            self._load()
+
+    def __len__(self):
+        return len(self._items)
+
+    def put(self, item):
+        with self._lock:
+            self._items.append(item)
+            if self.path:
+                os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+                with open(self.path, "a") as f:
+                    f.write(json.dumps(item) + "\n")
+            if len(self._items) > self.maxlen:
+                self._items.popleft()
+                self.dropped += 1
+                self._consume(1, persist=False)
+
+    def peek(self, n):
+        with self._lock:
+            return [self._items[i] for i in range(min(n, len(self._items)))]
+
+    def ack(self, n):
+        """Remove the first `n` messages (successfully delivered)."""
+        with self._lock:
+            n = min(n, len(self._items))
+            for _ in range(n):
+                self._items.popleft()
+            self._consume(n)
+
+    def _load(self):
+        offset = 0
+        try:
+            with open(self.path + ".offset") as f:
+                offset = int(f.read() or 0)
+        except (OSError, ValueError):
+            pass
+        with open(self.path) as f:
+            for i, line in enumerate(f):
+                if i < offset:
+                    continue
+                try:
+                    self._items.append(json.loads(line))
+                except ValueError:
+                    continue  # Torn last line after a crash
+        while len(self._items) > self.maxlen:
+            self._items.popleft()  # Dropped before the restart
+        self._compact()  # Start appending on a clean line
+
+    def _consume(self, n, persist=True):
+        if not self.path or not n:
+            return
+        self._offset += n
+        if not self._items or self._offset >= max(self.compact_min, len(self._items)):
+            self._compact()
+        elif persist:
+            self._write_offset(self._offset)
+
+    def _compact(self):
+        if not self.path:
+            return
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self._write_offset(0)  # Before the swap: a crash in between re-sends rather than loses messages
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            f.writelines(json.dumps(item) + "\n" for item in self._items)
+        os.replace(tmp_path, self.path)
+        self._offset = 0
+
+    def _write_offset(self, offset):
+        tmp_path = self.path + ".offset.tmp"
+        with open(tmp_path, "w") as f:
+            f.write(str(offset))
+        os.replace(tmp_path, self.path + ".offset")
+
+
+def topic_matches(pattern, topic):
+    """MQTT topic filter matching with `+` (one level) and `#` (rest)."""
+    pattern_parts = pattern.split("/")
+    topic_parts = topic.split("/")
+    for i, part in enumerate(pattern_parts):
+        if part == "#":
+            return True
+        if i >= len(topic_parts) or (part != "+" and part != topic_parts[i]):
+            return False
+    return len(pattern_parts) == len(topic_parts)
+
+
+class _LocalMessage:
+    __slots__ = ("topic", "payload", "qos")
+
+    def __init__(self, topic, payload, qos):
+        self.topic = topic
+        self.payload = payload
+        self.qos = qos
+
+
+class _LocalInfo:
+    """Stand-in for paho's MQTTMessageInfo (delivery is synchronous, so it is already published)."""
+
+    def __init__(self, rc, mid):
+        self.rc = rc
+        self.mid = mid
+
+    def is_published(self):
+        return self.rc == 0
+
+    def wait_for_publish(self, timeout=None):
+        pass
+
+
+class LocalBroker:
+    """Embedded in-process broker for tests, benchmarks and offline use.
+
+    `client()` returns objects with the subset of the paho-mqtt Client API that
+    MQTTClient uses. Delivery is synchronous on the publisher's thread.
+    `set_online(False)` simulates an outage: clients disconnect and publishes
+    fail until it comes back.
+    """
+
+    def __init__(self):
+        self.online = True
+        self.published = 0
+        self._clients = []
+        self._lock = threading.Lock()
+
+    def client(self, client_id=""):
+        client = LocalClient(self, client_id)
+        with self._lock:
+            self._clients.append(client)
+        return client
+
+    def set_online(self, online):
+        self.online = online
+        for client in list(self._clients):
+            if online and client.wants_connection:
+                client._connect()
+            elif not online and client.connected:
+                client._disconnect(rc=1)
+
+    def publish(self, topic, payload, qos=0):
+        if not self.online:
+            return False
+        self.published += 1
+        for client in list(self._clients):
+            if client.connected:
+                client._deliver(topic, payload)
+        return True
+
+
+class LocalClient:
+    """paho-like client bound to a LocalBroker."""
+
+    def __init__(self, broker, client_id=""):
+        self.broker = broker
+        self.client_id = client_id
+        self.connected = False
+        self.wants_connection = False
+        self.on_connect = None
+        self.on_disconnect = None
+        self.on_message = None
+        self._subscriptions = {}
+        self._mid = 0
+
+    def reconnect_delay_set(self, min_delay=1, max_delay=120):
+        pass
+
+    def connect_async(self, host=None, port=None, keepalive=60):
+        self.wants_connection = True
+
+    def loop_start(self):
+        if self.wants_connection and self.broker.online:
+            self._connect()
+
+    def loop_stop(self):
+        pass
+
+    def disconnect(self):
+        self.wants_connection = False
+        self._disconnect(rc=0)
+
+    def is_connected(self):
+        return self.connected
+
+    def subscribe(self, topic, qos=0):
+        self._subscriptions[topic] = qos
+        return 0, 0
+
+    def publish(self, topic, payload=None, qos=0, retain=False):
+        self._mid += 1
+        if not self.connected or not self.broker.publish(topic, payload, qos):
+            return _LocalInfo(4, self._mid)  # MQTT_ERR_NO_CONN
+        return _LocalInfo(0, self._mid)
+
+    def _connect(self):
+        self.connected = True
+        if self.on_connect is not None:
+            self.on_connect(self, None, {}, 0)
+
+    def _disconnect(self, rc):
+        was_connected, self.connected = self.connected, False
+        if was_connected and self.on_disconnect is not None:
+            self.on_disconnect(self, None, rc)
+
+    def _deliver(self, topic, payload):
+        if self.on_message is None:
+            return
+        if isinstance(payload, str):
+            payload = payload.encode()
+        for pattern, qos in list(self._subscriptions.items()):
+            if topic_matches(pattern, topic):
+                self.on_message(self, None, _LocalMessage(topic, payload, qos))
+                return
+
+
+class MQTTClient:
+    """Shared MQTT publisher / subscriber.
+
+    Nothing touches the network until the first publish or subscribe, and
+    even then the connection is made by paho's background loop
+    (`connect_async`), so callers never block on the broker. Messages
+    published while disconnected go to a bounded on-disk queue and are
+    flushed in batches of `batch_size` once the broker is back (QoS > 0
+    batches are acknowledged before they leave the queue). Subscriptions are
+    renewed on every reconnect.
+    """
+
+    def __init__(self, broker="test.mosquitto.org", port=1883, topic="crowd/alert", qos=1, keepalive=60,
+                 queue_path="data/mqtt_queue.jsonl", queue_size=10000, batch_size=50, flush_interval=1.0,
+                 client_id="", local_broker=None):
+        self.broker = broker
+        self.port = int(port)
+        self.topic = topic
+        self.qos = qos
+        self.keepalive = keepalive
+        self.batch_size = max(1, int(batch_size))
+        self.flush_interval = flush_interval
+        self.client_id = client_id
+        self.local_broker = local_broker
+        self.queue = DiskQueue(queue_path, queue_size)
+        self.connected = False
+        self.published = 0
+        self.received = 0
+        self.client = None
+        self._subscriptions = {}  # Topic -> (qos, [callbacks])
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._flusher = None
+
+    def _ensure_started(self):
+        with self._lock:
+            if self.client is not None:
+                return
+            if self.broker == LOCAL_BROKER:
+                client = (self.local_broker or get_local_broker()).client(self.client_id)
+            else:
+                import paho.mqtt.client as mqtt  # Only once MQTT is actually used
+                if hasattr(mqtt, "CallbackAPIVersion"):  # paho-mqtt 2.x
+                    client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION1, self.client_id)
+                else:
+                    client = mqtt.Client(self.client_id)
+            client.on_connect = self._on_connect
+            client.on_disconnect = self._on_disconnect
+            client.on_message = self._on_message
+            client.reconnect_delay_set(1, 60)
+            self.client = client
+            self._flusher = threading.Thread(target=self._flush_loop, name="mqtt-flush", daemon=True)
+            self._flusher.start()
+        client.connect_async(self.broker, self.port, self.keepalive)
+        client.loop_start()
+
+    def publish(self, payload, topic=None, qos=None):
+        """Publish without blocking; buffered to disk while the broker is unreachable."""
+        if not isinstance(payload, (str, bytes)):
+            payload = json.dumps(payload)
+        elif isinstance(payload, bytes):
+            payload = payload.decode()
+        message = {"topic": topic or self.topic, "payload": payload, "qos": self.qos if qos is None else qos}
+        self._ensure_started()
+        if self.connected and not len(self.queue):
+            info = self.client.publish(message["topic"], message["payload"], qos=message["qos"])
+            if info.rc == 0:
+                self.published += 1
+                metrics.inc("vision_mqtt_messages_total", state="published")
+                return True
+        self.queue.put(message)
+        metrics.inc("vision_mqtt_messages_total", state="buffered")
+        self._wakeup.set()
+        return False
+
+    def subscribe(self, callback, topic=None, qos=None):
+        """Call `callback(topic, payload_str)` for every message on `topic` (default MQTT_TOPIC)."""
+        topic = topic or self.topic
+        qos = self.qos if qos is None else qos
+        with self._lock:
+            callbacks = self._subscriptions.setdefault(topic, (qos, []))[1]
+            callbacks.append(callback)
+        self._ensure_started()
+        if self.connected:
+            self.client.subscribe(topic, qos)
+
+    def close(self):
+        if self.client is not None:
+            self.client.loop_stop()
+            self.client.disconnect()
+        self.connected = False
+
+    def _on_connect(self, client, userdata, flags, rc):
+        if rc != 0:
+            print(f"⚠ MQTT broker {self.broker} refused the connection (rc={rc})")
+            return
+        self.connected = True
+        for topic, (qos, _) in list(self._subscriptions.items()):
+            client.subscribe(topic, qos)
+        self._wakeup.set()  # Flush what was buffered while offline
+
+    def _on_disconnect(self, client, userdata, rc):
+        self.connected = False
+        if rc != 0:
+            metrics.inc("vision_mqtt_disconnects_total")
+
+    def _on_message(self, client, userdata, msg):
+        self.received += 1
+        payload = msg.payload.decode(errors="replace")
+        for topic, (_, callbacks) in list(self._subscriptions.items()):
+            if topic_matches(topic, msg.topic):
+                for callback in list(callbacks):
+                    try:
+                        callback(msg.topic, payload)
+                    except Exception as e:
+                        print(f"⚠ MQTT subscriber failed: {e}")
+
+    def _flush_loop(self):
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            while self.connected and len(self.queue):
+                batch = self.queue.peek(self.batch_size)
+                infos = [self.client.publish(m["topic"], m["payload"], qos=m["qos"]) for m in batch]
+                delivered = 0
+                for message, info in zip(batch, infos):
+                    if info.rc != 0:
+                        break
+                    if message["qos"] > 0:
+                        try:
+                            info.wait_for_publish(timeout=5)
+                        except (RuntimeError, ValueError):
+                            break
+                        if not info.is_published():
+                            break
+                    delivered += 1
+                self.queue.ack(delivered)
+                self.published += delivered
+                metrics.inc("vision_mqtt_messages_total", delivered, state="flushed")
+                if delivered < len(batch):
+                    break  # Connection dropped mid-batch, retry after reconnect
+
+    def stats(self):
+        return {"broker": self.broker, "connected": self.connected, "published": self.published,
+                "received": self.received, "queued": len(self.queue), "dropped": self.queue.dropped}
+
+
+_local_broker = None
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_local_broker():
+    """The process-wide embedded broker (MQTT_BROKER = "local")."""
+    global _local_broker
+    with _client_lock:
+        if _local_broker is None:
+            _local_broker = LocalBroker()
+        return _local_broker
+
+
+def get_mqtt_client():
+    """The shared client, configured from MQTT_BROKER / MQTT_PORT / MQTT_TOPIC and the "mqtt" block."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            config = settings.CONFIG
+            options = {k: config.get("mqtt", {}).get(k, v) for k, v in MQTT_DEFAULTS.items()}
+            _client = MQTTClient(config.get("MQTT_BROKER", "test.mosquitto.org"), config.get("MQTT_PORT", 1883),
+                                 config.get("MQTT_TOPIC", "crowd/alert"), **options)
+        return _client
@@ -1,27 +1,34 @@
-import paho.mqtt.client as mqtt
-import pygame
+"""Standalone alert listener: plays the alarm for every raised alert on MQTT_TOPIC.
+
+    python -m detection.mqtt_receiver
+"""
 import os
+import threading
+import pygame
+from detection.alerts import CLEARED
+from detection.events import decode_batch
+from detection.mqtt_client import get_mqtt_client
 
 # ✅ Disable Pygame's video system (fix for headless environments)
 os.environ["SDL_VIDEODRIVER"] = "dummy"
 
-# ✅ MQTT Setup
-MQTT_BROKER = "test.mosquitto.org"
-MQTT_TOPIC = "crowd/alert"
-
-pygame.mixer.init()
-pygame.mixer.music.load("alarm.mp3")
+def main():
+    pygame.mixer.init()
+    pygame.mixer.music.load("static/audio/alarm.mp3")
 
-def on_message(client, userdata, msg):
-    """Play sound when alert received"""
-    print(f"📩 Received Alert: {msg.payload.decode()}")
-    pygame.mixer.music.play()
+    def on_message(topic, payload):
+        """Play sound when an alert is received (not when it clears)"""
+        alerts = [message for message in decode_batch(payload) if message.get("kind") == "alert"]
+        for alert in alerts:
+            print(f"📩 Received Alert: {alert['message']}")
+        if any(alert.get("state") != CLEARED for alert in alerts):
+            pygame.mixer.music.play()
 
-mqtt_client = mqtt.Client()
-mqtt_client.on_message = on_message
-mqtt_client.connect(MQTT_BROKER, 1883, 60)
-mqtt_client.subscribe(MQTT_TOPIC)
+    # ✅ Shared MQTT client from config.json (reconnects and resubscribes on its own)
+    get_mqtt_client().subscribe(on_message)
 
-print("📡 Waiting for Crowd Alerts...")
+    print("📡 Waiting for Crowd Alerts...")
+    threading.Event().wait()  # Keep Listening
 
-mqtt_client.loop_forever()  # Keep Listening
+if __name__ == "__main__":
+    main()
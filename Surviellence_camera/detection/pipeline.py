@@ -0,0 +1,381 @@
+import os
+import threading
+import time
+from detection.frame_hub import get_hub, release_hub
+from detection.frame_source import DROP_OLDEST
+from detection.detectors import create_detector
+from detection import metrics
+from detection.streaming import get_broadcaster
+from detection.alerts import CLEARED, get_alert_engine
+from detection.zones import ZONE_OPTION_KEYS
+from detection.process_pool import ProcessPool
+from detection.recorder import start_recorder, stop_recorder
+from detection.runtime import BroadcastSink, DisplaySink
+
+
+class CameraPipeline:
+    """State of one configured camera: its capture hub, detectors and schedule."""
+
+    def __init__(self, config, detector_options=None, ingest_options=None):
+        self.config = config
+        self.detector_options = detector_options or {}
+        self.ingest_options = ingest_options or {}
+        self.id = config["id"]
+        self.source = config["source"]
+        # Optional substreams: detect on a low-resolution stream, record the full-resolution one
+        self.analysis_source = config.get("analysis_source") or self.source
+        self.record_source = config.get("record_source") or self.source
+        self.priority = int(config.get("priority", 0))
+        self.target_fps = float(config.get("target_fps", 5))
+        self.detector_names = config.get("detectors", ["crowd"])
+
+        self.state = "stopped"
+        self.hub = None
+        self.record_hub = None
+        self.sub = None
+        self.broadcaster = None
+        self.sinks = []
+        self.detectors = {}
+        self.next_due = 0.0
+        self.busy = False
+        self.frames_processed = 0
+        self.errors = 0
+        self.restarts = 0
+        self.backoff = 0.0
+        self.restart_at = 0.0
+        self.last_results = {}
+        self.remote_stats = None  # Detector stats reported by the worker process (processes mode)
+
+    def ingest(self):
+        """Stream ingest options: the "ingest" block of config.json, overridable per camera."""
+        return {**self.ingest_options, **self.config.get("ingest", {})}
+
+    def open(self):
+        loop = self.config.get("loop", False)
+        self.hub = get_hub(self.analysis_source, loop=loop, name=self.id, options=self.ingest())
+        self.broadcaster = get_broadcaster(self.id)
+        # Frame sinks: the dashboard stream, plus a local window only when the camera asks for one
+        self.sinks = [BroadcastSink(self.broadcaster)]
+        if self.config.get("display"):
+            self.sinks.append(DisplaySink(f"Vision Tower - {self.id}"))
+        self.sub = self.hub.subscribe(
+            f"pipeline-{self.id}",
+            policy=self.config.get("frame_policy", DROP_OLDEST),
+            maxlen=self.config.get("frame_queue", 1),
+        )
+        if self.config.get("record", True):
+            self.record_hub = self.hub
+            if self.record_source != self.analysis_source:
+                self.record_hub = get_hub(self.record_source, loop=loop, name=f"{self.id}-record", options=self.ingest())
+            start_recorder(self.id, self.record_hub)  # Pre-roll buffer for alert clips
+        self.next_due = time.monotonic()
+
+    def needs_restart(self, config):
+        """True if `config` changes how the stream is opened (sources, looping, frame queue, ingest options)."""
+        keys = ("source", "analysis_source", "record_source", "loop", "frame_policy", "frame_queue", "ingest")
+        return any(self.config.get(key) != config.get(key) for key in keys)
+
+    def reconfigure(self, config, detector_options):
+        """Apply a new config to the running camera: schedule, detector set and thresholds."""
+        self.config = config
+        self.detector_options = detector_options
+        self.priority = int(config.get("priority", 0))
+        self.target_fps = float(config.get("target_fps", 5))
+        self.detector_names = config.get("detectors", ["crowd"])
+        for name in list(self.detectors):
+            if name not in self.detector_names:
+                del self.detectors[name]
+                self.last_results.pop(name, None)
+            else:
+                self.detectors[name].configure({**self.options(name), "camera": self.id})
+
+    def options(self, name):
+        """Detector config block (detectors section of config.json, overridable per camera) plus the camera's zones."""
+        zones = {key: self.config[key] for key in ZONE_OPTION_KEYS if key in self.config}
+        return {**self.detector_options.get(name, {}), **zones, **self.config.get(name, {})}
+
+    def close(self, force=False):
+        """Unsubscribe; the hub is torn down when unused, or always with force (stalled stream)."""
+        stop_recorder(self.id)
+        for sink in self.sinks:
+            sink.close()
+        self.sinks = []
+        if self.record_hub is not None and self.record_hub is not self.hub and self.record_hub.subscriber_count() == 0:
+            release_hub(self.record_source, wait=not force)
+        self.record_hub = None
+        if self.sub is not None:
+            self.sub.release()
+            self.sub = None
+        if self.hub is not None and (force or self.hub.subscriber_count() == 0):
+            release_hub(self.analysis_source, wait=not force)
+        self.hub = None
+
+    def status(self):
+        detector_stats = self.remote_stats or {
+            "adaptive": {name: d.controller.stats() for name, d in list(self.detectors.items()) if d.controller is not None},
+            "gate": {name: d.gate.stats() for name, d in list(self.detectors.items()) if d.gate is not None},
+        }
+        return {
+            "id": self.id,
+            "source": self.source,
+            "state": self.state,
+            "priority": self.priority,
+            "target_fps": self.target_fps,
+            "detectors": self.detector_names,
+            "frames_processed": self.frames_processed,
+            "frames": self.sub.stats() if self.sub is not None else {},
+            "stream": self.hub.health() if self.hub is not None else None,
+            "record_stream": self.record_hub.health() if self.record_hub not in (None, self.hub) else None,
+            "errors": self.errors,
+            "restarts": self.restarts,
+            **detector_stats,
+            "last_results": self.last_results,
+        }
+
+
+class PipelineManager:
+    """Runs the configured cameras on a fixed pool of inference workers.
+
+    Every active camera has one decoder thread (its CaptureHub); detection runs on
+    `workers` threads shared by all cameras. A worker always picks the
+    highest-priority camera whose next frame is due, so when the node is
+    overloaded low-priority cameras lose frame rate first. Hubs reconnect
+    lost streams themselves; a watchdog restarts cameras whose decoder thread
+    is stuck or whose stream ended, with exponential backoff.
+
+    In "processes" mode the worker threads only dispatch: each frame goes to
+    the camera's detector process (see ProcessPool) and the thread waits for
+    its results, so detection does not compete with the web server for the GIL.
+    """
+
+    def __init__(self, cameras, workers=0, max_cameras=48, stall_timeout=10.0,
+                 max_backoff=60.0, detector_options=None, mode="threads", processes=0,
+                 ring_slots=4, ingest=None):
+        if mode not in ("threads", "processes"):
+            raise ValueError(f"Unknown pipeline mode: {mode}")
+        self.mode = mode
+        self.pool = ProcessPool(processes, ring_slots) if mode == "processes" else None
+        self.workers = workers or max(1, (os.cpu_count() or 2) - 1)  # Leave a core for the web server
+        self.max_cameras = max_cameras
+        self.stall_timeout = stall_timeout
+        self.max_backoff = max_backoff
+        self.ingest = ingest or {}
+        self.cameras = {cam["id"]: CameraPipeline(cam, detector_options, self.ingest) for cam in cameras}
+
+        self._cond = threading.Condition()
+        self._running = False
+        self._threads = []
+
+    # ---- lifecycle -------------------------------------------------------
+
+    def _ensure_workers(self):
+        if self._running:
+            return
+        self._running = True
+        for i in range(self.workers):
+            t = threading.Thread(target=self._worker, name=f"pipeline-worker-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+        t = threading.Thread(target=self._watchdog, name="pipeline-watchdog", daemon=True)
+        t.start()
+        self._threads.append(t)
+
+    def shutdown(self):
+        for camera_id in list(self.cameras):
+            self.stop(camera_id)
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+        for t in self._threads:
+            t.join(timeout=5)
+        self._threads = []
+        if self.pool is not None:
+            self.pool.stop()
+
+    def start(self, camera_id):
+        """Start a camera. Starting an already running camera is a no-op."""
+        with self._cond:
+            camera = self.cameras.get(camera_id)
+            if camera is None:
+                raise KeyError(camera_id)
+            if camera.state != "stopped":
+                return camera.status()
+            active = sum(1 for c in self.cameras.values() if c.state != "stopped")
+            if active >= self.max_cameras:
+                raise RuntimeError(f"Camera limit reached ({self.max_cameras})")
+
+            self._ensure_workers()
+            camera.open()
+            camera.state = "running"
+            camera.backoff = 0.0
+            self._cond.notify_all()
+            return camera.status()
+
+    def stop(self, camera_id):
+        """Stop a camera. Stopping an already stopped camera is a no-op."""
+        with self._cond:
+            camera = self.cameras.get(camera_id)
+            if camera is None:
+                raise KeyError(camera_id)
+            if camera.state != "stopped":
+                camera.state = "stopped"
+                camera.close()
+                camera.detectors = {}
+                if self.pool is not None:
+                    self.pool.remove_camera(camera_id)
+            return camera.status()
+
+    def reconfigure(self, cameras, detector_options=None, ingest=None):
+        """Apply a new camera list / detector config without restarting the manager.
+
+        Removed cameras stop, new ones are added stopped, cameras whose source
+        changed reopen their stream (and keep running if they were), and
+        everything else picks up new thresholds on its next frame.
+        """
+        detector_options = detector_options or {}
+        ingest_changed = ingest is not None and ingest != self.ingest
+        if ingest is not None:
+            self.ingest = ingest
+        configs = {cam["id"]: cam for cam in cameras}
+        with self._cond:
+            for camera_id in list(self.cameras):
+                if camera_id not in configs:
+                    self.stop(camera_id)
+                    del self.cameras[camera_id]
+            for camera_id, config in configs.items():
+                camera = self.cameras.get(camera_id)
+                if camera is None:
+                    self.cameras[camera_id] = CameraPipeline(config, detector_options, self.ingest)
+                elif camera.needs_restart(config) or ingest_changed:
+                    was_running = camera.state != "stopped"
+                    self.stop(camera_id)
+                    self.cameras[camera_id] = CameraPipeline(config, detector_options, self.ingest)
+                    if was_running:
+                        self.start(camera_id)
+                else:
+                    camera.reconfigure(config, detector_options)
+            self._cond.notify_all()
+
+    def start_all(self):
+        return [self.start(camera_id) for camera_id in self.cameras]
+
+    def status(self, camera_id=None):
+        with self._cond:
+            if camera_id is not None:
+                return self.cameras[camera_id].status()
+            return {
+                "mode": self.mode,
+                "workers": self.workers,
+                "processes": self.pool.stats() if self.pool is not None else None,
+                "max_cameras": self.max_cameras,
+                "cameras": [camera.status() for camera in self.cameras.values()],
+            }
+
+    # ---- scheduling ------------------------------------------------------
+
+    def _next_camera(self):
+        """Pick the highest-priority due camera, or return the time to wait."""
+        now = time.monotonic()
+        best = None
+        wait = 1.0
+        for camera in self.cameras.values():
+            if camera.state != "running" or camera.busy:
+                continue
+            if camera.next_due <= now:
+                if best is None or (-camera.priority, camera.next_due) < (-best.priority, best.next_due):
+                    best = camera
+            else:
+                wait = min(wait, camera.next_due - now)
+        return best, wait
+
+    def _worker(self):
+        while True:
+            with self._cond:
+                camera = None
+                while self._running:
+                    camera, wait = self._next_camera()
+                    if camera is not None:
+                        break
+                    self._cond.wait(wait)
+                if not self._running:
+                    return
+                camera.busy = True
+                camera.next_due = max(camera.next_due + 1.0 / camera.target_fps, time.monotonic())
+                sub = camera.sub
+
+            try:
+                view = sub.next_frame(timeout=0) if sub is not None else None
+                if view is not None:
+                    self._process(camera, view)
+            except Exception as e:
+                camera.errors += 1
+                print(f"⚠ Camera {camera.id} detection error: {e}")
+            finally:
+                with self._cond:
+                    camera.busy = False
+                    self._cond.notify()
+
+    def _detect(self, camera, view):
+        """{detector name: (result, events, levels, zone_events), or None when it skipped the frame}."""
+        if self.pool is not None:
+            options = {name: {**camera.options(name), "camera": camera.id} for name in camera.detector_names}
+            outputs = self.pool.run(camera.id, options, view, group=camera.config.get("process_group"))
+            camera.remote_stats = self.pool.stats_by_camera.get(camera.id)
+            return outputs
+
+        outputs = {}
+        for name in camera.detector_names:
+            detector = camera.detectors.get(name)
+            if detector is None:
+                detector = camera.detectors[name] = create_detector(name, {**camera.options(name), "camera": camera.id})
+            result = detector.maybe_process(view.frame)
+            outputs[name] = None if result is None else (result, detector.events(result), detector.levels(),
+                                                         detector.zone_events(result))
+        return outputs
+
+    def _process(self, camera, view):
+        for name, output in self._detect(camera, view).items():
+            if output is None:
+                continue  # No motion or over its latency budget, skip this frame for this detector
+            result, detections, levels, zones = output
+            camera.last_results[name] = result
+            with metrics.stage_timer("alert_dispatch", camera.id):
+                # Alerts carry the frame's decode time, so their timestamp (and clip) match the footage
+                engine = get_alert_engine()
+                alerts = [engine.process(camera.id, name, detections, timestamp=view.timestamp, levels=levels)]
+                for zone, levels, zone_events in zones:
+                    alerts.append(engine.process(camera.id, name, zone_events, timestamp=view.timestamp, zone=zone,
+                                                 levels=levels))
+                for alert in alerts:
+                    if alert is not None and alert["state"] != CLEARED:
+                        metrics.observe("vision_alert_latency_seconds", time.time() - view.timestamp,
+                                        camera=camera.id, detector=name)
+        camera.frames_processed += 1
+
+        # Annotated output (dashboard stream, optional window), drawn and encoded only while someone watches
+        for sink in list(camera.sinks):
+            sink.handle(view.frame, camera.last_results)
+
+    def _watchdog(self):
+        while self._running:
+            time.sleep(1.0)
+            now = time.monotonic()
+            with self._cond:
+                for camera in self.cameras.values():
+                    if camera.state == "running":
+                        # A reconnecting hub is left alone, it backs off by itself
+                        frame_age = now - camera.hub.last_frame_time
+                        if not camera.hub.running or camera.hub.stalled(self.stall_timeout):
+                            camera.backoff = min(max(camera.backoff * 2, 1.0), self.max_backoff)
+                            camera.restart_at = now + camera.backoff
+                            print(f"⚠ Camera {camera.id} stalled, restarting in {camera.backoff:.0f}s")
+                            camera.close(force=True)
+                            camera.state = "backoff"
+                        elif frame_age < 1.0 and now - camera.restart_at > self.stall_timeout:
+                            camera.backoff = 0.0  # Healthy for a while, reset the backoff
+                    elif camera.state == "backoff" and now >= camera.restart_at:
+                        camera.restarts += 1
+                        metrics.inc("vision_reconnects_total", camera=camera.id)
+                        camera.open()
+                        camera.state = "running"
+                self._cond.notify_all()
@@ -0,0 +1,371 @@
+import os
+import secrets
+import subprocess
+import sys
+import threading
+from concurrent.futures import Future
+from multiprocessing import shared_memory
+from multiprocessing.connection import Client, Listener
+import numpy as np
+
+# Environment variable carrying the connection key to the worker processes
+AUTHKEY_ENV = "VISION_WORKER_AUTHKEY"
+
+
+class FrameRing:
+    """Fixed number of frame slots in one shared memory block (one ring per camera).
+
+    Each slot has a header (seq, timestamp, height, width, channels) followed
+    by room for `frame_bytes` of pixels. The writer fills slot `seq % slots`;
+    a reader checks the header's seq so it never mistakes an older frame for
+    the one it was sent. The pipeline keeps at most one frame per camera in
+    flight, so a slot is never overwritten while a worker still reads it.
+    """
+
+    HEADER = np.dtype([("seq", "<i8"), ("timestamp", "<f8"), ("h", "<i4"), ("w", "<i4"), ("c", "<i4"),
+                       ("pad", "<i4")])
+
+    def __init__(self, name=None, slots=4, frame_bytes=0):
+        if name is None:
+            self.shm = shared_memory.SharedMemory(create=True, size=16 + slots * (self.HEADER.itemsize + frame_bytes))
+            np.ndarray(2, "<i8", self.shm.buf)[:] = (slots, frame_bytes)  # Readers attach by name alone
+            self.owner = True
+        else:
+            self.shm = _attach(name)
+            self.owner = False
+        self.slots, self.frame_bytes = (int(v) for v in np.ndarray(2, "<i8", self.shm.buf))
+        self.name = self.shm.name
+        self.headers = np.ndarray(self.slots, self.HEADER, self.shm.buf, offset=16)
+        self._data_offset = 16 + self.slots * self.HEADER.itemsize
+
+    def fits(self, frame):
+        return frame.nbytes <= self.frame_bytes
+
+    def write(self, seq, timestamp, frame):
+        """Copy `frame` into its slot (writer side). Returns the slot index."""
+        slot = seq % self.slots
+        h, w = frame.shape[:2]
+        c = frame.shape[2] if frame.ndim == 3 else 1
+        target = np.ndarray(frame.shape, np.uint8, self.shm.buf, offset=self._data_offset + slot * self.frame_bytes)
+        target[...] = frame
+        self.headers[slot] = (seq, timestamp, h, w, c, 0)
+        return slot
+
+    def read(self, slot, seq):
+        """Read-only view of the frame in `slot`, or None if it no longer holds frame `seq`."""
+        header = self.headers[slot]
+        if int(header["seq"]) != seq:
+            return None
+        shape = (int(header["h"]), int(header["w"])) + ((int(header["c"]),) if header["c"] > 1 else ())
+        frame = np.ndarray(shape, np.uint8, self.shm.buf, offset=self._data_offset + slot * self.frame_bytes)
+        frame.flags.writeable = False
+        return frame
+
+    def close(self):
+        self.headers = None
+        if self.owner:
+            try:
+                self.shm.unlink()
+            except FileNotFoundError:
+                pass
+        try:
+            self.shm.close()
+        except BufferError:
+            pass  # A frame view is still alive; the mapping goes away with it
+
+
+def _attach(name):
+    """Attach to an existing block without handing it to this process's resource tracker."""
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)  # Python 3.13+
+    except TypeError:
+        shm = shared_memory.SharedMemory(name=name)
+        from multiprocessing import resource_tracker
+        resource_tracker.unregister(shm._name, "shared_memory")  # The web process owns and unlinks it
+        return shm
+
+
+# ---- worker process --------------------------------------------------------
+
+def _event_dicts(events):
+    return [event.to_dict() for event in events]
+
+
+def worker_main(address, index):
+    """Worker loop: build detectors per camera, run them on ring frames, send results back."""
+    from detection.detectors import create_detector
+
+    conn = Client(address, authkey=bytes.fromhex(os.environ[AUTHKEY_ENV]))
+    conn.send(("hello", index, os.getpid()))
+    options = {}  # Camera id -> {detector name: options}, in processing order
+    detectors = {}  # (camera id, detector name) -> Detector
+    rings = {}  # Camera id -> FrameRing
+
+    while True:
+        try:
+            message = conn.recv()
+        except (EOFError, OSError):
+            break  # Web process went away
+        kind = message[0]
+        if kind == "stop":
+            break
+        if kind == "camera":
+            _, camera_id, camera_options = message
+            options[camera_id] = camera_options
+            for (cam, name), detector in list(detectors.items()):
+                if cam != camera_id:
+                    continue
+                if name in camera_options:
+                    detector.configure(camera_options[name])
+                else:
+                    del detectors[(cam, name)]
+        elif kind == "remove":
+            _, camera_id = message
+            options.pop(camera_id, None)
+            for key in [key for key in detectors if key[0] == camera_id]:
+                del detectors[key]
+            ring = rings.pop(camera_id, None)
+            if ring is not None:
+                ring.close()
+        elif kind == "frame":
+            _, camera_id, ring_name, slot, seq = message
+            try:
+                ring = rings.get(camera_id)
+                if ring is None or ring.name != ring_name:
+                    if ring is not None:
+                        ring.close()
+                    ring = rings[camera_id] = FrameRing(ring_name)
+                frame = ring.read(slot, seq)
+                if frame is None:
+                    raise RuntimeError(f"frame {seq} was overwritten before it was read")
+                outputs = {}
+                for name, detector_options in options.get(camera_id, {}).items():
+                    detector = detectors.get((camera_id, name))
+                    if detector is None:
+                        detector = detectors[(camera_id, name)] = create_detector(name, detector_options)
+                    result = detector.maybe_process(frame)
+                    if result is None:
+                        outputs[name] = None
+                        continue
+                    zone_events = [(zone, levels, _event_dicts(events))
+                                   for zone, levels, events in detector.zone_events(result)]
+                    outputs[name] = (result, _event_dicts(detector.events(result)), detector.levels(), zone_events)
+                del frame
+                stats = {
+                    "adaptive": {name: d.controller.stats() for (cam, name), d in detectors.items()
+                                 if cam == camera_id and d.controller is not None},
+                    "gate": {name: d.gate.stats() for (cam, name), d in detectors.items()
+                             if cam == camera_id and d.gate is not None},
+                }
+                conn.send(("result", camera_id, seq, outputs, stats))
+            except Exception as e:
+                conn.send(("error", camera_id, seq, f"{type(e).__name__}: {e}"))
+
+    for ring in rings.values():
+        ring.close()
+
+
+# ---- web process side ----------------------------------------------------
+
+class _Worker:
+    """Handle on one worker process: its connection, pending frames and cameras."""
+
+    def __init__(self, index):
+        self.index = index
+        self.proc = None
+        self.conn = None
+        self.pid = None
+        self.cameras = {}  # Camera id -> options last sent
+        self.pending = {}  # (camera id, seq) -> Future
+        self.frames = 0
+        self.restarts = 0
+        self.send_lock = threading.Lock()
+        self.connected = threading.Event()
+
+
+class ProcessPool:
+    """Runs detectors for the pipeline's cameras in `processes` worker processes.
+
+    Decoding and alerting stay in the web process; only detection moves out.
+    Frames travel through per-camera FrameRings in shared memory, and the
+    workers send back only compact results (boxes, counts, events).
+    Cameras are spread over the workers round-robin (or by their
+    `process_group`), and every detector of a camera lives in that camera's
+    worker, so tracker and background state stay in one place. `submit()`
+    writes the frame into the camera's FrameRing and returns a Future of
+    {detector name: (result, events, levels, zone_events) or None}, the same shape
+    the threaded mode produces locally. A worker that dies is restarted and
+    its in-flight frames fail.
+    """
+
+    def __init__(self, processes=0, ring_slots=4):
+        self.processes = processes or max(1, (os.cpu_count() or 2) - 1)
+        self.ring_slots = max(2, int(ring_slots))
+        self.stats_by_camera = {}
+        self._authkey = secrets.token_bytes(16)
+        self._listener = None
+        self._workers = []
+        self._assignment = {}
+        self._rings = {}
+        self._lock = threading.Lock()
+        self._running = False
+
+    def start(self):
+        with self._lock:
+            if self._running:
+                return
+            self._running = True
+            self._listener = Listener(("127.0.0.1", 0), authkey=self._authkey)
+            threading.Thread(target=self._accept_loop, name="process-pool-accept", daemon=True).start()
+            self._workers = [_Worker(i) for i in range(self.processes)]
+        for worker in self._workers:
+            self._launch(worker)
+
+    def _launch(self, worker):
+        # A plain `python -m` subprocess rather than multiprocessing's spawn, which would re-import the web app
+        worker.connected.clear()
+        env = {**os.environ, AUTHKEY_ENV: self._authkey.hex()}
+        host, port = self._listener.address
+        worker.proc = subprocess.Popen([sys.executable, "-m", "detection.process_pool", host, str(port),
+                                        str(worker.index)], env=env)
+
+    def _accept_loop(self):
+        while self._running:
+            try:
+                conn = self._listener.accept()
+                _, index, pid = conn.recv()
+            except (OSError, EOFError):
+                if not self._running:
+                    return
+                continue
+            worker = self._workers[index]
+            worker.conn = conn
+            worker.pid = pid
+            worker.cameras = {}  # A new process knows no cameras yet
+            worker.connected.set()
+            threading.Thread(target=self._read_loop, args=(worker, conn), name=f"process-pool-{index}",
+                             daemon=True).start()
+
+    def _read_loop(self, worker, conn):
+        while True:
+            try:
+                message = conn.recv()
+            except (EOFError, OSError):
+                break
+            kind, camera_id, seq = message[:3]
+            future = worker.pending.pop((camera_id, seq), None)
+            if kind == "result":
+                worker.frames += 1
+                self.stats_by_camera[camera_id] = message[4]
+                if future is not None:
+                    future.set_result(message[3])
+            elif future is not None:
+                future.set_exception(RuntimeError(message[3]))
+
+        # Worker died (or is stopping): fail what it had in flight and bring up a replacement
+        worker.connected.clear()
+        pending, worker.pending = worker.pending, {}
+        for future in pending.values():
+            future.set_exception(RuntimeError(f"Detector worker {worker.index} exited"))
+        if self._running:
+            worker.restarts += 1
+            print(f"⚠ Detector worker {worker.index} exited, restarting")
+            self._launch(worker)
+
+    def _worker_for(self, camera_id, group=None):
+        with self._lock:
+            index = self._assignment.get(camera_id)
+            if index is None:
+                index = (len(self._assignment) if group is None else int(group)) % self.processes
+                self._assignment[camera_id] = index
+        return self._workers[index]
+
+    def _send(self, worker, message):
+        with worker.send_lock:
+            worker.conn.send(message)
+
+    def submit(self, camera_id, options, view, group=None, timeout=30.0):
+        """Queue frame `view` of `camera_id` for its detectors ({name: options}, in order)."""
+        self.start()
+        worker = self._worker_for(camera_id, group)
+        if not worker.connected.wait(timeout):
+            raise RuntimeError(f"Detector worker {worker.index} did not start")
+
+        frame = view.frame
+        ring = self._rings.get(camera_id)
+        if ring is None or not ring.fits(frame):
+            if ring is not None:
+                ring.close()
+            ring = self._rings[camera_id] = FrameRing(slots=self.ring_slots, frame_bytes=frame.nbytes)
+        slot = ring.write(view.seq, view.timestamp, frame)
+
+        future = Future()
+        worker.pending[(camera_id, view.seq)] = future
+        if worker.cameras.get(camera_id) != options:
+            worker.cameras[camera_id] = options
+            self._send(worker, ("camera", camera_id, options))
+        self._send(worker, ("frame", camera_id, ring.name, slot, view.seq))
+        return future
+
+    def run(self, camera_id, options, view, group=None, timeout=30.0):
+        """Blocking submit(); events come back as DetectionEvents."""
+        from detection.alerts import DetectionEvent
+
+        outputs = self.submit(camera_id, options, view, group, timeout).result(timeout)
+        for name, output in outputs.items():
+            if output is not None:
+                result, events, levels, zone_events = output
+                outputs[name] = (result, [DetectionEvent(**e) for e in events], levels,
+                                 [(zone, levels, [DetectionEvent(**e) for e in zone_list])
+                                  for zone, levels, zone_list in zone_events])
+        return outputs
+
+    def remove_camera(self, camera_id):
+        """Drop a camera's detectors in its worker and free its ring."""
+        with self._lock:
+            index = self._assignment.get(camera_id)
+        if index is not None:
+            worker = self._workers[index]
+            if worker.cameras.pop(camera_id, None) is not None and worker.connected.is_set():
+                try:
+                    self._send(worker, ("remove", camera_id))
+                except OSError:
+                    pass
+        ring = self._rings.pop(camera_id, None)
+        if ring is not None:
+            ring.close()
+        self.stats_by_camera.pop(camera_id, None)
+
+    def stop(self):
+        with self._lock:
+            if not self._running:
+                return
+            self._running = False
+        for worker in self._workers:
+            if worker.connected.is_set():
+                try:
+                    self._send(worker, ("stop",))
+                except OSError:
+                    pass
+        for worker in self._workers:
+            if worker.proc is not None:
+                try:
+                    worker.proc.wait(timeout=5)
+                except subprocess.TimeoutExpired:
+                    worker.proc.kill()
+        self._listener.close()
+        for ring in self._rings.values():
+            ring.close()
+        self._rings = {}
+
+    def stats(self):
+        return {
+            "processes": self.processes,
+            "workers": [{"index": w.index, "pid": w.pid, "alive": w.connected.is_set(), "frames": w.frames,
+                         "restarts": w.restarts, "cameras": sorted(w.cameras), "in_flight": len(w.pending)}
+                        for w in self._workers],
+        }
+
+
+if __name__ == "__main__":
+    worker_main((sys.argv[1], int(sys.argv[2])), int(sys.argv[3]))
@@ -0,0 +1,302 @@
+import os
+import queue
+import threading
+import time
+from collections import deque
+import cv2
+import numpy as np
+import settings
+from detection import metrics
+
+# Defaults for clip recording, overridable in the "recording" block of config.json
+RECORDING_DEFAULTS = {"enabled": True, "types": ["weapon", "accident"], "directory": "data/clips", "pre_roll": 10,
+                      "post_roll": 10, "max_clip_seconds": 60, "fps": 10, "width": 960, "quality": 80,
+                      "max_memory_mb": 32, "max_storage_gb": None, "fourcc": "mp4v"}
+
+# Clips are written under this suffix and renamed when complete
+TMP_SUFFIX = ".tmp.mp4"
+
+
+class StorageManager:
+    """Keeps the clip directory under `max_bytes` by deleting the oldest clips.
+
+    The directory is scanned once; after that every written clip is
+    registered with `add()`, so enforcing the limit never walks the disk.
+    """
+
+    def __init__(self, directory, max_bytes=None):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.evicted = 0
+        self._clips = deque()  # (mtime, path, size), oldest first
+        self._total = 0
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        clips = []
+        for root, _, files in os.walk(directory):
+            for name in files:
+                path = os.path.join(root, name)
+                if name.endswith(TMP_SUFFIX):
+                    os.remove(path)  # Half-written clip left by a crash
+                elif name.endswith(".mp4"):
+                    stat = os.stat(path)
+                    clips.append((stat.st_mtime, path, stat.st_size))
+        for clip in sorted(clips):
+            self._clips.append(clip)
+            self._total += clip[2]
+
+    def add(self, path):
+        with self._lock:
+            size = os.path.getsize(path)
+            self._clips.append((time.time(), path, size))
+            self._total += size
+        self.enforce()
+
+    def enforce(self):
+        """Delete the oldest clips until the directory fits the limit."""
+        if not self.max_bytes:
+            return
+        with self._lock:
+            while self._total > self.max_bytes and len(self._clips) > 1:  # Never delete the newest clip
+                _, path, size = self._clips.popleft()
+                self._total -= size
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+                self.evicted += 1
+                metrics.inc("vision_clips_evicted_total")
+
+    def stats(self):
+        with self._lock:
+            return {"clips": len(self._clips), "size_mb": round(self._total / (1024 * 1024), 1),
+                    "max_mb": round(self.max_bytes / (1024 * 1024), 1) if self.max_bytes else None,
+                    "evicted": self.evicted}
+
+
+class ClipWriter:
+    """One background thread turning finished clips (lists of JPEG frames) into mp4 files."""
+
+    def __init__(self, storage, fourcc="mp4v", max_pending=8):
+        self.storage = storage
+        self.fourcc = fourcc
+        self.written = 0
+        self.dropped = 0
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._thread = threading.Thread(target=self._run, name="clip-writer", daemon=True)
+        self._thread.start()
+
+    def submit(self, path, frames, fps):
+        try:
+            self._queue.put_nowait((path, frames, fps))
+        except queue.Full:
+            self.dropped += 1
+            print(f"⚠ Clip writer is behind, dropping {path}")
+
+    def _run(self):
+        while True:
+            path, frames, fps = self._queue.get()
+            try:
+                self._write(path, frames, fps)
+                self.storage.add(path)
+                self.written += 1
+                metrics.inc("vision_clips_written_total")
+            except Exception as e:
+                print(f"⚠ Could not write clip {path}: {e}")
+
+    def _write(self, path, frames, fps):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = path + TMP_SUFFIX  # Still ends in .mp4, OpenCV picks the container from the extension
+        writer = None
+        try:
+            for _, jpeg in frames:
+                frame = cv2.imdecode(np.frombuffer(jpeg, np.uint8), cv2.IMREAD_COLOR)
+                if writer is None:
+                    h, w = frame.shape[:2]
+                    writer = cv2.VideoWriter(tmp_path, cv2.VideoWriter_fourcc(*self.fourcc), fps, (w, h))
+                    if not writer.isOpened():
+                        raise RuntimeError(f"no {self.fourcc} encoder available")
+                writer.write(frame)
+        finally:
+            if writer is not None:
+                writer.release()
+        os.replace(tmp_path, path)
+
+
+class _Clip:
+    __slots__ = ("path", "start", "end", "frames", "bytes")
+
+    def __init__(self, path, start, end):
+        self.path = path
+        self.start = start
+        self.end = end
+        self.frames = []
+        self.bytes = 0
+
+
+class ClipRecorder:
+    """Per-camera pre-roll buffer of JPEG frames and the clip currently being recorded.
+
+    A thread subscribed to the camera's CaptureHub keeps `fps` frames per
+    second, downscaled to `width` and JPEG-compressed, in a ring covering
+    `pre_roll` seconds. `trigger()` starts a clip with that pre-roll and
+    keeps adding frames until `post_roll` seconds after the last trigger
+    (at most `max_clip_seconds`), then hands it to the ClipWriter. Ring and
+    open clip together never hold more than `max_memory_mb` of JPEG data.
+    """
+
+    def __init__(self, camera_id, hub, writer, directory, pre_roll=10, post_roll=10, max_clip_seconds=60, fps=10,
+                 width=960, quality=80, max_memory_mb=32):
+        self.camera_id = camera_id
+        self.writer = writer
+        self.directory = directory
+        self.pre_roll = pre_roll
+        self.post_roll = post_roll
+        self.max_clip_seconds = max_clip_seconds
+        self.fps = fps
+        self.width = width
+        self.params = [cv2.IMWRITE_JPEG_QUALITY, int(quality)]
+        self.max_bytes = int(max_memory_mb * 1024 * 1024)
+        self.clips = 0
+        self._ring = deque()  # (timestamp, jpeg bytes)
+        self._ring_bytes = 0
+        self._clip = None
+        self._lock = threading.Lock()
+        self._running = True
+        self.sub = hub.subscribe(f"recorder-{camera_id}")
+        self._thread = threading.Thread(target=self._run, name=f"recorder-{camera_id}", daemon=True)
+        self._thread.start()
+
+    def trigger(self, alert_type, timestamp=None):
+        """Record around now; returns the clip path relative to the clip directory (extends an open clip)."""
+        now = time.time() if timestamp is None else timestamp
+        with self._lock:
+            if self._clip is not None:
+                self._clip.end = min(now + self.post_roll, self._clip.start + self.max_clip_seconds)
+                return os.path.relpath(self._clip.path, self.directory)
+            stamp = time.strftime("%Y%m%d-%H%M%S", time.localtime(now))
+            name = "".join(c if c.isalnum() or c in "-_" else "_" for c in self.camera_id)
+            clip = _Clip(os.path.join(self.directory, name, f"{stamp}_{alert_type}.mp4"), now - self.pre_roll,
+                         now + self.post_roll)
+            clip.frames = [entry for entry in self._ring if entry[0] >= clip.start]
+            clip.bytes = sum(len(jpeg) for _, jpeg in clip.frames)
+            self._clip = clip
+            return os.path.relpath(clip.path, self.directory)
+
+    def _encode(self, frame):
+        h, w = frame.shape[:2]
+        if w > self.width:
+            frame = cv2.resize(frame, (self.width, h * self.width // w), interpolation=cv2.INTER_AREA)
+        ok, jpeg = cv2.imencode(".jpg", frame, self.params)
+        return jpeg.tobytes() if ok else None
+
+    def _run(self):
+        interval = 1.0 / self.fps
+        next_due = 0.0
+        while self._running:
+            view = self.sub.next_frame(timeout=1.0)
+            now = time.time()
+            if view is not None and now >= next_due:
+                next_due = max(next_due + interval, now)
+                with metrics.stage_timer("record", self.camera_id):
+                    jpeg = self._encode(view.frame)
+                if jpeg is not None:
+                    self._add(view.timestamp, jpeg)
+            with self._lock:
+                clip = self._clip
+                if clip is not None and (now >= clip.end or clip.bytes > self.max_bytes):
+                    self._clip = None
+                    self._finish(clip)
+            if view is None and not self.sub.isOpened():
+                break
+
+    def _add(self, timestamp, jpeg):
+        with self._lock:
+            entry = (timestamp, jpeg)
+            self._ring.append(entry)
+            self._ring_bytes += len(jpeg)
+            if self._clip is not None:
+                self._clip.frames.append(entry)  # Shares the bytes with the ring while both hold them
+                self._clip.bytes += len(jpeg)
+            clip_bytes = self._clip.bytes if self._clip is not None else 0
+            # Drop old pre-roll frames by age, and by size so ring + clip stay under max_memory_mb
+            while self._ring and (self._ring[0][0] < timestamp - self.pre_roll
+                                  or self._ring_bytes + clip_bytes > self.max_bytes):
+                _, old = self._ring.popleft()
+                self._ring_bytes -= len(old)
+
+    def _finish(self, clip):
+        if clip.frames:
+            self.clips += 1
+            self.writer.submit(clip.path, clip.frames, self.fps)
+
+    def stop(self):
+        self._running = False
+        with self._lock:
+            clip, self._clip = self._clip, None
+        if clip is not None:
+            self._finish(clip)  # Keep what was recorded so far
+        self.sub.release()
+
+    def stats(self):
+        with self._lock:
+            return {"buffered_frames": len(self._ring), "buffered_mb": round(self._ring_bytes / (1024 * 1024), 2),
+                    "recording": self._clip is not None, "clips": self.clips}
+
+
+_recorders = {}
+_writer = None
+_recorders_lock = threading.Lock()
+
+
+def recording_options():
+    return {**RECORDING_DEFAULTS, **settings.CONFIG.get("recording", {})}
+
+
+def get_clip_writer():
+    """The process-wide writer and storage manager (limit: max_storage_gb, else the clips' share of storage_limit)."""
+    global _writer
+    with _recorders_lock:
+        if _writer is None:
+            options = recording_options()
+            limit_gb = settings.storage_budget(settings.CONFIG)[0]
+            limit = float(limit_gb) * 1024 ** 3 if limit_gb else None
+            _writer = ClipWriter(StorageManager(options["directory"], limit), options["fourcc"])
+        return _writer
+
+
+def start_recorder(camera_id, hub):
+    """Start buffering `camera_id` (no-op when recording is disabled or it already runs)."""
+    options = recording_options()
+    if not options["enabled"]:
+        return None
+    writer = get_clip_writer()
+    with _recorders_lock:
+        recorder = _recorders.get(camera_id)
+        if recorder is None:
+            keys = ("pre_roll", "post_roll", "max_clip_seconds", "fps", "width", "quality", "max_memory_mb")
+            recorder = _recorders[camera_id] = ClipRecorder(camera_id, hub, writer, options["directory"],
+                                                            **{key: options[key] for key in keys})
+        return recorder
+
+
+def stop_recorder(camera_id):
+    with _recorders_lock:
+        recorder = _recorders.pop(camera_id, None)
+    if recorder is not None:
+        recorder.stop()
+
+
+def get_recorder(camera_id):
+    with _recorders_lock:
+        return _recorders.get(camera_id)
+
+
+def recording_stats():
+    with _recorders_lock:
+        recorders = dict(_recorders)
+    return {
+        "cameras": {camera_id: recorder.stats() for camera_id, recorder in recorders.items()},
+        "written": _writer.written if _writer else 0,
+        "storage": _writer.storage.stats() if _writer else None,
+    }
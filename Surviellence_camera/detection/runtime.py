@@ -0,0 +1,206 @@
+"""Headless detector runtime: run detector cores on a stream until cancelled.
+
+    python -m detection.runtime crowd,weapon rtsp://camera/stream
+    python -m detection.runtime security static/videos/odd_activity.mp4 --loop --display
+
+Display, status events and the dashboard stream are optional FrameSinks and
+audio is an alert engine sink, so nothing is drawn unless a sink needs it.
+"""
+import argparse
+import os
+import signal
+import sys
+import threading
+import time
+import settings
+from detection.frame_hub import open_stream
+from detection.detectors import create_detector
+from detection.alerts import get_alert_engine
+from detection import metrics, events
+
+
+class CancelToken:
+    """Cooperative cancellation shared by a detector loop and whoever may stop it."""
+
+    def __init__(self):
+        self.reason = None
+        self._event = threading.Event()
+
+    def cancel(self, reason="cancelled"):
+        if not self._event.is_set():
+            self.reason = reason
+            self._event.set()
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+
+    def wait(self, timeout=None):
+        """Sleep up to `timeout` seconds; returns True as soon as the token is cancelled."""
+        return self._event.wait(timeout)
+
+
+class FrameSink:
+    """Receives every processed frame with {detector name: result}. `frame` is shared and read-only."""
+
+    def handle(self, frame, results):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class BroadcastSink(FrameSink):
+    """Feeds a FrameBroadcaster, which only draws and encodes while someone watches."""
+
+    def __init__(self, broadcaster):
+        self.broadcaster = broadcaster
+
+    def handle(self, frame, results):
+        if self.broadcaster.wants_frame():
+            self.broadcaster.publish(frame, dict(results))
+
+
+class StatusSink(FrameSink):
+    """Publishes a per-frame status line on the event bus (unchanged lines are coalesced there).
+
+    `template` is formatted with `alert` (any detector alerting) and the results.
+    """
+
+    def __init__(self, camera, key, template):
+        self.camera = camera
+        self.key = key
+        self.template = template
+
+    def handle(self, frame, results):
+        alert = any(result["alert"] for result in results.values())
+        events.publish(self.template.format(alert=alert, results=results), key=self.key, camera=self.camera)
+
+
+def display_available():
+    return sys.platform in ("win32", "darwin") or bool(os.environ.get("DISPLAY") or os.environ.get("WAYLAND_DISPLAY"))
+
+
+class DisplaySink(FrameSink):
+    """Local debug window with the annotated frames; 'q' in the window cancels `token`.
+
+    Disables itself with a warning on headless machines and OpenCV builds without GUI support.
+    """
+
+    def __init__(self, title, token=None):
+        self.title = title
+        self.token = token
+        self.enabled = display_available()
+        if not self.enabled:
+            print(f"⚠ No display available, not showing {title}")
+
+    def handle(self, frame, results):
+        if not self.enabled:
+            return
+        import cv2
+        from detection.streaming import annotate
+        try:
+            cv2.imshow(self.title, annotate(frame.copy(), results))
+            key = cv2.waitKey(1) & 0xFF
+        except cv2.error as e:
+            self.enabled = False
+            print(f"⚠ Cannot show {self.title}: {e}")
+            return
+        if key == ord("q") and self.token is not None:
+            self.token.cancel("closed from the display window")
+
+    def close(self):
+        if self.enabled:
+            import cv2
+            try:
+                cv2.destroyWindow(self.title)
+            except cv2.error:
+                pass
+
+
+def run_detectors(source, names, options=None, token=None, sinks=(), camera=None, loop=False):
+    """Run the detectors `names` on `source` until `token` is cancelled or the stream ends.
+
+    `options` maps detector name -> option overrides on top of the
+    "detectors" block of config.json. Alerts go to the alert engine; every
+    frame goes to `sinks` with each detector's latest result, so displays
+    keep moving while detectors skip static frames. Returns a summary of the run.
+    """
+    token = token or CancelToken()
+    camera = camera or str(source)
+    configured = settings.CONFIG.get("detectors", {})
+    detectors = {name: create_detector(name, {**configured.get(name, {}), **(options or {}).get(name, {}),
+                                              "camera": camera})
+                 for name in names}
+    engine = get_alert_engine()
+    cap = open_stream(source, name="+".join(names), loop=loop)
+    started = time.monotonic()
+    frames = 0
+    last_results = {}
+    try:
+        while not token.cancelled:
+            view = cap.next_frame(timeout=0.5)  # Wakes up regularly to notice cancellation
+            if view is None:
+                if not cap.isOpened():
+                    break  # Stream ended
+                continue
+            processed = False
+            for name, detector in detectors.items():
+                result = detector.maybe_process(view.frame)
+                if result is None:
+                    continue  # No motion or over the latency budget
+                processed = True
+                last_results[name] = result
+                with metrics.stage_timer("alert_dispatch", camera):
+                    # Alerts carry the frame's decode time, so their timestamp (and clip) match the footage
+                    engine.process(camera, name, detector.events(result), timestamp=view.timestamp,
+                                   levels=detector.levels())
+                    for zone, levels, zone_events in detector.zone_events(result):
+                        engine.process(camera, name, zone_events, timestamp=view.timestamp, zone=zone, levels=levels)
+            if processed:
+                frames += 1
+            for sink in sinks:
+                sink.handle(view.frame, last_results)
+    finally:
+        cap.release()
+        for sink in sinks:
+            sink.close()
+    return {"camera": camera, "detectors": list(names), "frames": frames,
+            "seconds": round(time.monotonic() - started, 1), "cancelled": token.reason}
+
+
+def install_signal_handlers(token):
+    """Cancel `token` on Ctrl+C / SIGTERM instead of killing the process mid-frame (main thread only)."""
+    for signum in (signal.SIGINT, getattr(signal, "SIGTERM", None)):
+        if signum is not None:
+            signal.signal(signum, lambda *args: token.cancel("signal"))
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Run detectors on one stream without a web server")
+    parser.add_argument("detectors", help="Comma-separated detectors, e.g. crowd,weapon")
+    parser.add_argument("source", help="Stream URL, file or device index")
+    parser.add_argument("--camera", default=None, help="Camera id for alerts and metrics (default: the source)")
+    parser.add_argument("--loop", action="store_true", help="Rewind file sources when they end")
+    parser.add_argument("--display", action="store_true", help="Show annotated frames in a local window")
+    parser.add_argument("--duration", type=float, default=None, help="Stop after this many seconds")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    token = CancelToken()
+    install_signal_handlers(token)
+    if args.duration:
+        timer = threading.Timer(args.duration, token.cancel, ("duration",))
+        timer.daemon = True
+        timer.start()
+    source = int(args.source) if args.source.isdigit() else args.source
+    names = [name for name in args.detectors.split(",") if name]
+    sinks = [DisplaySink(f"Vision Tower - {args.camera or args.source}", token)] if args.display else []
+    summary = run_detectors(source, names, token=token, sinks=sinks, camera=args.camera, loop=args.loop)
+    print(summary)
+
+
+if __name__ == "__main__":
+    main()
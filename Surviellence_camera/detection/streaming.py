@@ -0,0 +1,178 @@
+import threading
+import time
+import cv2
+from detection import metrics
+
+# Defaults for broadcasters, see configure_streaming()
+STREAM_DEFAULTS = {"quality": 70, "width": 960, "max_fps": 15}
+
+# BGR box colour per detector
+COLORS = {"crowd": (0, 255, 0), "weapon": (0, 0, 255), "security": (0, 0, 255), "accident": (0, 255, 255)}
+
+
+class Viewer:
+    """One client of a FrameBroadcaster. Only ever sees the newest JPEG, so slow viewers skip frames."""
+
+    def __init__(self, broadcaster):
+        self.broadcaster = broadcaster
+        self.last_seq = 0
+
+    def next_jpeg(self, timeout=5.0):
+        """Wait for a JPEG newer than the last one returned. Returns bytes or None on timeout."""
+        b = self.broadcaster
+        with b._cond:
+            if not b._cond.wait_for(lambda: b._seq > self.last_seq or b.closed, timeout) or b.closed:
+                return None
+            self.last_seq = b._seq
+            return b._jpeg
+
+    def close(self):
+        self.broadcaster._remove_viewer(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class FrameBroadcaster:
+    """Encodes a camera's annotated frames once and shares the JPEG with every viewer.
+
+    Nothing is drawn or encoded while nobody is watching, and encoding is
+    capped at `max_fps` at `width` pixels wide.
+    """
+
+    def __init__(self, camera_id, quality=70, width=960, max_fps=15):
+        self.camera_id = camera_id
+        self.quality = int(quality)
+        self.width = int(width)
+        self.min_interval = 1.0 / max_fps if max_fps else 0.0
+        self.closed = False
+        self.frames_encoded = 0
+        self._viewers = 0
+        self._seq = 0
+        self._jpeg = None
+        self._last_encode = 0.0
+        self._cond = threading.Condition()
+
+    @property
+    def viewers(self):
+        return self._viewers
+
+    def wants_frame(self):
+        """True when a frame published now would be encoded (someone watching, not rate-limited)."""
+        return self._viewers > 0 and time.monotonic() - self._last_encode >= self.min_interval
+
+    def publish(self, frame, results=None):
+        """Annotate (on a copy) and encode `frame` if anyone is watching. Returns True if encoded."""
+        if not self.wants_frame():
+            return False
+        self._last_encode = time.monotonic()
+
+        with metrics.stage_timer("encode", self.camera_id):
+            h, w = frame.shape[:2]
+            if self.width and w > self.width:
+                scale = self.width / w
+                frame = cv2.resize(frame, (self.width, int(h * scale)), interpolation=cv2.INTER_AREA)
+            else:
+                scale = 1.0
+                frame = frame.copy()  # Shared frames are read-only
+            if results:
+                annotate(frame, results, scale)
+            ok, jpeg = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, self.quality])
+        if not ok:
+            return False
+
+        with self._cond:
+            self._jpeg = jpeg.tobytes()
+            self._seq += 1
+            self.frames_encoded += 1
+            self._cond.notify_all()
+        return True
+
+    def viewer(self):
+        with self._cond:
+            self._viewers += 1
+        return Viewer(self)
+
+    def _remove_viewer(self, viewer):
+        with self._cond:
+            self._viewers = max(0, self._viewers - 1)
+
+    def mjpeg(self, timeout=10.0):
+        """multipart/x-mixed-replace generator for an <img> tag."""
+        with self.viewer() as viewer:
+            while not self.closed:
+                jpeg = viewer.next_jpeg(timeout)
+                if jpeg is None:
+                    continue
+                yield b"--frame\r\nContent-Type: image/jpeg\r\nContent-Length: " + str(len(jpeg)).encode() + b"\r\n\r\n" + jpeg + b"\r\n"
+
+    def close(self):
+        with self._cond:
+            self.closed = True
+            self._cond.notify_all()
+
+    def status(self):
+        return {"camera": self.camera_id, "viewers": self._viewers, "frames_encoded": self.frames_encoded,
+                "quality": self.quality, "width": self.width}
+
+
+def annotate(frame, results, scale=1.0):
+    """Draw each detector's boxes (full-resolution coordinates) onto `frame` in place."""
+    y = 30
+    for name, result in results.items():
+        color = COLORS.get(name, (255, 255, 255))
+        for x1, y1, x2, y2 in result.get("boxes", []):
+            cv2.rectangle(frame, (int(x1 * scale), int(y1 * scale)), (int(x2 * scale), int(y2 * scale)), color, 2)
+        label = f"{name}: {'ALERT' if result.get('alert') else 'ok'}"
+        if "person_count" in result:
+            label += f" ({result['person_count']} people)"
+        cv2.putText(frame, label, (10, y), cv2.FONT_HERSHEY_SIMPLEX, 0.7, color, 2)
+        y += 28
+    return frame
+
+
+_broadcasters = {}
+_broadcasters_lock = threading.Lock()
+
+
+def configure_streaming(**options):
+    """Override quality / width / max_fps for broadcasters created later."""
+    STREAM_DEFAULTS.update({k: v for k, v in options.items() if k in STREAM_DEFAULTS})
+
+
+def get_broadcaster(camera_id):
+    """The shared broadcaster for `camera_id`, created on first use."""
+    with _broadcasters_lock:
+        broadcaster = _broadcasters.get(camera_id)
+        if broadcaster is None:
+            broadcaster = _broadcasters[camera_id] = FrameBroadcaster(camera_id, **STREAM_DEFAULTS)
+        return broadcaster
+
+
+def known_cameras():
+    """Cameras that have published (or been asked for) a stream."""
+    with _broadcasters_lock:
+        return set(_broadcasters)
+
+
+def ws_stream(socketio, sid, camera_id, stop_event, ack_timeout=5.0):
+    """Push binary JPEG frames to one Socket.IO client.
+
+    The next frame is only sent once the client acknowledged the previous
+    one, so a slow client just sees fewer frames instead of a growing queue.
+    """
+    acked = threading.Event()
+    acked.set()
+    with get_broadcaster(camera_id).viewer() as viewer:
+        while not stop_event.is_set():
+            if not acked.wait(ack_timeout):
+                acked.set()  # Lost ack, resume rather than stall forever
+                continue
+            jpeg = viewer.next_jpeg(timeout=1.0)
+            if jpeg is None:
+                continue
+            acked.clear()
+            socketio.emit("frame", {"camera": camera_id, "jpeg": jpeg}, to=sid, callback=lambda *args: acked.set())
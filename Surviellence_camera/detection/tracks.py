@@ -0,0 +1,170 @@
+import numpy as np
+
+
+class TrackTable:
+    """Per-camera state of tracked people in flat NumPy arrays, one row per track.
+
+    Rows hold id, last box, first / last seen time and velocity (px/s of the
+    box center). `update()` takes the tracker's ids and boxes for one frame
+    and updates every row with array operations, so the cost stays in the
+    tens of microseconds at full frame rate. Rows are kept for the longest
+    count window after a track is lost, which is what the sliding-window
+    unique counts are computed from.
+
+    With a counting `line` ((x1, y1), (x2, y2), fractions of the frame size
+    like camera ROIs and zones) a track whose center moves from the left to
+    the right side of the line (seen from the first point towards the second)
+    counts as an entry, the other way as an exit. The line is scaled to
+    pixels by the `frame_size` passed to `update()`.
+    """
+
+    # Per-row arrays, resized by _grow() and compacted by _prune()
+    COLUMNS = ("ids", "boxes", "centers", "first_seen", "last_seen", "velocity")
+
+    def __init__(self, windows=(60, 300), line=None, lost_after=1.0, capacity=64):
+        self.windows = tuple(windows)
+        self.line_fractions = None if line is None else np.asarray(line, np.float32).reshape(2, 2)
+        self.line = None  # In pixels, once the frame size is known
+        self._frame_size = None
+        self.lost_after = lost_after  # Seconds unseen before a track no longer counts as present
+        self.entries = 0
+        self.exits = 0
+        self.size = 0
+        self.ids = np.full(capacity, -1, np.int64)
+        self.boxes = np.zeros((capacity, 4), np.float32)
+        self.centers = np.zeros((capacity, 2), np.float32)
+        self.first_seen = np.zeros(capacity, np.float64)
+        self.last_seen = np.zeros(capacity, np.float64)
+        self.velocity = np.zeros((capacity, 2), np.float32)
+
+    def _grow(self, capacity):
+        for name in self.COLUMNS:
+            old = getattr(self, name)
+            new = np.zeros((capacity,) + old.shape[1:], old.dtype)
+            new[:self.size] = old[:self.size]
+            setattr(self, name, new)
+        self.ids[self.size:] = -1
+
+    def configure(self, windows=None, line=None):
+        if windows is not None:
+            self.windows = tuple(windows)
+        self.line_fractions = None if line is None else np.asarray(line, np.float32).reshape(2, 2)
+        self.line = None
+        self._frame_size = None
+
+    def _side(self, points):
+        """Side of each point relative to the counting line (+1 right or on it, -1 left, in image coordinates)."""
+        (x1, y1), (x2, y2) = self.line
+        return np.where((x2 - x1) * (points[:, 1] - y1) - (y2 - y1) * (points[:, 0] - x1) >= 0, 1, -1)
+
+    def _crosses_segment(self, start, end):
+        """Movements start -> end that pass between the line's two end points."""
+        (x1, y1), (x2, y2) = self.line
+        dx, dy = end[:, 0] - start[:, 0], end[:, 1] - start[:, 1]
+        side1 = np.sign(dx * (y1 - start[:, 1]) - dy * (x1 - start[:, 0]))
+        side2 = np.sign(dx * (y2 - start[:, 1]) - dy * (x2 - start[:, 0]))
+        return side1 != side2
+
+    def update(self, ids, boxes, timestamp, frame_size=None):
+        """Record one frame: `ids` (-1 / None for unconfirmed boxes) and (N, 4) xyxy `boxes`.
+
+        `frame_size` (width, height) places the counting line; without it no
+        crossings are counted. Returns the dwell time in seconds per input
+        box (None where unconfirmed).
+        """
+        if self.line_fractions is not None and frame_size is not None and tuple(frame_size) != self._frame_size:
+            self._frame_size = tuple(frame_size)
+            self.line = self.line_fractions * np.asarray(self._frame_size, np.float32)
+        if not isinstance(ids, np.ndarray):
+            ids = np.array([-1 if i is None else i for i in ids], np.int64)
+        boxes = np.asarray(boxes, np.float32).reshape(-1, 4)
+        dwell = np.full(len(ids), np.nan)
+        valid = ids >= 0
+        ids, boxes = ids[valid], boxes[valid]
+        centers = (boxes[:, :2] + boxes[:, 2:]) / 2
+
+        # Existing rows for these ids (sorted lookup instead of a per-track dict)
+        n = self.size
+        slots = np.full(len(ids), -1, np.int64)
+        if n and len(ids):
+            order = np.argsort(self.ids[:n])
+            pos = np.minimum(np.searchsorted(self.ids[:n], ids, sorter=order), n - 1)
+            found = self.ids[order[pos]] == ids
+            slots[found] = order[pos[found]]
+
+        known = slots >= 0
+        if known.any():
+            rows = slots[known]
+            new_centers = centers[known]
+            dt = np.maximum(timestamp - self.last_seen[rows], 1e-3)[:, None]
+            self.velocity[rows] = 0.5 * self.velocity[rows] + 0.5 * (new_centers - self.centers[rows]) / dt
+            if self.line is not None:
+                before, after = self._side(self.centers[rows]), self._side(new_centers)
+                crossed = (before != after) & self._crosses_segment(self.centers[rows], new_centers)
+                self.entries += int(np.count_nonzero(crossed & (after > 0)))
+                self.exits += int(np.count_nonzero(crossed & (after < 0)))
+            self.boxes[rows] = boxes[known]
+            self.centers[rows] = new_centers
+            self.last_seen[rows] = timestamp
+
+        new = ~known
+        count = int(np.count_nonzero(new))
+        if count:
+            if n + count > len(self.ids):
+                self._grow(max(2 * len(self.ids), n + count))
+            rows = np.arange(n, n + count)
+            self.ids[rows] = ids[new]
+            self.boxes[rows] = boxes[new]
+            self.centers[rows] = centers[new]
+            self.first_seen[rows] = timestamp
+            self.last_seen[rows] = timestamp
+            self.velocity[rows] = 0
+            slots[new] = rows
+            self.size = n + count
+
+        dwell[valid] = timestamp - self.first_seen[slots]
+        self._prune(timestamp)
+        return [None if d != d else d for d in dwell.round(2).tolist()]  # NaN -> None
+
+    def _prune(self, now):
+        """Drop rows unseen for longer than the longest window (compacts the arrays in place)."""
+        horizon = max(self.windows, default=0) + self.lost_after
+        keep = self.last_seen[:self.size] >= now - horizon
+        if keep.all():
+            return
+        count = int(np.count_nonzero(keep))
+        for name in self.COLUMNS:
+            array = getattr(self, name)
+            array[:count] = array[:self.size][keep]
+        self.ids[count:self.size] = -1
+        self.size = count
+
+    def present(self, now):
+        """Row indices of tracks seen within `lost_after` seconds."""
+        return np.flatnonzero(self.last_seen[:self.size] >= now - self.lost_after)
+
+    def summary(self, now):
+        """Present / unique-per-window counts, dwell statistics and line crossings."""
+        present = self.present(now)
+        dwell = self.last_seen[present] - self.first_seen[present]
+        last_seen = self.last_seen[:self.size]
+        summary = {
+            "present": len(present),
+            "unique": {f"{w}s": int(np.count_nonzero(last_seen >= now - w)) for w in self.windows},
+            "mean_dwell": round(float(dwell.mean()), 2) if len(dwell) else 0.0,
+            "max_dwell": round(float(dwell.max()), 2) if len(dwell) else 0.0,
+        }
+        if self.line_fractions is not None:
+            summary["entries"] = self.entries
+            summary["exits"] = self.exits
+        return summary
+
+    def tracks(self, now):
+        """Present tracks as dicts (for status pages and debugging)."""
+        return [{
+            "id": int(self.ids[i]),
+            "box": self.boxes[i].astype(int).tolist(),
+            "first_seen": float(self.first_seen[i]),
+            "last_seen": float(self.last_seen[i]),
+            "velocity": self.velocity[i].round(1).tolist(),
+        } for i in self.present(now)]
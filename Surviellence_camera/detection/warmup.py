@@ -0,0 +1,87 @@
+import sys
+import threading
+import time
+
+# Heavy modules reported by readiness(), in load order
+HEAVY_MODULES = ("cv2", "numpy", "torch", "ultralytics", "pygame", "paho.mqtt.client")
+
+
+class Warmup:
+    """Loads detector models on a background thread so the web UI can start serving immediately.
+
+    Each detector moves through pending -> loading -> ready / failed; the app
+    is ready once every requested detector is ready.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.detectors = {}
+        self.started_at = None
+        self.finished_at = None
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def start(self, names, detector_options=None):
+        """Warm `names` (detector names) in the background. Safe to call more than once."""
+        with self._lock:
+            if self._thread is not None:
+                return
+            self.enabled = True
+            self.started_at = time.time()
+            self.detectors = {name: {"state": "pending"} for name in names}
+            self._thread = threading.Thread(target=self._run, args=(list(names), detector_options or {}),
+                                            name="warmup", daemon=True)
+            self._thread.start()
+
+    def _run(self, names, detector_options):
+        for name in names:
+            entry = self.detectors[name]
+            entry["state"] = "loading"
+            started = time.perf_counter()
+            try:
+                from detection.backends import get_backend  # Pulls in cv2 / numpy here, not at app import
+                from detection.detectors import DETECTORS
+                if name not in DETECTORS:
+                    raise ValueError(f"Unknown detector: {name}")
+                options = {**DETECTORS[name].defaults, **detector_options.get(name, {})}
+                if "backend" in options:  # Motion detectors have no model to load
+                    backend = get_backend(options)
+                    backend.warmup()
+                    entry["backend"] = backend.name
+                entry["state"] = "ready"
+            except Exception as e:
+                entry["state"] = "failed"
+                entry["error"] = f"{type(e).__name__}: {e}"
+                print(f"⚠ Warm-up of {name} failed: {entry['error']}")
+            entry["seconds"] = round(time.perf_counter() - started, 3)
+        self.finished_at = time.time()
+
+    def ready(self):
+        if not self.enabled:
+            return True  # Lazy mode: models load on first use
+        return self.finished_at is not None and all(d["state"] == "ready" for d in self.detectors.values())
+
+    def status(self):
+        return {
+            "enabled": self.enabled,
+            "done": self.finished_at is not None,
+            "seconds": round((self.finished_at or time.time()) - self.started_at, 3) if self.started_at else None,
+            "detectors": {name: dict(entry) for name, entry in self.detectors.items()},
+        }
+
+
+# Process-wide warm-up state shown by /health and /ready
+WARMUP = Warmup()
+
+
+def readiness():
+    """Warm-up progress, loaded models and which heavy modules are imported so far."""
+    backends = []
+    if "detection.backends" in sys.modules:
+        backends = sys.modules["detection.backends"].loaded_backends()
+    return {
+        "ready": WARMUP.ready(),
+        "warmup": WARMUP.status(),
+        "backends": backends,
+        "modules": {name: name in sys.modules for name in HEAVY_MODULES},
+    }
@@ -0,0 +1,110 @@
+import cv2
+import numpy as np
+
+# Camera config keys handed to every detector of that camera (see CameraPipeline.options)
+ZONE_OPTION_KEYS = ("roi", "zones", "density_grid")
+
+# Zone membership is looked up on a label raster this many times smaller than the frame
+RASTER_FACTOR = 4
+
+
+def to_pixels(points, width, height):
+    """Config polygon ([[x, y], ...] as fractions of the frame size) -> int32 pixel points."""
+    return np.rint(np.asarray(points, np.float32).reshape(-1, 2) * (width, height)).astype(np.int32)
+
+
+class ZoneMap:
+    """Regions of interest and named zones of one camera.
+
+    Polygons are given as fractions of the frame width / height, so the same
+    config works for any stream resolution. `crop()` cuts the frame down to
+    the bounding box of the union of the `roi` polygons and blacks out what
+    lies outside them, so detectors never look at sky, walls or roads.
+    `members()` assigns people (the bottom-center of their box, i.e. their
+    feet) to `zones` and `density()` bins them into a coarse `density_grid`
+    (rows, cols), both with array operations. Masks are built once per frame size.
+    """
+
+    def __init__(self, roi=None, zones=None, density_grid=(6, 8)):
+        self.roi = [p for p in (roi or []) if len(p) >= 3]
+        self.zones = [zone for zone in (zones or []) if len(zone.get("polygon", [])) >= 3][:32]  # One bit each
+        self.names = [zone.get("name", f"zone{i}") for i, zone in enumerate(self.zones)]
+        self.grid = tuple(density_grid) if density_grid else None
+        self._shape = None
+        self._labels_shape = None
+
+    @classmethod
+    def from_options(cls, options):
+        """Build from a detector's options, or return None when the camera has no ROI, zones or grid."""
+        if not any(options.get(key) for key in ZONE_OPTION_KEYS):
+            return None
+        return cls(options.get("roi"), options.get("zones"), options.get("density_grid", (6, 8)))
+
+    def _build_roi(self, shape):
+        h, w = shape[:2]
+        mask = np.zeros((h, w), np.uint8)
+        cv2.fillPoly(mask, [to_pixels(p, w, h) for p in self.roi], 255)
+        x, y, bw, bh = cv2.boundingRect(mask)
+        self._shape = shape
+        self.offset = (x, y)
+        self._rect = (slice(y, y + bh), slice(x, x + bw))
+        self._mask = mask[self._rect]
+        self._full = bool(self._mask.all())
+        self._buffer = np.zeros((bh, bw) + shape[2:], np.uint8)  # Stays black outside the mask
+        self.coverage = bw * bh / float(w * h)
+
+    def crop(self, frame):
+        """(roi_frame, (x, y) offset of roi_frame in `frame`). Returns the frame itself without an ROI."""
+        if not self.roi:
+            return frame, (0, 0)
+        if frame.shape != self._shape:
+            self._build_roi(frame.shape)
+        view = frame[self._rect]
+        if self._full:
+            return view, self.offset
+        cv2.copyTo(view, self._mask, self._buffer)  # Only pixels inside the polygons are written
+        return self._buffer, self.offset
+
+    def _build_labels(self, shape):
+        h, w = shape[:2]
+        rh, rw = max(1, h // RASTER_FACTOR), max(1, w // RASTER_FACTOR)
+        self._labels = np.zeros((rh, rw), np.uint32)
+        layer = np.empty((rh, rw), np.uint8)
+        for bit, zone in enumerate(self.zones):
+            layer[:] = 0
+            cv2.fillPoly(layer, [to_pixels(zone["polygon"], rw, rh)], 1)
+            self._labels |= layer.astype(np.uint32) << np.uint32(bit)
+        self._labels_shape = shape[:2]
+
+    @staticmethod
+    def _feet(boxes, shape):
+        h, w = shape[:2]
+        return np.clip((boxes[:, 0] + boxes[:, 2]) / 2, 0, w - 1), np.clip(boxes[:, 3], 0, h - 1)
+
+    def members(self, boxes, shape):
+        """Boolean (boxes, zones) matrix: which zones each full-resolution xyxy box's feet are in."""
+        boxes = np.asarray(boxes, np.float32).reshape(-1, 4)
+        if not self.zones or not len(boxes):
+            return np.zeros((len(boxes), len(self.zones)), bool)
+        h, w = shape[:2]
+        if self._labels_shape != (h, w):
+            self._build_labels(shape)
+        rh, rw = self._labels.shape
+        feet_x, feet_y = self._feet(boxes, shape)
+        labels = self._labels[(feet_y * rh / h).astype(int), (feet_x * rw / w).astype(int)]
+        return ((labels[:, None] >> np.arange(len(self.zones), dtype=np.uint32)) & 1).astype(bool)
+
+    def density(self, boxes, shape):
+        """People per cell of the density grid (list of rows), or None without a grid."""
+        if not self.grid:
+            return None
+        boxes = np.asarray(boxes, np.float32).reshape(-1, 4)
+        rows, cols = self.grid
+        h, w = shape[:2]
+        feet_x, feet_y = self._feet(boxes, shape)
+        cells = (feet_y * rows / h).astype(int) * cols + (feet_x * cols / w).astype(int)
+        return np.bincount(cells, minlength=rows * cols).reshape(rows, cols).tolist()
+
+    def thresholds(self, key):
+        """{zone index: value of `key`} for the zones that set it (e.g. crowd_threshold)."""
+        return {i: zone[key] for i, zone in enumerate(self.zones) if zone.get(key) is not None}
@@ -0,0 +1,361 @@
+"""Capacity test: how many cameras can this node run, per detector mix?
+
+Starts simulated MJPEG cameras (a separate process looping the bundled
+clips over HTTP), points camera pipelines at them and ramps the camera
+count, measuring per step the sustained detection FPS, frame-to-alert
+latency, CPU, RSS and dropped frames. A step is sustainable when the
+cameras keep up with target_fps and alerts stay within the latency budget.
+
+    python loadtest.py
+    python loadtest.py --mixes weapon security weapon+security --ramp 1 2 4 8 16 --target-fps 5
+    python loadtest.py --width 1920 --height 1080 --fps 25 --jitter 0.3 --disconnect-every 60
+    python loadtest.py serve --cameras 8 --port 8600   # Only the simulated cameras
+"""
+import argparse
+import glob
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import cv2
+from benchmark import environment, latency_summary, peak_rss_mb
+
+
+# ---- simulated cameras ---------------------------------------------------
+
+def encode_clip(path, width, height, quality, max_frames):
+    """The first `max_frames` frames of `path` resized and JPEG-encoded once, so serving costs no CPU."""
+    cap = cv2.VideoCapture(path)
+    fps = cap.get(cv2.CAP_PROP_FPS) or 25.0
+    frames = []
+    while len(frames) < max_frames:
+        ok, frame = cap.read()
+        if not ok:
+            break
+        frame = cv2.resize(frame, (width, height), interpolation=cv2.INTER_AREA)
+        frames.append(cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, quality])[1].tobytes())
+    cap.release()
+    return frames, fps
+
+
+class SimulatedCameras(ThreadingHTTPServer):
+    """MJPEG cameras on /cam<i>.mjpg, each looping one of the clips at `fps`.
+
+    `jitter` varies every frame interval by up to that fraction, and with
+    `disconnect_every` a connection is dropped after a random time averaging
+    that many seconds, so reconnect handling is part of the measurement.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, address, clips, cameras, fps, jitter=0.0, disconnect_every=0):
+        super().__init__(address, _CameraHandler)
+        self.clips = clips
+        self.cameras = cameras
+        self.fps = fps
+        self.jitter = jitter
+        self.disconnect_every = disconnect_every
+        self.connections = 0
+        self.disconnects = 0
+
+
+class _CameraHandler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        server = self.server
+        name = self.path.strip("/").split(".")[0]
+        index = int(name[3:]) if name.startswith("cam") and name[3:].isdigit() else -1
+        if not 0 <= index < server.cameras:
+            self.send_error(404)
+            return
+        frames = server.clips[index % len(server.clips)]
+        position = (index * 37) % len(frames)  # Cameras sharing a clip are out of phase
+        server.connections += 1
+        drop_at = time.monotonic() + random.expovariate(1.0 / server.disconnect_every) if server.disconnect_every else None
+
+        self.send_response(200)
+        self.send_header("Content-Type", "multipart/x-mixed-replace; boundary=frame")
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+        interval = 1.0 / server.fps
+        next_due = time.monotonic()
+        try:
+            while drop_at is None or time.monotonic() < drop_at:
+                jpeg = frames[position]
+                position = (position + 1) % len(frames)
+                self.wfile.write(b"--frame\r\nContent-Type: image/jpeg\r\nContent-Length: " + str(len(jpeg)).encode()
+                                 + b"\r\n\r\n" + jpeg + b"\r\n")
+                next_due += interval * (1 + random.uniform(-server.jitter, server.jitter))
+                delay = next_due - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                else:
+                    next_due = time.monotonic()
+            server.disconnects += 1
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # The pipeline closed the stream
+
+
+def serve(args):
+    clips = [encode_clip(video, args.width, args.height, args.quality, args.clip_frames)[0] for video in args.videos]
+    clips = [frames for frames in clips if frames]
+    if not clips:
+        raise SystemExit("No readable clips to serve")
+    server = SimulatedCameras(("127.0.0.1", args.port), clips, args.cameras, args.fps, args.jitter,
+                              args.disconnect_every)
+    print(f"Serving {args.cameras} cameras on http://127.0.0.1:{args.port}/cam<i>.mjpg "
+          f"({args.width}x{args.height} @ {args.fps} fps)", flush=True)
+    server.serve_forever()
+
+
+def start_simulator(args, cameras):
+    """Run the simulated cameras in their own process, so their CPU does not count against the node."""
+    command = [sys.executable, os.path.abspath(__file__), "serve", "--cameras", str(cameras), "--port", str(args.port),
+               "--fps", str(args.fps), "--width", str(args.width), "--height", str(args.height),
+               "--quality", str(args.quality), "--jitter", str(args.jitter),
+               "--disconnect-every", str(args.disconnect_every), "--clip-frames", str(args.clip_frames),
+               "--videos", *args.videos]
+    proc = subprocess.Popen(command)
+    deadline = time.monotonic() + 120  # Encoding the clips takes a while at high resolutions
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise SystemExit("Camera simulator exited")
+        try:
+            socket.create_connection(("127.0.0.1", args.port), timeout=1).close()
+            return proc
+        except OSError:
+            time.sleep(0.5)
+    proc.kill()
+    raise SystemExit("Camera simulator did not start")
+
+
+# ---- measurement ---------------------------------------------------------
+
+class Usage:
+    """CPU (% of one core) and RSS of this process and its children (psutil), or of this process alone."""
+
+    def __init__(self):
+        try:
+            import psutil
+            self.process = psutil.Process()
+        except ImportError:
+            self.process = None
+        self.scope = "process+children" if self.process is not None else "process"
+        self._cpu = self._wall = None
+
+    def _cpu_seconds(self):
+        if self.process is None:
+            return time.process_time()
+        total = 0.0
+        for proc in [self.process] + self.process.children(recursive=True):
+            try:
+                times = proc.cpu_times()
+                total += times.user + times.system
+            except Exception:
+                pass  # Exited in between
+        return total
+
+    def rss_mb(self):
+        if self.process is not None:
+            procs = [self.process] + self.process.children(recursive=True)
+            return round(sum(p.memory_info().rss for p in procs if p.is_running()) / (1024 * 1024), 1)
+        try:
+            with open("/proc/self/statm") as f:
+                return round(int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024), 1)
+        except (OSError, ValueError, AttributeError):
+            return peak_rss_mb()
+
+    def start(self):
+        self._cpu, self._wall = self._cpu_seconds(), time.monotonic()
+
+    def cpu_percent(self):
+        return round(100 * (self._cpu_seconds() - self._cpu) / max(time.monotonic() - self._wall, 1e-6), 1)
+
+
+def latency_sink():
+    """Alert sink recording frame-to-alert latency in ms (alerts carry their frame's decode time)."""
+    from detection.alerts import AlertSink, CLEARED
+
+    class LatencySink(AlertSink):
+        def __init__(self):
+            self.values = []
+            self.lock = threading.Lock()
+
+        def handle(self, alert):
+            if alert["state"] != CLEARED:
+                with self.lock:
+                    self.values.append((time.time() - alert["timestamp"]) * 1000)
+
+        def take(self):
+            with self.lock:
+                values, self.values = self.values, []
+            return values
+
+    return LatencySink()
+
+
+def camera_counters(manager):
+    """{camera id: (frames processed, frames in, frames dropped, reconnects)} right now."""
+    counters = {}
+    for camera in manager.cameras.values():
+        hub, sub = camera.hub, camera.sub
+        counters[camera.id] = (camera.frames_processed, hub.seq if hub else 0, sub.dropped if sub else 0,
+                               (hub.reconnects if hub else 0) + camera.restarts)
+    return counters
+
+
+def run_step(mix, cameras, args, sink):
+    """Run `cameras` simulated cameras with detector `mix` and measure the steady state."""
+    from detection.pipeline import PipelineManager
+    import settings
+    configs = [{"id": f"sim{i}", "source": f"http://127.0.0.1:{args.port}/cam{i}.mjpg", "detectors": mix,
+                "target_fps": args.target_fps, "record": not args.no_record} for i in range(cameras)]
+    pipeline = settings.CONFIG.get("pipeline", {})
+    manager = PipelineManager(configs, workers=args.workers or pipeline.get("workers", 0), max_cameras=cameras,
+                              detector_options=settings.CONFIG.get("detectors", {}),
+                              mode=args.mode, processes=args.processes or pipeline.get("processes", 0),
+                              ingest=settings.CONFIG.get("ingest", {}))
+    usage = Usage()
+    try:
+        manager.start_all()
+        time.sleep(args.warmup)  # Connect, load models, settle the adaptive controllers
+        before = camera_counters(manager)
+        sink.take()
+        usage.start()
+        time.sleep(args.duration)
+        after = camera_counters(manager)
+        cpu = usage.cpu_percent()
+        rss = usage.rss_mb()
+        latencies = sink.take()
+    finally:
+        manager.shutdown()
+
+    deltas = {cid: [a - b for a, b in zip(after[cid], before[cid])] for cid in after}
+    fps = sorted(d[0] / args.duration for d in deltas.values())
+    frames_in = sum(d[1] for d in deltas.values())
+    dropped = sum(d[2] for d in deltas.values())
+    latency = latency_summary(latencies)
+    result = {
+        "detectors": mix,
+        "cameras": cameras,
+        "target_fps": args.target_fps,
+        "fps_per_camera": {"mean": round(sum(fps) / len(fps), 2), "min": round(fps[0], 2)},
+        "fps_total": round(sum(fps), 2),
+        "alerts": len(latencies),
+        "alert_latency_ms": latency,
+        "cpu_percent": cpu,
+        "cpu_scope": usage.scope,
+        "rss_mb": rss,
+        "frames_in": frames_in,
+        # Frames decoded but never analysed: expected above target_fps, since only the newest frame is kept
+        "frames_dropped": dropped,
+        "shortfall": round(max(0.0, 1 - sum(fps) / (cameras * args.target_fps)), 3),
+        "reconnects": sum(d[3] for d in deltas.values()),
+    }
+    result["sustainable"] = (result["fps_per_camera"]["min"] >= args.min_fps_ratio * args.target_fps
+                             and latency.get("p95", 0) <= args.max_latency_ms)
+    return result
+
+
+# ---- driver --------------------------------------------------------------
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Ramp simulated cameras until the node falls behind")
+    parser.add_argument("command", nargs="?", default="run", choices=["run", "serve"],
+                        help="run the capacity test (default) or only serve simulated cameras")
+    parser.add_argument("--mixes", nargs="*", default=["weapon", "security", "weapon+security"],
+                        help="Detector mixes to test, detectors joined with '+'")
+    parser.add_argument("--ramp", type=int, nargs="*", default=[1, 2, 4, 8, 12, 16, 24, 32, 48],
+                        help="Camera counts to step through (stops at the first unsustainable step)")
+    parser.add_argument("--cameras", type=int, default=8, help="Cameras to serve (serve command)")
+    parser.add_argument("--videos", nargs="*", default=None, help="Clips to loop (default: static/videos/*.mp4)")
+    parser.add_argument("--width", type=int, default=1280)
+    parser.add_argument("--height", type=int, default=720)
+    parser.add_argument("--fps", type=float, default=15, help="Frame rate of every simulated camera")
+    parser.add_argument("--quality", type=int, default=80, help="JPEG quality of the simulated cameras")
+    parser.add_argument("--clip-frames", type=int, default=300, help="Frames per clip kept in the simulator")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Frame interval jitter as a fraction, e.g. 0.3")
+    parser.add_argument("--disconnect-every", type=float, default=0,
+                        help="Drop each connection after this many seconds on average (0 = never)")
+    parser.add_argument("--port", type=int, default=8600)
+    parser.add_argument("--target-fps", type=float, default=5, help="Detection rate every camera should sustain")
+    parser.add_argument("--min-fps-ratio", type=float, default=0.9,
+                        help="Sustainable if the slowest camera reaches this fraction of target_fps")
+    parser.add_argument("--max-latency-ms", type=float, default=1000, help="Sustainable if alert p95 stays below")
+    parser.add_argument("--warmup", type=float, default=10, help="Seconds before measuring each step")
+    parser.add_argument("--duration", type=float, default=30, help="Measured seconds per step")
+    parser.add_argument("--mode", default="threads", choices=["threads", "processes"])
+    parser.add_argument("--workers", type=int, default=0, help="Pipeline worker threads (0 = from config)")
+    parser.add_argument("--processes", type=int, default=0, help="Worker processes in processes mode (0 = from config)")
+    parser.add_argument("--no-record", action="store_true", help="Do not run the clip recorders")
+    parser.add_argument("--output", default="loadtest_results.json", help="JSON report path")
+    args = parser.parse_args(argv)
+    args.videos = args.videos or sorted(glob.glob("static/videos/*.mp4"))
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.command == "serve":
+        return serve(args)
+
+    from detection.alerts import ALERT_DEFAULTS, AlertEngine, set_alert_engine
+    import settings
+    # Only the latency sink: synthetic alerts never reach the events DB, MQTT, the speakers or clips (the
+    # recorders just buffer). No cooldowns, so every alerting frame fires and yields a latency sample.
+    sink = latency_sink()
+    hysteresis = {**ALERT_DEFAULTS, **settings.CONFIG.get("alerts", {})}["hysteresis"]
+    set_alert_engine(AlertEngine(cooldowns={}, default_cooldown=0, hysteresis=hysteresis, clear_after=1.0,
+                                 sinks=[sink]))
+
+    simulator = start_simulator(args, max(args.ramp))
+    results, capacity, overloaded = [], {}, {}
+    try:
+        for mix in (m.split("+") for m in args.mixes):
+            label = "+".join(mix)
+            capacity[label], overloaded[label] = 0, None
+            for cameras in args.ramp:
+                result = run_step(mix, cameras, args, sink)
+                results.append(result)
+                latency = result["alert_latency_ms"]
+                print(f"{label:<20} x{cameras:<3} {result['fps_per_camera']['mean']:>5.1f} fps/cam "
+                      f"(min {result['fps_per_camera']['min']:.1f})  alert p95 {latency.get('p95', 0):>7.1f} ms  "
+                      f"cpu {result['cpu_percent']:>6.1f}%  rss {result['rss_mb']} MB  "
+                      f"{'ok' if result['sustainable'] else 'OVERLOADED'}", flush=True)
+                if not result["sustainable"]:
+                    overloaded[label] = cameras
+                    break
+                capacity[label] = cameras
+    finally:
+        simulator.kill()
+
+    report = {
+        "environment": environment(),
+        "simulator": {"width": args.width, "height": args.height, "fps": args.fps, "jitter": args.jitter,
+                      "disconnect_every": args.disconnect_every},
+        "criteria": {"target_fps": args.target_fps, "min_fps_ratio": args.min_fps_ratio,
+                     "max_latency_ms": args.max_latency_ms},
+        "mode": args.mode,
+        "max_sustainable_cameras": capacity,
+        "overloaded_at": overloaded,  # None: the ramp never overloaded the node, the capacity is higher
+        "steps": results,
+    }
+    output_dir = os.path.dirname(args.output)
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=4)
+    print("Max sustainable cameras: " + ", ".join(
+        f"{mix} {count}" if overloaded[mix] else f"{mix} {count}+ (never overloaded)" for mix, count in capacity.items()))
+    print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,335 @@
+import copy
 import json
+import os
+import threading
+import time
+from collections.abc import Mapping
 
 CONFIG_PATH = "config/config.json"
 
+# Detector options that must be numbers, with their lower bound
+NUMERIC_DETECTOR_OPTIONS = {
+    "conf": 0, "crowd_threshold": 1, "target_latency_ms": 0, "analysis_width": 32, "min_width": 32,
+    "max_skip": 0, "speed_threshold": 0, "min_area": 0, "min_size": 1,
+}
+
+
+# Share of storage_limit that goes to the events database when neither it nor the clips have their own cap
+EVENT_DB_SHARE = 0.1
+
+
+class ConfigError(ValueError):
+    """The configuration failed validation."""
+
+
+def storage_budget(config):
+    """(clip cap in GB, events DB cap in MB), None meaning unlimited.
+
+    Clips (recording.max_storage_gb) and the events database
+    (event_store.max_size_mb) share one storage_limit: an explicit cap
+    counts against it and the other store gets the rest. With neither set
+    the database gets EVENT_DB_SHARE of it.
+    """
+    clips_gb = config.get("recording", {}).get("max_storage_gb")
+    db_mb = config.get("event_store", {}).get("max_size_mb")
+    limit = config.get("storage_limit")
+    if limit in (None, ""):
+        return clips_gb, db_mb
+    limit_gb = float(limit)
+    if clips_gb is None and db_mb is None:
+        db_mb = limit_gb * EVENT_DB_SHARE * 1024
+    if clips_gb is None:
+        clips_gb = limit_gb - db_mb / 1024
+    elif db_mb is None:
+        db_mb = (limit_gb - clips_gb) * 1024
+    return clips_gb, db_mb
+
+
+def _is_point(point):
+    """[x, y] with coordinates as fractions of the frame size."""
+    return isinstance(point, list) and len(point) == 2 and all(
+        isinstance(v, (int, float)) and 0 <= v <= 1 for v in point)
+
+
+def _is_polygon(points):
+    """[[x, y], ...] with at least 3 points, coordinates as fractions of the frame size."""
+    return isinstance(points, list) and len(points) >= 3 and all(_is_point(p) for p in points)
+
+
+def _ingest_errors(label, options):
+    """Problems with a stream "ingest" block (see detection.frame_hub.INGEST_DEFAULTS)."""
+    if not isinstance(options, dict):
+        return [f"{label} must be an object"]
+    errors = []
+    for key in ("open_timeout", "read_timeout", "max_backoff"):
+        value = options.get(key)
+        if value is not None and (not isinstance(value, (int, float)) or value <= 0):
+            errors.append(f"{label}.{key} must be a positive number of seconds")
+    for key in ("buffer_size", "threads"):
+        value = options.get(key)
+        if value is not None and (not isinstance(value, int) or value < 0):
+            errors.append(f"{label}.{key} must be a whole number >= 0")
+    if options.get("rtsp_transport", "tcp") not in ("tcp", "udp"):
+        errors.append(f"{label}.rtsp_transport must be 'tcp' or 'udp'")
+    if options.get("hw_acceleration", "none") not in ("none", "any"):
+        errors.append(f"{label}.hw_acceleration must be 'none' or 'any'")
+    return errors
+
+
+def validate(config):
+    """Raise ConfigError listing every problem in `config`."""
+    if not isinstance(config, dict):
+        raise ConfigError("config must be a JSON object")
+    errors = []
+
+    if config.get("detection_mode", "live") not in ("live", "stored"):
+        errors.append("detection_mode must be 'live' or 'stored'")
+    if config.get("pipeline", {}).get("mode", "threads") not in ("threads", "processes"):
+        errors.append("pipeline.mode must be 'threads' or 'processes'")
+    errors += _ingest_errors("ingest", config.get("ingest", {}))
+    batch = config.get("batch", {})
+    for key in ("workers", "chunk_seconds", "sample_fps", "warmup", "merge_gap"):
+        value = batch.get(key)
+        if value is not None and (not isinstance(value, (int, float)) or value < 0):
+            errors.append(f"batch.{key} must be a number >= 0")
+    if batch.get("chunk_seconds") == 0:
+        errors.append("batch.chunk_seconds must be positive")
+    port = config.get("MQTT_PORT", 1883)
+    if not isinstance(port, int) or not 0 < port < 65536:
+        errors.append("MQTT_PORT must be a port number")
+    storage_limit = config.get("storage_limit")
+    if storage_limit not in (None, ""):
+        try:
+            if float(storage_limit) <= 0:
+                raise ValueError
+        except (TypeError, ValueError):
+            errors.append("storage_limit must be a positive number")
+            storage_limit = None
+    clips_gb = config.get("recording", {}).get("max_storage_gb")
+    db_mb = config.get("event_store", {}).get("max_size_mb")
+    for label, value in (("recording.max_storage_gb", clips_gb), ("event_store.max_size_mb", db_mb)):
+        if value is not None and (not isinstance(value, (int, float)) or value <= 0):
+            errors.append(f"{label} must be a positive number")
+            storage_limit = None
+    if storage_limit not in (None, "") and (clips_gb is not None or db_mb is not None):
+        # Explicit caps share storage_limit; one alone must leave room for the other store
+        used_gb = (clips_gb or 0) + (db_mb or 0) / 1024
+        if used_gb > float(storage_limit) or (used_gb == float(storage_limit) and None in (clips_gb, db_mb)):
+            errors.append("recording.max_storage_gb plus event_store.max_size_mb must fit in storage_limit")
+
+    cameras = config.get("cameras", [])
+    if not isinstance(cameras, list):
+        errors.append("cameras must be a list")
+        cameras = []
+    seen = set()
+    for i, camera in enumerate(cameras):
+        if not isinstance(camera, dict) or "id" not in camera or "source" not in camera:
+            errors.append(f"cameras[{i}] needs an id and a source")
+            continue
+        if camera["id"] in seen:
+            errors.append(f"duplicate camera id {camera['id']}")
+        seen.add(camera["id"])
+        target_fps = camera.get("target_fps", 5)
+        if not isinstance(target_fps, (int, float)) or target_fps <= 0:
+            errors.append(f"camera {camera['id']}: target_fps must be positive")
+        errors += _ingest_errors(f"camera {camera['id']}: ingest", camera.get("ingest", {}))
+        polygons = [("roi", polygon) for polygon in camera.get("roi", [])]
+        for zone in camera.get("zones", []):
+            if not isinstance(zone, dict) or "name" not in zone:
+                errors.append(f"camera {camera['id']}: every zone needs a name and a polygon")
+                continue
+            polygons.append((f"zone {zone['name']}", zone.get("polygon")))
+        for label, polygon in polygons:
+            if not _is_polygon(polygon):
+                errors.append(f"camera {camera['id']}: {label} must be 3+ [x, y] points between 0 and 1")
+
+    detectors = config.get("detectors", {})
+    if not isinstance(detectors, dict):
+        errors.append("detectors must be an object")
+        detectors = {}
+    for name, options in detectors.items():
+        if not isinstance(options, dict):
+            errors.append(f"detectors.{name} must be an object")
+            continue
+        for key, minimum in NUMERIC_DETECTOR_OPTIONS.items():
+            value = options.get(key)
+            if value is not None and (not isinstance(value, (int, float)) or value < minimum):
+                errors.append(f"detectors.{name}.{key} must be a number >= {minimum}")
+        conf = options.get("conf", 0)
+        if isinstance(conf, (int, float)) and not 0 <= conf <= 1:
+            errors.append(f"detectors.{name}.conf must be between 0 and 1")
+        windows = options.get("count_windows", [])
+        if not isinstance(windows, list) or not all(isinstance(w, (int, float)) and w > 0 for w in windows):
+            errors.append(f"detectors.{name}.count_windows must be a list of positive seconds")
+        line = options.get("count_line")
+        if line is not None and not (isinstance(line, list) and len(line) == 2 and all(_is_point(p) for p in line)):
+            errors.append(f"detectors.{name}.count_line must be [[x1, y1], [x2, y2]] between 0 and 1")
+
+    if errors:
+        raise ConfigError("; ".join(errors))
+    return config
+
+
+class ConfigService:
+    """The one in-memory copy of config/config.json.
+
+    `get()` returns the current config (treat it as read-only). Edits go
+    through `update(fn)`, which reads, modifies, validates and writes under
+    one lock so concurrent edits are never lost. Writes go to a temp file
+    renamed over the original, so readers never see half a file.
+    `watch()` polls the file's mtime and reloads edits made by hand. Every
+    accepted change bumps `version` and calls the subscribers with
+    (new_config, old_config).
+    """
+
+    def __init__(self, path=CONFIG_PATH):
+        self.path = path
+        self.version = 0
+        self._data = {}
+        self._mtime = None
+        self._subscribers = []
+        self._lock = threading.RLock()
+        self._watcher = None
+        self.reload(force=True)
+
+    def get(self):
+        return self._data
+
+    def snapshot(self):
+        with self._lock:
+            return copy.deepcopy(self._data)
+
+    def save(self, config):
+        """Validate and atomically replace the config file, then notify subscribers."""
+        validate(config)
+        with self._lock:
+            old = self._write(config)
+        self._notify(old)
+
+    def update(self, fn):
+        """Apply `fn` to a copy of the latest config and save it, all under the lock. Returns the new config.
+
+        `fn` edits the copy in place. Hand edits the watcher has not picked up
+        yet are read from disk first, so they are not overwritten either.
+        Raises ConfigError (and saves nothing) if the result is invalid.
+        """
+        with self._lock:
+            config = copy.deepcopy(self._on_disk())
+            fn(config)
+            validate(config)
+            old = self._write(config)
+        self._notify(old)
+        return config
+
+    def _on_disk(self):
+        """The file's config if it changed since the last load or save (and is valid), else the current one."""
+        try:
+            if os.stat(self.path).st_mtime_ns != self._mtime:
+                with open(self.path, "r") as f:
+                    return validate(json.load(f))
+        except (ValueError, OSError):
+            pass
+        return self._data
+
+    def _write(self, config):
+        """Atomically replace the file and the in-memory copy (lock held). Returns the previous config."""
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(config, f, indent=4)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+        self._mtime = os.stat(self.path).st_mtime_ns
+        old = self._data
+        self._data = copy.deepcopy(config)
+        self.version += 1
+        return old
+
+    def reload(self, force=False):
+        """Re-read the file if it changed on disk. Returns True if a new version was loaded.
+
+        An invalid file is reported and ignored (the last good config stays),
+        except on the first load.
+        """
+        with self._lock:
+            try:
+                mtime = os.stat(self.path).st_mtime_ns
+            except OSError as e:
+                if force:
+                    raise
+                print(f"⚠ Config {self.path} unavailable: {e}")
+                return False
+            if mtime == self._mtime and not force:
+                return False
+            self._mtime = mtime
+            try:
+                with open(self.path, "r") as f:
+                    config = validate(json.load(f))
+            except (ValueError, OSError) as e:
+                if force and not self._data:
+                    raise
+                print(f"⚠ Ignoring invalid config {self.path}: {e}")
+                return False
+            if config == self._data:
+                return False
+            old = self._data
+            self._data = config
+            self.version += 1
+        self._notify(old)
+        return True
+
+    def subscribe(self, callback):
+        """Call `callback(new_config, old_config)` after every change. Returns an unsubscribe function."""
+        with self._lock:
+            self._subscribers.append(callback)
+        return lambda: self._subscribers.remove(callback)
+
+    def watch(self, interval=2.0):
+        """Poll the file for external edits from a daemon thread (idempotent)."""
+        with self._lock:
+            if self._watcher is not None:
+                return
+
+            def run():
+                while True:
+                    time.sleep(interval)
+                    self.reload()
+
+            self._watcher = threading.Thread(target=run, name="config-watch", daemon=True)
+            self._watcher.start()
+
+    def _notify(self, old):
+        for callback in list(self._subscribers):
+            try:
+                callback(self._data, old)
+            except Exception as e:
+                print(f"⚠ Config subscriber failed: {e}")
+
+
+class LiveConfig(Mapping):
+    """Read-only mapping that always reflects the service's current version."""
+
+    def __init__(self, service):
+        self._service = service
+
+    def __getitem__(self, key):
+        return self._service.get()[key]
+
+    def __iter__(self):
+        return iter(self._service.get())
+
+    def __len__(self):
+        return len(self._service.get())
+
+
+# ✅ Shared config service, loaded once at startup and kept current by watch()
+config_service = ConfigService()
+CONFIG = LiveConfig(config_service)
+
 def load_config():
-    """Loads the configuration from JSON file"""
-    with open(CONFIG_PATH, "r") as f:
-        return json.load(f)
+    """Editable copy of the current configuration"""
+    return config_service.snapshot()
 
 def save_config(data):
-    """Saves new configuration to JSON file"""
-    with open(CONFIG_PATH, "w") as f:
-        json.dump(data, f, indent=4)
-
-# ✅ Load configuration once at startup
-CONFIG = load_config()
+    """Validates and atomically saves new configuration"""
+    config_service.save(data)